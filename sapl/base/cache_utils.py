@@ -0,0 +1,143 @@
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+
+from sapl.sessao.models import ExpedienteMateria, OrdemDia, SessaoPlenaria
+
+
+# Tempo de vida, em segundos, das versões e snapshots do painel no cache
+PAINEL_CACHE_TIMEOUT = 60 * 60 * 12
+
+# Tempo de vida, em segundos, das versões e snapshots da pauta no cache
+PAUTA_CACHE_TIMEOUT = 60 * 60 * 12
+
+
+def get_versao(chave, timeout):
+    """
+    Retorna a versão guardada em chave, um identificador opaco trocado
+    por publica_versao sempre que o conteúdo versionado muda.
+    """
+    versao = cache.get(chave)
+    if versao is None:
+        cache.add(chave, uuid.uuid4().hex, timeout)
+        versao = cache.get(chave)
+    return versao
+
+
+def publica_versao(chave, timeout):
+    cache.set(chave, uuid.uuid4().hex, timeout)
+
+
+def get_snapshot(chave, monta, timeout):
+    """
+    Retorna o snapshot guardado em chave, montando-o com monta() quando
+    ainda não existe. Apenas uma requisição monta cada snapshot; as demais
+    aguardam o resultado no cache enquanto a trava existir.
+    """
+    dados = cache.get(chave)
+    if dados is not None:
+        return dados
+
+    if not cache.add(chave + ':lock', True, 10):
+        for _i in range(20):
+            time.sleep(0.1)
+            dados = cache.get(chave)
+            if dados is not None:
+                return dados
+
+    try:
+        dados = monta()
+        cache.set(chave, dados, timeout)
+    finally:
+        cache.delete(chave + ':lock')
+    return dados
+
+
+def chave_versao_painel(pk):
+    return 'painel:{}:versao'.format(pk)
+
+
+def chave_snapshot_painel(pk, versao):
+    return 'painel:{}:snapshot:{}'.format(pk, versao)
+
+
+def get_versao_painel(pk):
+    """
+    Retorna a versão atual do estado do painel da Sessão Plenária.
+    A versão é trocada por publica_painel sempre que votos, presenças,
+    matéria aberta ou a própria sessão mudam.
+    """
+    return get_versao(chave_versao_painel(pk), PAINEL_CACHE_TIMEOUT)
+
+
+def publica_painel(pk):
+    """
+    Sinaliza que o estado do painel da Sessão Plenária mudou. O novo
+    snapshot é calculado uma única vez, pela primeira tela que pedir
+    a nova versão.
+    """
+    publica_versao(chave_versao_painel(pk), PAINEL_CACHE_TIMEOUT)
+
+
+def chave_versao_pauta(pk):
+    return 'pauta:{}:versao'.format(pk)
+
+
+def chave_snapshot_pauta(pk, versao):
+    return 'pauta:{}:snapshot:{}'.format(pk, versao)
+
+
+def get_versao_pauta(pk):
+    """
+    Retorna a versão atual da pauta da Sessão Plenária. A versão é trocada
+    por publica_pauta sempre que os itens da pauta, suas votações ou as
+    matérias neles mudam.
+    """
+    return get_versao(chave_versao_pauta(pk), PAUTA_CACHE_TIMEOUT)
+
+
+def publica_pauta(pk):
+    """
+    Sinaliza que a pauta da Sessão Plenária mudou. A nova pauta é montada
+    uma única vez, pela primeira requisição que pedir a nova versão.
+    """
+    publica_versao(chave_versao_pauta(pk), PAUTA_CACHE_TIMEOUT)
+
+
+def publica_pautas_materias(materias):
+    """
+    Publica novamente as pautas das sessões que têm alguma das matérias
+    no expediente ou na ordem do dia.
+    """
+    sessoes = set(ExpedienteMateria.objects.filter(
+        materia_id__in=materias).values_list('sessao_plenaria_id', flat=True))
+    sessoes.update(OrdemDia.objects.filter(
+        materia_id__in=materias).values_list('sessao_plenaria_id', flat=True))
+    for pk in sessoes:
+        publica_pauta(pk)
+
+
+def get_sessao_plenaria_id(instance):
+    """
+    Sessão Plenária a que pertence instance, seguindo ordem, expediente ou
+    votação quando o objeto não aponta diretamente para a sessão.
+    """
+    if isinstance(instance, SessaoPlenaria):
+        return instance.pk
+
+    sessao_plenaria_id = getattr(instance, 'sessao_plenaria_id', None)
+    if sessao_plenaria_id:
+        return sessao_plenaria_id
+
+    for campo in ('ordem', 'expediente', 'votacao'):
+        try:
+            relacionado = getattr(instance, campo, None)
+        except ObjectDoesNotExist:
+            # o objeto relacionado pode ter sido apagado em cascata
+            continue
+        if relacionado:
+            return get_sessao_plenaria_id(relacionado)
+
+    return None
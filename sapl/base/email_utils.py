@@ -1,14 +1,17 @@
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 import logging
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.template import Context, loader
 from django.utils import timezone
 
-from sapl.base.models import CasaLegislativa
-from sapl.materia.models import AcompanhamentoMateria
-from sapl.protocoloadm.models import AcompanhamentoDocumento
+from sapl.base.models import CasaLegislativa, EmailTramitacaoPendente
+from sapl.materia.models import AcompanhamentoMateria, MateriaLegislativa
+from sapl.protocoloadm.models import (AcompanhamentoDocumento,
+                                      DocumentoAdministrativo)
 from sapl.settings import EMAIL_SEND_USER
 from sapl.utils import mail_service_configured
 from django.utils.translation import ugettext_lazy as _
@@ -265,3 +268,178 @@ def do_envia_email_tramitacao(base_url, tipo, doc_mat, status, unidade_destino):
                 'Erro ao enviar e-mail de acompanhamento de matéria.')
 
     connection.close()
+
+
+def do_envia_email_tramitacao_em_lote(base_url, tipo, tramitacoes):
+    #
+    # Envia, em uma única conexão, os emails de várias tramitações para os
+    # usuários cadastrados, buscando os destinatários com uma só consulta
+    #
+
+    logger = logging.getLogger(__name__)
+    if not mail_service_configured():
+        logger.warning(_('Servidor de email não configurado.'))
+        return
+
+    if tipo == "materia":
+        doc_mats = MateriaLegislativa.objects.in_bulk(
+            {t.materia_id for t in tramitacoes})
+        destinatarios = AcompanhamentoMateria.objects.filter(
+            materia_id__in=doc_mats.keys(), confirmado=True).values_list(
+            'materia_id', 'email', 'hash')
+        msg = " - Acompanhamento de Matéria Legislativa"
+    else:
+        doc_mats = DocumentoAdministrativo.objects.in_bulk(
+            {t.documento_id for t in tramitacoes})
+        destinatarios = AcompanhamentoDocumento.objects.filter(
+            documento_id__in=doc_mats.keys(), confirmado=True).values_list(
+            'documento_id', 'email', 'hash')
+        msg = " - Acompanhamento de Documento"
+
+    tramitacoes = {t.materia_id if tipo == "materia" else t.documento_id: t
+                   for t in tramitacoes}
+
+    casa = CasaLegislativa.objects.first()
+    sender = EMAIL_SEND_USER
+
+    emails = []
+    for doc_mat_id, email, hash_txt in destinatarios:
+        doc_mat = doc_mats[doc_mat_id]
+        tramitacao = tramitacoes[doc_mat_id]
+        email_texts = criar_email_tramitacao(base_url,
+                                             casa,
+                                             tipo,
+                                             doc_mat,
+                                             tramitacao.status,
+                                             tramitacao.unidade_tramitacao_destino,
+                                             hash_txt)
+
+        mensagem = EmailMultiAlternatives(
+            "[SAPL] {} {}".format(str(doc_mat), msg),
+            email_texts[0],
+            sender,
+            [email])
+        mensagem.attach_alternative(email_texts[1], "text/html")
+        emails.append(mensagem)
+
+    if not emails:
+        logger.debug(_('Não existem destinatários cadastrados para essas '
+                       'tramitações.'))
+        return
+
+    connection = get_connection()
+    try:
+        connection.send_messages(emails)
+    except Exception:
+        raise Exception(
+            'Erro ao enviar e-mails de acompanhamento de tramitação.')
+    finally:
+        connection.close()
+
+
+def enfileira_email_tramitacao_em_lote(base_url, tipo, tramitacoes):
+    #
+    # Grava na fila EmailTramitacaoPendente, na transação corrente, as
+    # tramitações em lote cujas matérias/documentos têm destinatários
+    # confirmados. O envio é feito pelo comando processa_fila_email, fora
+    # da requisição e com novas tentativas em caso de falha
+    #
+
+    if not mail_service_configured():
+        return
+
+    if tipo == "materia":
+        acompanhados = set(AcompanhamentoMateria.objects.filter(
+            materia_id__in={t.materia_id for t in tramitacoes},
+            confirmado=True).values_list('materia_id', flat=True))
+        tramitacoes = [t for t in tramitacoes
+                       if t.materia_id in acompanhados]
+    else:
+        acompanhados = set(AcompanhamentoDocumento.objects.filter(
+            documento_id__in={t.documento_id for t in tramitacoes},
+            confirmado=True).values_list('documento_id', flat=True))
+        tramitacoes = [t for t in tramitacoes
+                       if t.documento_id in acompanhados]
+
+    if not tramitacoes:
+        return
+
+    content_type = ContentType.objects.get_for_model(tramitacoes[0])
+    EmailTramitacaoPendente.objects.bulk_create([
+        EmailTramitacaoPendente(content_type=content_type,
+                                object_id=t.pk,
+                                base_url=base_url)
+        for t in tramitacoes], batch_size=500)
+
+
+def backoff_email(tentativas):
+    # 1, 2, 4, 8... minutos, limitado a 6 horas
+    return timedelta(minutes=min(2 ** tentativas, 6 * 60))
+
+
+def reserva_emails_pendentes(batch_size, max_tentativas, reserva):
+    """
+    Reserva um lote de e-mails vencidos, adiando sua próxima tentativa para
+    depois do tempo de reserva, de modo que vários workers possam consumir
+    a fila sem enviar o mesmo e-mail.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        lote = list(EmailTramitacaoPendente.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            proxima_tentativa__lte=agora,
+            tentativas__lt=max_tentativas
+        ).order_by('proxima_tentativa', 'id')[:batch_size])
+
+        EmailTramitacaoPendente.objects.filter(
+            id__in=[p.id for p in lote]
+        ).update(proxima_tentativa=agora + reserva)
+
+    return lote
+
+
+def processa_emails_pendentes(batch_size=100, max_tentativas=10,
+                              reserva=timedelta(minutes=30)):
+    """
+    Envia um lote da fila EmailTramitacaoPendente, agrupado por tipo de
+    tramitação e URL base, com uma conexão SMTP por grupo. Os grupos
+    enviados saem da fila; os que falham são reagendados com backoff
+    exponencial.
+
+    :return: quantidade de itens retirados da fila.
+    """
+    logger = logging.getLogger(__name__)
+
+    pendentes = reserva_emails_pendentes(batch_size, max_tentativas, reserva)
+    if not pendentes:
+        return 0
+
+    grupos = {}
+    for p in pendentes:
+        grupos.setdefault((p.content_type_id, p.base_url), []).append(p)
+
+    for (content_type_id, base_url), itens in grupos.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        tipo = "materia" if model._meta.app_label == "materia" \
+            else "documento"
+        # tramitações apagadas desde o enfileiramento são descartadas
+        tramitacoes = model.objects.select_related(
+            'status', 'unidade_tramitacao_destino'
+        ).order_by('id').filter(id__in=[p.object_id for p in itens])
+
+        try:
+            do_envia_email_tramitacao_em_lote(base_url, tipo, tramitacoes)
+        except Exception as e:
+            logger.error('Erro enviando e-mails de tramitação: {}'.format(e))
+            for p in itens:
+                EmailTramitacaoPendente.objects.filter(id=p.id).update(
+                    tentativas=p.tentativas + 1,
+                    proxima_tentativa=timezone.now() + backoff_email(
+                        p.tentativas),
+                    erro=str(e))
+        else:
+            EmailTramitacaoPendente.objects.filter(
+                id__in=[p.id for p in itens]).delete()
+
+    return len(pendentes)
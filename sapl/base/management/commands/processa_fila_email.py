@@ -0,0 +1,68 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from sapl.base.email_utils import processa_emails_pendentes
+
+
+class Command(BaseCommand):
+
+    help = ('Envia os e-mails de acompanhamento das tramitações em lote '
+            '(EmailTramitacaoPendente)')
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            dest='batch_size',
+            help='Quantidade de tramitações processadas por lote',
+        )
+        parser.add_argument(
+            '--max-tentativas',
+            type=int,
+            default=10,
+            dest='max_tentativas',
+            help='Tentativas antes de desistir de enviar um e-mail',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            default=False,
+            dest='loop',
+            help='Permanece em execução aguardando novos itens na fila',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=10,
+            dest='intervalo',
+            help='Segundos de espera quando a fila está vazia (com --loop)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                processados = processa_emails_pendentes(
+                    batch_size=options['batch_size'],
+                    max_tentativas=options['max_tentativas'])
+            except Exception as e:
+                # uma indisponibilidade do banco não deve encerrar o
+                # worker que roda em segundo plano
+                if not options['loop']:
+                    raise
+                self.logger.exception(
+                    'Erro processando a fila de e-mails: {}'.format(e))
+                time.sleep(options['intervalo'])
+                continue
+
+            if processados:
+                self.stdout.write(
+                    '{} itens da fila de e-mails processados'.format(
+                        processados))
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['intervalo'])
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from haystack import connections
+
+from sapl.base.search_indexes import (DocumentoAcessorioIndex,
+                                      MateriaLegislativaIndex,
+                                      NormaJuridicaIndex, get_rotulo_indice,
+                                      reindexa_incremental)
+
+
+class Command(BaseCommand):
+
+    help = ('Reindexa no Solr, em paralelo, as matérias, normas e '
+            'documentos acessórios alterados desde a última execução')
+
+    indices = (MateriaLegislativaIndex,
+               NormaJuridicaIndex,
+               DocumentoAcessorioIndex)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            dest='workers',
+            help='Quantidade de processos (padrão: número de CPUs)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            dest='batch_size',
+            help='Quantidade de objetos enviados ao Solr por lote',
+        )
+        parser.add_argument(
+            '--commit-a-cada',
+            type=int,
+            default=10,
+            dest='commit_a_cada',
+            help='Quantidade de lotes entre commits no Solr',
+        )
+        parser.add_argument(
+            '--do-zero',
+            action='store_true',
+            default=False,
+            dest='do_zero',
+            help='Ignora o ponto de parada e reindexa todos os objetos',
+        )
+        parser.add_argument(
+            '--indice',
+            action='append',
+            dest='indices',
+            help='Reindexa apenas o índice informado '
+                 '(ex.: materia.materialegislativa)',
+        )
+
+    def handle(self, *args, **options):
+        unified_index = connections['default'].get_unified_index()
+
+        for index_class in self.indices:
+            index = unified_index.get_index(index_class.model)
+            rotulo = get_rotulo_indice(index)
+            if options['indices'] and rotulo not in options['indices']:
+                continue
+
+            total = reindexa_incremental(
+                index,
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                commit_a_cada=options['commit_a_cada'],
+                do_zero=options['do_zero'],
+                log=self.stdout.write)
+
+            self.stdout.write('{}: {} objetos reindexados'.format(
+                rotulo, total))
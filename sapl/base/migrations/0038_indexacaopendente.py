@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('base', '0037_auto_20190527_0901'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexacaoPendente',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('identificador', models.CharField(max_length=100, verbose_name='Identificador no índice')),
+                ('acao', models.CharField(choices=[('U', 'Atualizar'), ('D', 'Remover')], default='U', max_length=1, verbose_name='Ação')),
+                ('tentativas', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('proxima_tentativa', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('erro', models.TextField(blank=True, verbose_name='Último erro')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de criação')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+            options={
+                'verbose_name': 'Indexação Pendente',
+                'verbose_name_plural': 'Indexações Pendentes',
+                'ordering': ('proxima_tentativa', 'id'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='indexacaopendente',
+            unique_together=set([('content_type', 'object_id')]),
+        ),
+    ]
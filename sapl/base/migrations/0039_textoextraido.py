@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0038_indexacaopendente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextoExtraido',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash_arquivo', models.CharField(max_length=32, unique=True, verbose_name='Hash do arquivo')),
+                ('texto', models.TextField(blank=True, verbose_name='Texto extraído')),
+                ('data_extracao', models.DateTimeField(auto_now_add=True, verbose_name='Data da extração')),
+            ],
+            options={
+                'verbose_name': 'Texto Extraído',
+                'verbose_name_plural': 'Textos Extraídos',
+            },
+        ),
+    ]
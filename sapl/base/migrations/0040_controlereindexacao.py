@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0039_textoextraido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ControleReindexacao',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indice', models.CharField(max_length=100, unique=True, verbose_name='Índice')),
+                ('data_ultima_atualizacao', models.DateTimeField(blank=True, null=True, verbose_name='Data de atualização do último objeto indexado')),
+                ('ultimo_id', models.PositiveIntegerField(default=0, verbose_name='Id do último objeto indexado')),
+                ('data_execucao', models.DateTimeField(auto_now=True, verbose_name='Data da última execução')),
+            ],
+            options={
+                'verbose_name': 'Controle de Reindexação',
+                'verbose_name_plural': 'Controles de Reindexação',
+            },
+        ),
+    ]
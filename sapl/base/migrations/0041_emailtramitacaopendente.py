@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('base', '0040_controlereindexacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailTramitacaoPendente',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('base_url', models.CharField(max_length=200, verbose_name='URL base')),
+                ('tentativas', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('proxima_tentativa', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Próxima tentativa')),
+                ('erro', models.TextField(blank=True, verbose_name='Último erro')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de criação')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+            options={
+                'verbose_name': 'E-mail de Tramitação Pendente',
+                'verbose_name_plural': 'E-mails de Tramitação Pendentes',
+                'ordering': ('proxima_tentativa', 'id'),
+            },
+        ),
+    ]
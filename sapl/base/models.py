@@ -3,7 +3,9 @@ from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models.signals import post_migrate
 from django.db.utils import DEFAULT_DB_ALIAS
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
+from model_utils import Choices
 import reversion
 
 from sapl.utils import (LISTA_DE_UFS, YES_NO_CHOICES,
@@ -271,6 +273,115 @@ class Autor(models.Model):
         return '?'
 
 
+class IndexacaoPendente(models.Model):
+    """
+    Fila de objetos a serem (re)indexados ou removidos do Solr, alimentada
+    por FilaIndexacaoSignalProcessor e consumida pelo comando
+    processa_fila_indexacao.
+    """
+    ACAO_CHOICES = Choices(('U', 'atualizar', _('Atualizar')),
+                           ('D', 'remover', _('Remover')))
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    identificador = models.CharField(
+        max_length=100, verbose_name=_('Identificador no índice'))
+    acao = models.CharField(max_length=1, choices=ACAO_CHOICES,
+                            default=ACAO_CHOICES.atualizar,
+                            verbose_name=_('Ação'))
+    tentativas = models.PositiveIntegerField(
+        default=0, verbose_name=_('Tentativas'))
+    proxima_tentativa = models.DateTimeField(
+        default=timezone.now, db_index=True,
+        verbose_name=_('Próxima tentativa'))
+    erro = models.TextField(blank=True, verbose_name=_('Último erro'))
+    data_criacao = models.DateTimeField(
+        auto_now_add=True, verbose_name=_('Data de criação'))
+
+    class Meta:
+        verbose_name = _('Indexação Pendente')
+        verbose_name_plural = _('Indexações Pendentes')
+        unique_together = (('content_type', 'object_id'), )
+        ordering = ('proxima_tentativa', 'id')
+
+    def __str__(self):
+        return '{} ({})'.format(self.identificador, self.get_acao_display())
+
+
+class TextoExtraido(models.Model):
+    """
+    Texto extraído de arquivos pelo Solr Cell, indexado pelo hash do
+    conteúdo do arquivo. Evita que update_index/rebuild_index reenviem
+    ao Solr arquivos que não mudaram.
+    """
+    hash_arquivo = models.CharField(
+        max_length=32, unique=True, verbose_name=_('Hash do arquivo'))
+    texto = models.TextField(blank=True, verbose_name=_('Texto extraído'))
+    data_extracao = models.DateTimeField(
+        auto_now_add=True, verbose_name=_('Data da extração'))
+
+    class Meta:
+        verbose_name = _('Texto Extraído')
+        verbose_name_plural = _('Textos Extraídos')
+
+    def __str__(self):
+        return self.hash_arquivo
+
+
+class ControleReindexacao(models.Model):
+    """
+    Ponto de parada da reindexação incremental de um índice do Solr: o
+    último par (data de atualização, id) cujo lote já foi confirmado
+    (commit) no Solr. Permite retomar o comando reindexa_solr após uma
+    interrupção sem reprocessar o que já foi indexado.
+    """
+    indice = models.CharField(
+        max_length=100, unique=True, verbose_name=_('Índice'))
+    data_ultima_atualizacao = models.DateTimeField(
+        blank=True, null=True,
+        verbose_name=_('Data de atualização do último objeto indexado'))
+    ultimo_id = models.PositiveIntegerField(
+        default=0, verbose_name=_('Id do último objeto indexado'))
+    data_execucao = models.DateTimeField(
+        auto_now=True, verbose_name=_('Data da última execução'))
+
+    class Meta:
+        verbose_name = _('Controle de Reindexação')
+        verbose_name_plural = _('Controles de Reindexação')
+
+    def __str__(self):
+        return self.indice
+
+
+
+class EmailTramitacaoPendente(models.Model):
+    """
+    Fila dos e-mails de acompanhamento das tramitações feitas em lote,
+    gravada na mesma transação das tramitações e consumida pelo comando
+    processa_fila_email.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    tramitacao = GenericForeignKey('content_type', 'object_id')
+    base_url = models.CharField(max_length=200, verbose_name=_('URL base'))
+    tentativas = models.PositiveIntegerField(
+        default=0, verbose_name=_('Tentativas'))
+    proxima_tentativa = models.DateTimeField(
+        default=timezone.now, db_index=True,
+        verbose_name=_('Próxima tentativa'))
+    erro = models.TextField(blank=True, verbose_name=_('Último erro'))
+    data_criacao = models.DateTimeField(
+        auto_now_add=True, verbose_name=_('Data de criação'))
+
+    class Meta:
+        verbose_name = _('E-mail de Tramitação Pendente')
+        verbose_name_plural = _('E-mails de Tramitação Pendentes')
+        ordering = ('proxima_tentativa', 'id')
+
+    def __str__(self):
+        return '{} {}'.format(self.content_type, self.object_id)
+
+
 def cria_models_tipo_autor(app_config=None, verbosity=2, interactive=True,
                            using=DEFAULT_DB_ALIAS, **kwargs):
 
@@ -1,8 +1,9 @@
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from sapl.materia.models import Tramitacao
-from sapl.protocoloadm.models import TramitacaoAdministrativo
+from sapl.materia.models import Tramitacao, atualiza_ultima_tramitacao
+from sapl.protocoloadm.models import (TramitacaoAdministrativo,
+                                      atualiza_ultima_tramitacao_adm)
 from sapl.base.signals import tramitacao_signal
 from sapl.utils import get_base_url
 
@@ -40,3 +41,15 @@ def status_tramitacao_materia(sender, instance, **kwargs):
             documento = instance.documento
             documento.tramitacao = True
             documento.save()
+
+
+@receiver(post_save, sender=Tramitacao)
+@receiver(post_delete, sender=Tramitacao)
+def ultima_tramitacao_materia(sender, instance, **kwargs):
+    atualiza_ultima_tramitacao([instance.materia_id])
+
+
+@receiver(post_save, sender=TramitacaoAdministrativo)
+@receiver(post_delete, sender=TramitacaoAdministrativo)
+def ultima_tramitacao_documento(sender, instance, **kwargs):
+    atualiza_ultima_tramitacao_adm([instance.documento_id])
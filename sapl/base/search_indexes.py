@@ -1,22 +1,34 @@
+from datetime import timedelta
+import multiprocessing
 import os.path
 import logging
 
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections as db_connections
+from django.db import models, transaction
 from django.db.models import F, Q, Value
 from django.db.models.fields import TextField
 from django.db.models.functions import Concat
 from django.template import loader
+from django.utils import timezone
 from haystack import connections
 from haystack.constants import Indexable
+from haystack.exceptions import NotHandled
 from haystack.fields import CharField
 from haystack.indexes import SearchIndex
-from haystack.utils import get_model_ct_tuple
+from haystack.signals import BaseSignalProcessor
+from haystack.utils import get_identifier, get_model_ct_tuple
 
+from sapl.base.models import (ControleReindexacao, IndexacaoPendente,
+                              TextoExtraido)
 from sapl.compilacao.models import (STATUS_TA_IMMUTABLE_PUBLIC,
-                                    STATUS_TA_PUBLIC, Dispositivo)
+                                    STATUS_TA_PUBLIC, Dispositivo,
+                                    TextoArticulado)
 from sapl.materia.models import DocumentoAcessorio, MateriaLegislativa
 from sapl.norma.models import NormaJuridica
 from sapl.settings import SOLR_URL
-from sapl.utils import RemoveTag
+from sapl.utils import RemoveTag, hash_conteudo_arquivo
 
 
 class TextExtractField(CharField):
@@ -32,19 +44,25 @@ class TextExtractField(CharField):
             self.model_attr = (self.model_attr, )
 
     def solr_extraction(self, arquivo):
+        """
+        Retorna o texto extraído pelo Solr Cell ou None se a extração
+        falhar, para que a falha não seja guardada em TextoExtraido.
+        """
         if not self.backend:
             self.backend = connections['default'].get_backend()
         try:
             with open(arquivo.path, 'rb') as f:
                 content = self.backend.extract_file_contents(f)
-                if not content or not content['contents']:
+                if content is None:
+                    return None
+                if not content['contents']:
                     return ''
                 data = content['contents']
         except Exception as e:
-            print('erro processando arquivo: ' % arquivo.path)
+            print('erro processando arquivo: %s' % arquivo.path)
             self.logger.error(arquivo.path)
-            self.logger.error('erro processando arquivo: ' % arquivo.path)
-            data = ''
+            self.logger.error('erro processando arquivo: %s' % arquivo.path)
+            data = None
         return data
 
     def print_error(self, arquivo, error):
@@ -61,30 +79,93 @@ class TextExtractField(CharField):
         # Em ambiente de produção utiliza-se o SOLR
         if SOLR_URL:
             try:
-                return self.solr_extraction(arquivo)
+                # o texto de um arquivo já extraído é reaproveitado
+                hash_arquivo = hash_conteudo_arquivo(arquivo.path)
+                texto = TextoExtraido.objects.filter(
+                    hash_arquivo=hash_arquivo).values_list(
+                    'texto', flat=True).first()
+                if texto is not None:
+                    return texto
+
+                texto = self.solr_extraction(arquivo)
+                if texto is None:
+                    return ''
+
+                TextoExtraido.objects.get_or_create(
+                    hash_arquivo=hash_arquivo,
+                    defaults={'texto': texto})
+                return texto
             except Exception as err:
                 print(str(err))
                 self.print_error(arquivo, err)
         return ''
 
+    def carrega_textos_articulados(self, objetos):
+        """
+        Carrega, com uma única consulta iterada por cursor no servidor, os
+        dispositivos de todos os textos articulados públicos de um lote de
+        objetos, deixando o texto de cada objeto pronto para ta_extractor.
+        """
+        self.textos_articulados = {}
+        if not objetos or 'ta_extractor' not in dict(self.model_attr).values():
+            return
+
+        por_content_type = {}
+        for obj in objetos:
+            content_type = ContentType.objects.get_for_model(obj)
+            por_content_type.setdefault(content_type.id, []).append(obj.pk)
+
+        filtro = Q()
+        for content_type_id, pks in por_content_type.items():
+            filtro |= Q(content_type_id=content_type_id, object_id__in=pks)
+
+        tas = list(TextoArticulado.objects.filter(
+            filtro,
+            privacidade__in=[STATUS_TA_PUBLIC, STATUS_TA_IMMUTABLE_PUBLIC]
+        ).values_list('id', 'content_type_id', 'object_id'))
+
+        for content_type_id, pks in por_content_type.items():
+            for pk in pks:
+                self.textos_articulados[(content_type_id, pk)] = ''
+        if not tas:
+            return
+
+        textos = {ta_id: [] for ta_id, _, _ in tas}
+        dispositivos = Dispositivo.objects.filter(
+            Q(ta_id__in=textos) | Q(ta_publicado_id__in=textos)
+        ).order_by(
+            'ordem'
+        ).annotate(
+            rotulo_texto=Concat(
+                F('rotulo'), Value(' '), F('texto'),
+                output_field=TextField(),
+            )
+        ).values_list(
+            'ta_id', 'ta_publicado_id', 'rotulo_texto')
+
+        for ta_id, ta_publicado_id, rotulo_texto in dispositivos.iterator():
+            if not rotulo_texto or not rotulo_texto.strip():
+                continue
+            for chave_ta in {ta_id, ta_publicado_id}:
+                if chave_ta in textos:
+                    textos[chave_ta].append(rotulo_texto)
+
+        partes = {}
+        for ta_id, content_type_id, object_id in tas:
+            texto = ' '.join(textos.pop(ta_id))
+            if texto:
+                partes.setdefault(
+                    (content_type_id, object_id), []).append(texto)
+
+        for chave, textos_ta in partes.items():
+            self.textos_articulados[chave] = ' '.join(textos_ta)
+
     def ta_extractor(self, value):
-        r = []
-        for ta in value.filter(privacidade__in=[
-                STATUS_TA_PUBLIC,
-                STATUS_TA_IMMUTABLE_PUBLIC]):
-            dispositivos = Dispositivo.objects.filter(
-                Q(ta=ta) | Q(ta_publicado=ta)
-            ).order_by(
-                'ordem'
-            ).annotate(
-                rotulo_texto=Concat(
-                    F('rotulo'), Value(' '), F('texto'),
-                    output_field=TextField(),
-                )
-            ).values_list(
-                'rotulo_texto', flat=True)
-            r += list(filter(lambda x: x.strip(), dispositivos))
-        return ' '.join(r)
+        chave = (ContentType.objects.get_for_model(value.instance).id,
+                 value.instance.pk)
+        if chave not in getattr(self, 'textos_articulados', {}):
+            self.carrega_textos_articulados([value.instance])
+        return self.textos_articulados.pop(chave)
 
     def string_extractor(self, value):
         return value
@@ -141,6 +222,15 @@ class DocumentoAcessorioIndex(SearchIndex, Indexable):
     def get_updated_field(self):
         return 'data_ultima_atualizacao'
 
+    def prepara_lote(self, objetos):
+        """
+        Pré-carrega em bulk os dados que os campos precisam para indexar um
+        lote de objetos, antes das chamadas a full_prepare.
+        """
+        for field in self.fields.values():
+            if isinstance(field, TextExtractField):
+                field.carrega_textos_articulados(objetos)
+
 
 class NormaJuridicaIndex(DocumentoAcessorioIndex):
     model = NormaJuridica
@@ -168,3 +258,337 @@ class MateriaLegislativaIndex(DocumentoAcessorioIndex):
             ('observacao', 'string_extractor'),
         )
     )
+
+
+class FilaIndexacaoSignalProcessor(BaseSignalProcessor):
+    """
+    Em vez de indexar durante a requisição do usuário (o que, com
+    RealtimeSignalProcessor, envia o PDF inteiro ao Solr Cell a cada save),
+    apenas registra o objeto em IndexacaoPendente. A extração e a indexação
+    são feitas em lote pelo comando processa_fila_indexacao.
+    """
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def is_indexed(self, sender, instance):
+        for using in self.connection_router.for_write(instance=instance):
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+                return True
+            except NotHandled:
+                pass
+        return False
+
+    def enfileira(self, sender, instance, acao):
+        if not self.is_indexed(sender, instance):
+            return
+
+        IndexacaoPendente.objects.update_or_create(
+            content_type=ContentType.objects.get_for_model(sender),
+            object_id=instance.pk,
+            defaults={
+                'identificador': get_identifier(instance),
+                'acao': acao,
+                'tentativas': 0,
+                'proxima_tentativa': timezone.now(),
+                'erro': ''
+            })
+
+    def handle_save(self, sender, instance, **kwargs):
+        self.enfileira(sender, instance,
+                       IndexacaoPendente.ACAO_CHOICES.atualizar)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        self.enfileira(sender, instance,
+                       IndexacaoPendente.ACAO_CHOICES.remover)
+
+
+def backoff_indexacao(tentativas):
+    # 1, 2, 4, 8... minutos, limitado a 6 horas
+    return timedelta(minutes=min(2 ** tentativas, 6 * 60))
+
+
+def reserva_indexacoes_pendentes(batch_size, max_tentativas, reserva):
+    """
+    Reserva um lote de indexações vencidas, adiando sua próxima tentativa
+    para depois do tempo de reserva. Assim, vários workers podem consumir a
+    fila ao mesmo tempo sem processar o mesmo objeto.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        lote = list(IndexacaoPendente.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            proxima_tentativa__lte=agora,
+            tentativas__lt=max_tentativas
+        ).order_by('proxima_tentativa', 'id')[:batch_size])
+
+        IndexacaoPendente.objects.filter(
+            id__in=[p.id for p in lote]
+        ).update(proxima_tentativa=agora + reserva)
+
+        for p in lote:
+            p.proxima_tentativa = agora + reserva
+
+    return lote
+
+
+def conclui_indexacoes(pendentes):
+    # Só remove da fila quem não foi reenfileirado durante o processamento,
+    # ou seja, quem ainda está com a reserva feita por este worker.
+    if pendentes:
+        IndexacaoPendente.objects.filter(
+            id__in=[p.id for p in pendentes],
+            proxima_tentativa=pendentes[0].proxima_tentativa).delete()
+
+
+def adia_indexacoes(pendentes, erro):
+    logger = logging.getLogger(__name__)
+    for p in pendentes:
+        logger.error('Erro indexando {}: {}'.format(p.identificador, erro))
+        IndexacaoPendente.objects.filter(
+            id=p.id, proxima_tentativa=p.proxima_tentativa
+        ).update(
+            tentativas=p.tentativas + 1,
+            proxima_tentativa=timezone.now() + backoff_indexacao(
+                p.tentativas),
+            erro=str(erro))
+
+
+def processa_indexacoes_pendentes(batch_size=100, max_tentativas=10,
+                                  reserva=timedelta(minutes=30),
+                                  using='default'):
+    """
+    Processa um lote da fila de indexação: extrai o texto e envia ao Solr
+    todos os objetos atualizados de um mesmo model em uma única requisição,
+    remove os apagados e faz um único commit ao final. Falhas são
+    reagendadas com backoff exponencial.
+
+    :return: quantidade de itens retirados da fila.
+    """
+    pendentes = reserva_indexacoes_pendentes(batch_size, max_tentativas,
+                                             reserva)
+    if not pendentes:
+        return 0
+
+    backend = connections[using].get_backend()
+    unified_index = connections[using].get_unified_index()
+
+    por_model = {}
+    for p in pendentes:
+        por_model.setdefault(p.content_type_id, []).append(p)
+
+    enviados = []
+
+    for content_type_id, itens in por_model.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        try:
+            index = unified_index.get_index(model)
+        except NotHandled as e:
+            adia_indexacoes(itens, e)
+            continue
+
+        remover = [p for p in itens
+                   if p.acao == IndexacaoPendente.ACAO_CHOICES.remover]
+        atualizar = [p for p in itens
+                     if p.acao == IndexacaoPendente.ACAO_CHOICES.atualizar]
+
+        objetos = index.index_queryset(using=using).in_bulk(
+            [p.object_id for p in atualizar])
+        index.prepara_lote(list(objetos.values()))
+
+        docs = []
+        preparados = []
+        for p in atualizar:
+            obj = objetos.get(p.object_id)
+            if obj is None:
+                # não existe mais ou saiu do index_queryset
+                remover.append(p)
+                continue
+            try:
+                docs.append(index.full_prepare(obj))
+                preparados.append(p)
+            except Exception as e:
+                adia_indexacoes([p], e)
+
+        try:
+            if docs:
+                backend.conn.add(docs, commit=False,
+                                 boost=index.get_field_weights())
+            for p in remover:
+                backend.conn.delete(id=p.identificador, commit=False)
+        except Exception as e:
+            adia_indexacoes(preparados + remover, e)
+        else:
+            enviados.extend(preparados + remover)
+
+    # só retira da fila o que foi enviado depois que o Solr confirmar o
+    # commit; se ele falhar, o lote inteiro é reagendado
+    try:
+        backend.conn.commit()
+    except Exception as e:
+        adia_indexacoes(enviados, e)
+    else:
+        conclui_indexacoes(enviados)
+    return len(pendentes)
+
+
+def get_rotulo_indice(index):
+    return index.get_model()._meta.label_lower
+
+
+def linhas_reindexacao(index, controle, limite, using='default'):
+    """
+    Retorna, ordenados por (data de atualização, id), os pares
+    (data de atualização, id) dos objetos alterados depois do ponto de
+    parada registrado em controle. Objetos sem data de atualização só são
+    processados na primeira execução (controle sem data).
+
+    Objetos atualizados depois de limite ficam para a próxima execução,
+    evitando perder transações que ainda não tinham sido confirmadas
+    quando a consulta foi feita.
+    """
+    campo = index.get_updated_field()
+    qs = index.index_queryset(using=using)
+
+    if controle.data_ultima_atualizacao is None:
+        qs = qs.filter(
+            Q(**{campo + '__isnull': True, 'pk__gt': controle.ultimo_id}) |
+            Q(**{campo + '__lte': limite}))
+    else:
+        qs = qs.filter(
+            Q(**{campo + '__gt': controle.data_ultima_atualizacao,
+                 campo + '__lte': limite}) |
+            Q(**{campo: controle.data_ultima_atualizacao,
+                 'pk__gt': controle.ultimo_id}))
+
+    return list(qs.order_by(
+        F(campo).asc(nulls_first=True), 'pk'
+    ).values_list(campo, 'pk'))
+
+
+def _inicia_worker_reindexacao(using):
+    # O processo filho não pode reaproveitar as conexões herdadas do pai
+    db_connections.close_all()
+    connections.reload(using)
+
+
+def _reindexa_lote(args):
+    """
+    Executado nos processos do pool: prepara os documentos de um lote e os
+    envia ao Solr sem commit. Retorna o número do lote e os ids que não
+    puderam ser preparados.
+    """
+    numero, rotulo_model, pks, using = args
+
+    index = connections[using].get_unified_index().get_index(
+        apps.get_model(rotulo_model))
+    backend = connections[using].get_backend()
+
+    objetos = list(index.index_queryset(using=using).filter(
+        pk__in=pks).order_by('pk'))
+    index.prepara_lote(objetos)
+
+    docs = []
+    falhas = []
+    for obj in objetos:
+        try:
+            docs.append(index.full_prepare(obj))
+        except Exception as e:
+            logging.getLogger(__name__).error(
+                'Erro preparando {}: {}'.format(get_identifier(obj), e))
+            falhas.append(obj.pk)
+
+    if docs:
+        backend.conn.add(docs, commit=False,
+                         boost=index.get_field_weights())
+
+    return numero, falhas
+
+
+def reindexa_incremental(index, workers=None, batch_size=100,
+                         commit_a_cada=10, do_zero=False, using='default',
+                         margem=timedelta(minutes=1), log=None):
+    """
+    Reindexa, em um pool de processos, os objetos de index alterados desde
+    a última execução. Os lotes são enviados ao Solr sem commit; a cada
+    commit_a_cada lotes é feito um único commit e o ponto de parada avança
+    até o fim da maior sequência contínua de lotes concluídos. Se o
+    processo for interrompido, a próxima execução recomeça desse ponto.
+
+    Objetos que falham na preparação são enviados à fila de indexação
+    (IndexacaoPendente) para nova tentativa, sem travar o ponto de parada.
+
+    :return: quantidade de objetos enviados ao Solr.
+    """
+    rotulo = get_rotulo_indice(index)
+    controle, _ = ControleReindexacao.objects.get_or_create(indice=rotulo)
+    if do_zero:
+        controle.data_ultima_atualizacao = None
+        controle.ultimo_id = 0
+        controle.save()
+
+    linhas = linhas_reindexacao(index, controle, timezone.now() - margem,
+                                using=using)
+    if not linhas:
+        return 0
+
+    lotes = [linhas[i:i + batch_size]
+             for i in range(0, len(linhas), batch_size)]
+    tarefas = [(numero, rotulo, [pk for _, pk in lote], using)
+               for numero, lote in enumerate(lotes)]
+
+    backend = connections[using].get_backend()
+    content_type = ContentType.objects.get_for_model(index.get_model())
+
+    def confirma(ate):
+        backend.conn.commit()
+        controle.data_ultima_atualizacao, controle.ultimo_id = \
+            lotes[ate - 1][-1]
+        controle.save()
+        if log:
+            log('{}: {} de {} lotes confirmados'.format(
+                rotulo, ate, len(lotes)))
+
+    # As conexões são fechadas antes do fork para que os filhos não
+    # compartilhem o mesmo socket com o banco
+    db_connections.close_all()
+
+    concluidos = set()
+    proximo = 0
+    confirmado = 0
+    with multiprocessing.Pool(workers,
+                              initializer=_inicia_worker_reindexacao,
+                              initargs=(using, )) as pool:
+        for numero, falhas in pool.imap_unordered(_reindexa_lote, tarefas):
+            for pk in falhas:
+                IndexacaoPendente.objects.update_or_create(
+                    content_type=content_type,
+                    object_id=pk,
+                    defaults={
+                        'identificador': '{}.{}'.format(rotulo, pk),
+                        'acao': IndexacaoPendente.ACAO_CHOICES.atualizar,
+                        'tentativas': 0,
+                        'proxima_tentativa': timezone.now(),
+                        'erro': ''
+                    })
+
+            concluidos.add(numero)
+            while proximo in concluidos:
+                concluidos.remove(proximo)
+                proximo += 1
+
+            if proximo - confirmado >= commit_a_cada:
+                confirma(proximo)
+                confirmado = proximo
+
+    if proximo > confirmado:
+        confirma(proximo)
+
+    return len(linhas)
@@ -1,3 +1,6 @@
 import django.dispatch
 
 tramitacao_signal = django.dispatch.Signal(providing_args=['post', 'request'])
+
+# enviado pelas tramitações em lote, que não disparam post_save
+tramitacoes_em_lote_signal = django.dispatch.Signal(providing_args=['materias'])
@@ -1,7 +1,26 @@
+from datetime import timedelta
+from unittest import mock
+
 import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 from model_mommy import mommy
 
-from sapl.base.models import CasaLegislativa
+from sapl.base.email_utils import (enfileira_email_tramitacao_em_lote,
+                                   processa_emails_pendentes)
+from sapl.base.models import (CasaLegislativa, ControleReindexacao,
+                              EmailTramitacaoPendente, IndexacaoPendente)
+from sapl.base.search_indexes import (MateriaLegislativaIndex,
+                                      NormaJuridicaIndex,
+                                      adia_indexacoes, conclui_indexacoes,
+                                      linhas_reindexacao,
+                                      processa_indexacoes_pendentes,
+                                      reserva_indexacoes_pendentes)
+from sapl.compilacao.models import (STATUS_TA_PRIVATE, STATUS_TA_PUBLIC,
+                                    Dispositivo, TextoArticulado)
+from sapl.materia.models import (AcompanhamentoMateria, MateriaLegislativa,
+                                 Tramitacao)
+from sapl.norma.models import NormaJuridica
 
 
 @pytest.mark.django_db(transaction=False)
@@ -22,3 +41,127 @@ def test_casa_legislativa_model():
     assert casa_legislativa.cep == '12345678'
     assert casa_legislativa.municipio == 'Teste_Municipio_Casa_Legislativa'
     assert casa_legislativa.uf == 'DF'
+
+
+@pytest.mark.django_db(transaction=False)
+def test_fila_indexacao_reserva_conclui_e_adia():
+    content_type = ContentType.objects.get_for_model(MateriaLegislativa)
+    a = mommy.make(IndexacaoPendente, content_type=content_type,
+                   object_id=1, identificador='materia.materialegislativa.1')
+    b = mommy.make(IndexacaoPendente, content_type=content_type,
+                   object_id=2, identificador='materia.materialegislativa.2')
+
+    lote = reserva_indexacoes_pendentes(10, 10, timedelta(minutes=30))
+    assert [p.id for p in lote] == [a.id, b.id]
+
+    # itens reservados não são entregues a outro worker
+    assert reserva_indexacoes_pendentes(10, 10, timedelta(minutes=30)) == []
+
+    adia_indexacoes([lote[1]], 'Solr indisponível')
+    conclui_indexacoes([lote[0]])
+
+    [pendente] = IndexacaoPendente.objects.all()
+    assert pendente.id == b.id
+    assert pendente.tentativas == 1
+    assert pendente.erro == 'Solr indisponível'
+    assert pendente.proxima_tentativa > timezone.now()
+
+
+@pytest.mark.django_db(transaction=False)
+def test_fila_indexacao_mantida_se_commit_do_solr_falha():
+    content_type = ContentType.objects.get_for_model(MateriaLegislativa)
+    mommy.make(IndexacaoPendente, content_type=content_type, object_id=1,
+               identificador='materia.materialegislativa.1',
+               acao=IndexacaoPendente.ACAO_CHOICES.remover)
+
+    with mock.patch('sapl.base.search_indexes.connections') as connections:
+        backend = connections['default'].get_backend.return_value
+        backend.conn.commit.side_effect = Exception('Solr indisponível')
+
+        assert processa_indexacoes_pendentes() == 1
+
+    [pendente] = IndexacaoPendente.objects.all()
+    assert pendente.tentativas == 1
+    assert pendente.erro == 'Solr indisponível'
+
+
+@pytest.mark.django_db(transaction=False)
+def test_fila_email_tramitacao_em_lote_com_nova_tentativa():
+    acompanhada, outra = mommy.make(Tramitacao, _quantity=2)
+    mommy.make(AcompanhamentoMateria, materia=acompanhada.materia,
+               confirmado=True)
+
+    with mock.patch('sapl.base.email_utils.mail_service_configured',
+                    return_value=True):
+        enfileira_email_tramitacao_em_lote(
+            'http://sapl', 'materia', [acompanhada, outra])
+
+    # só entram na fila as tramitações com destinatários confirmados
+    [pendente] = EmailTramitacaoPendente.objects.all()
+    assert pendente.tramitacao == acompanhada
+
+    with mock.patch('sapl.base.email_utils.'
+                    'do_envia_email_tramitacao_em_lote') as envia:
+        envia.side_effect = Exception('SMTP indisponível')
+        assert processa_emails_pendentes() == 1
+
+        pendente.refresh_from_db()
+        assert pendente.tentativas == 1
+        assert pendente.erro == 'SMTP indisponível'
+
+        EmailTramitacaoPendente.objects.update(
+            proxima_tentativa=timezone.now())
+        envia.side_effect = None
+        assert processa_emails_pendentes() == 1
+
+        base_url, tipo, tramitacoes = envia.call_args[0]
+        assert (base_url, tipo, list(tramitacoes)) == (
+            'http://sapl', 'materia', [acompanhada])
+    assert not EmailTramitacaoPendente.objects.exists()
+
+
+@pytest.mark.django_db(transaction=False)
+def test_reindexacao_incremental_parte_do_ponto_de_parada():
+    a, b, c = mommy.make(MateriaLegislativa, _quantity=3)
+    data = timezone.now() - timedelta(hours=1)
+    MateriaLegislativa.objects.filter(
+        id__in=[a.id, b.id]).update(data_ultima_atualizacao=data)
+    MateriaLegislativa.objects.filter(
+        id=c.id).update(data_ultima_atualizacao=None)
+
+    index = MateriaLegislativaIndex()
+    controle = ControleReindexacao(indice='materia.materialegislativa')
+
+    linhas = linhas_reindexacao(index, controle, timezone.now())
+    assert [pk for _, pk in linhas] == [c.id, a.id, b.id]
+
+    controle.data_ultima_atualizacao, controle.ultimo_id = linhas[1]
+    linhas = linhas_reindexacao(index, controle, timezone.now())
+    assert [pk for _, pk in linhas] == [b.id]
+
+    # alterações recentes ficam para a próxima execução
+    MateriaLegislativa.objects.filter(id=a.id).update(
+        data_ultima_atualizacao=timezone.now())
+    linhas = linhas_reindexacao(
+        index, controle, timezone.now() - timedelta(minutes=1))
+    assert [pk for _, pk in linhas] == [b.id]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_textos_articulados_carregados_em_lote():
+    norma_a, norma_b, norma_c = mommy.make(NormaJuridica, _quantity=3)
+    ta_a = mommy.make(TextoArticulado, content_object=norma_a,
+                      privacidade=STATUS_TA_PUBLIC)
+    ta_c = mommy.make(TextoArticulado, content_object=norma_c,
+                      privacidade=STATUS_TA_PRIVATE)
+    mommy.make(Dispositivo, ta=ta_a, ordem=2, rotulo='Art. 2º', texto='B')
+    mommy.make(Dispositivo, ta=ta_a, ordem=1, rotulo='Art. 1º', texto='A')
+    mommy.make(Dispositivo, ta=ta_c, ordem=1, rotulo='Art. 1º', texto='C')
+
+    field = NormaJuridicaIndex().fields['text']
+    field.carrega_textos_articulados([norma_a, norma_b, norma_c])
+
+    assert field.ta_extractor(norma_a.texto_articulado) == \
+        'Art. 1º A Art. 2º B'
+    assert field.ta_extractor(norma_b.texto_articulado) == ''
+    assert field.ta_extractor(norma_c.texto_articulado) == ''
@@ -35,18 +35,19 @@ from sapl.base.forms import AutorForm, AutorFormForAdmin, TipoAutorForm
 from sapl.base.models import Autor, TipoAutor
 from sapl.comissoes.models import Reuniao, Comissao
 from sapl.crud.base import CrudAux, make_pagination
-from sapl.materia.models import (Autoria, MateriaLegislativa, Proposicao, Anexada,
+from sapl.materia.models import (Autoria, MateriaLegislativa, Proposicao,
                                  TipoMateriaLegislativa, StatusTramitacao, UnidadeTramitacao)
 from sapl.norma.models import (NormaJuridica, NormaEstatisticas)
 from sapl.parlamentares.models import Parlamentar, Legislatura, Mandato, Filiacao, SessaoLegislativa
 from sapl.protocoloadm.models import (Protocolo, TipoDocumentoAdministrativo, 
                                       StatusTramitacaoAdministrativo, 
-                                      DocumentoAdministrativo, Anexado)
+                                      DocumentoAdministrativo)
 from sapl.sessao.models import (PresencaOrdemDia, SessaoPlenaria,
                                 SessaoPlenariaPresenca, Bancada)
 from sapl.utils import (parlamentares_ativos, gerar_hash_arquivo, SEPARADOR_HASH_PROPOSICAO,
                         show_results_filter_set, mail_service_configured,
-                        intervalos_tem_intersecao, remover_acentos)
+                        intervalos_tem_intersecao, remover_acentos,
+                        anexacoes_ciclicas)
 from .forms import (AlterarSenhaForm, CasaLegislativaForm,
                     ConfiguracoesAppForm, RelatorioAtasFilterSet,
                     RelatorioAudienciaFilterSet,
@@ -65,16 +66,16 @@ from .models import AppConfig, CasaLegislativa
 
 
 def filtra_url_materias_em_tramitacao(qr, qs, campo_url, local_ou_status):
-    id_materias = []
     filtro_url = qr[campo_url]
     if local_ou_status == 'local':
-        id_materias = [item.id for item in qs if item.tramitacao_set.order_by(
-            '-id').first().unidade_tramitacao_destino_id == int(filtro_url)]
+        qs = qs.filter(
+            ultima_tramitacao__unidade_tramitacao_destino_id=int(filtro_url))
     elif local_ou_status == 'status':
-        id_materias = [item.id for item in qs if item.tramitacao_set.order_by(
-            '-id').first().status_id == int(filtro_url)]
+        qs = qs.filter(ultima_tramitacao__status_id=int(filtro_url))
+    else:
+        qs = qs.none()
 
-    return qs.filter(em_tramitacao=True, id__in=id_materias)
+    return qs.filter(em_tramitacao=True)
 
 
 def get_casalegislativa():
@@ -674,7 +675,8 @@ class RelatorioMateriasTramitacaoView(FilterView):
             qs = filtra_url_materias_em_tramitacao(
                 qr, qs, 'tramitacao__status', 'status')
 
-        li = [li1 for li1 in qs if li1.tramitacao_set.last() and li1.tramitacao_set.last().status.indicador != 'F']
+        li = list(qs.filter(ultima_tramitacao__isnull=False).exclude(
+            ultima_tramitacao__status__indicador='F'))
         context['object_list'] = li
 
         qtdes = {}
@@ -1064,71 +1066,25 @@ class ListarInconsistenciasView(PermissionRequiredMixin, ListView):
         tabela.append(
             ('anexadas_ciclicas',
              'Matérias Anexadas cíclicas',
-             len(anexados_ciclicos(True))
+             anexacoes_ciclicas(True).count()
              )
         )
         tabela.append(
             ('anexados_ciclicos',
              'Documentos Anexados cíclicos',
-             len(anexados_ciclicos(False))
+             anexacoes_ciclicas(False).count()
              )
         )
         return tabela
 
 
 def anexados_ciclicos(ofMateriaLegislativa):
-    ciclicos = []
-    
     if ofMateriaLegislativa:
-        principais = Anexada.objects.values(
-            'materia_principal'
-        ).annotate(
-            count=Count('materia_principal')
-        ).filter(count__gt=0).order_by('-data_anexacao')
-    else:
-        principais = Anexado.objects.values(
-            'documento_principal'
-        ).annotate(
-            count=Count('documento_principal')
-        ).filter(count__gt=0).order_by('-data_anexacao')
-
-    for principal in principais:
-        anexados_total = []
-
-        if ofMateriaLegislativa:
-            anexados = Anexada.objects.filter(
-                materia_principal=principal['materia_principal']
-            ).order_by('-data_anexacao')
-        else:
-            anexados = Anexado.objects.filter(
-                documento_principal=principal['documento_principal']
-            ).order_by('-data_anexacao')
-
-        anexados_temp = list(anexados)
-        while anexados_temp:
-            anexado = anexados_temp.pop()
-            if ofMateriaLegislativa:
-                if anexado.materia_anexada not in anexados_total:
-                    if not principal['materia_principal'] == anexado.materia_anexada.pk:
-                        anexados_total.append(anexado.materia_anexada)
-                        anexados_anexado = Anexada.objects.filter(
-                            materia_principal=anexado.materia_anexada
-                        )
-                        anexados_temp.extend(anexados_anexado)
-                    else:
-                        ciclicos.append((anexado.data_anexacao, anexado.materia_principal, anexado.materia_anexada))
-            else:
-                if anexado.documento_anexado not in anexados_total:
-                    if not principal['documento_principal'] == anexado.documento_anexado.pk:
-                        anexados_total.append(anexado.documento_anexado)
-                        anexados_anexado = Anexado.objects.filter(
-                            documento_principal=anexado.documento_anexado
-                        )
-                        anexados_temp.extend(anexados_anexado)
-                    else:
-                        ciclicos.append((anexado.data_anexacao, anexado.documento_principal, anexado.documento_anexado))
-
-    return ciclicos
+        return [(a.data_anexacao, a.materia_principal, a.materia_anexada)
+                for a in anexacoes_ciclicas(True)]
+
+    return [(a.data_anexacao, a.documento_principal, a.documento_anexado)
+            for a in anexacoes_ciclicas(False)]
 
 
 class ListarAnexadosCiclicosView(PermissionRequiredMixin, ListView):
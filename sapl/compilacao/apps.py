@@ -12,6 +12,9 @@ class AppConfig(apps.AppConfig):
     label = 'compilacao'
     verbose_name = _('Compilação')
 
+    def ready(self):
+        from sapl.compilacao import receivers
+
     @staticmethod
     def import_pattern():
 
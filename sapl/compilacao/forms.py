@@ -7,6 +7,7 @@ from crispy_forms.layout import (HTML, Button, Column, Div, Field, Fieldset,
                                  Layout, Row, Submit)
 from django import forms
 from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import transaction
 from django.db.models import Q
 from django.forms import widgets
 from django.forms.forms import Form
@@ -21,7 +22,8 @@ from sapl.compilacao.models import (NOTAS_PUBLICIDADE_CHOICES,
                                     TipoDispositivo, TipoNota, TipoPublicacao,
                                     TipoTextoArticulado, TipoVide,
                                     VeiculoPublicacao, Vide)
-from sapl.compilacao.utils import DISPOSITIVO_SELECT_RELATED
+from sapl.compilacao.utils import (DISPOSITIVO_SELECT_RELATED,
+                                   incrementa_revisao_ta)
 from sapl.crispy_layout_mixin import SaplFormHelper
 from sapl.crispy_layout_mixin import SaplFormLayout, to_column, to_row,\
     form_actions
@@ -973,20 +975,9 @@ class DispositivoEdicaoVigenciaForm(ModelForm):
         if extensao:
             dv_pk = dv.pk if dv else None
 
-            def extenderPara(dpt_pk):
-
-                Dispositivo.objects.filter(
-                    dispositivo_pai_id=dpt_pk,
-                    ta_publicado__isnull=True).update(
-                    dispositivo_vigencia_id=dv_pk)
-
-                filhos = Dispositivo.objects.filter(
-                    dispositivo_pai_id=dpt_pk).values_list('pk', flat=True)
-
-                for d in filhos:
-                    extenderPara(d)
-
-            extenderPara(instance.pk)
+            instance.descendentes().filter(
+                ta_publicado__isnull=True).update(
+                dispositivo_vigencia_id=dv_pk)
 
         inst = instance
         while instance.auto_inserido and instance.dispositivo_pai:
@@ -1006,6 +997,11 @@ class DispositivoEdicaoVigenciaForm(ModelForm):
                 fim_vigencia=inst.fim_eficacia,
                 fim_eficacia=inst.fim_eficacia)
 
+        # update() não dispara post_save; os descendentes estão no mesmo texto
+        ta_ids = {instance.ta_id} | set(
+            inst.dispositivos_vigencias_set.values_list('ta_id', flat=True))
+        transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
+
         return inst
 
 
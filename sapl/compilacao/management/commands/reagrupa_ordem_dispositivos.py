@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from sapl.compilacao.models import Dispositivo, TextoArticulado
+
+
+class Command(BaseCommand):
+
+    help = ('Renumera a ordem dos dispositivos dos Textos Articulados cujos '
+            'intervalos livres para inserção estão se esgotando')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo-minimo',
+            type=int,
+            default=Dispositivo.INTERVALO_ORDEM // 16,
+            dest='intervalo_minimo',
+            help='Renumera textos com dispositivos consecutivos mais '
+                 'próximos que este intervalo de ordem',
+        )
+
+    def handle(self, *args, **options):
+        ta_ids = Dispositivo.objects.textos_a_reagrupar(
+            options['intervalo_minimo'])
+
+        for ta in TextoArticulado.objects.filter(pk__in=ta_ids):
+            ta.reagrupar_ordem_de_dispositivos()
+
+        self.stdout.write(
+            '{} textos articulados renumerados'.format(len(ta_ids)))
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compilacao', '0012_bug_auto_inserido'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dispositivo',
+            index=models.Index(fields=['ta', 'inicio_vigencia', 'fim_vigencia'], name='dispositivo_ta_vigencia_idx'),
+        ),
+    ]
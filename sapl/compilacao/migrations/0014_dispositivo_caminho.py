@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compilacao', '0013_dispositivo_ta_vigencia_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispositivo',
+            name='caminho',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255, verbose_name='Caminho na Árvore de Dispositivos'),
+        ),
+        migrations.RunSQL(
+            """
+            WITH RECURSIVE arvore(id, caminho) AS (
+                SELECT id, '/'::text
+                FROM compilacao_dispositivo
+                WHERE dispositivo_pai_id IS NULL
+              UNION ALL
+                SELECT d.id, a.caminho || d.dispositivo_pai_id || '/'
+                FROM compilacao_dispositivo d
+                JOIN arvore a ON d.dispositivo_pai_id = a.id
+            )
+            UPDATE compilacao_dispositivo d
+            SET caminho = arvore.caminho
+            FROM arvore
+            WHERE d.id = arvore.id;
+            """,
+            migrations.RunSQL.noop),
+    ]
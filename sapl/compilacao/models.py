@@ -1,11 +1,16 @@
 
+from bisect import bisect_right
+from datetime import timedelta
+
 from bs4 import BeautifulSoup
 from django.contrib import messages
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
-from django.db.models import F, Q
+from django.core.cache import cache
+from django.db import connections, models, transaction
+from django.db.models import F, Q, Value
 from django.db.models.aggregates import Max
+from django.db.models.functions import Concat, Substr
 from django.db.models.deletion import PROTECT
 from django.http.response import Http404
 from django.template import defaultfilters
@@ -15,8 +20,10 @@ from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 import reversion
 
-from sapl.compilacao.utils import (get_integrations_view_names, int_to_letter,
-                                   int_to_roman)
+from sapl.compilacao.utils import (COMPILACAO_CACHE_TIMEOUT,
+                                   get_integrations_view_names,
+                                   get_revisao_ta, incrementa_revisao_ta,
+                                   int_to_letter, int_to_roman)
 from sapl.utils import YES_NO_CHOICES, get_settings_auth_user_model
 
 
@@ -438,22 +445,40 @@ class TextoArticulado(TimestampedMixin):
 
         ta = TextoArticulado.update_or_create(view_integracao, obj)
 
-        dispositivos = Dispositivo.objects.filter(ta=self).order_by('ordem')
+        # TODO
+        # validar isso: é o suficiente para pegar apenas o texto válido?
+        # exemplo:
+        #  quando uma matéria for alterada por uma emenda
+        #  ao usar esta função para gerar uma norma deve vir apenas
+        #  o texto válido, compilado...
+        dispositivos = list(Dispositivo.objects.filter(
+            ta=self, dispositivo_subsequente__isnull=True
+        ).select_related('tipo_dispositivo').order_by('ordem'))
+
+        # Os ids dos novos dispositivos são reservados antes da inserção
+        # para que a árvore seja remapeada em memória e inserida em lote
+        map_ids = dict(zip(
+            [d.id for d in dispositivos],
+            Dispositivo.objects.reservar_ids(len(dispositivos))))
+        map_pais = {d.id: d.dispositivo_pai_id for d in dispositivos}
+
+        def ascendentes(id_old):
+            pks = []
+            while map_pais.get(id_old):
+                id_old = map_pais[id_old]
+                pks.insert(0, map_ids[id_old])
+            return pks
 
-        map_ids = {}
         for d in dispositivos:
             id_old = d.id
-
-            # TODO
-            # validar isso: é o suficiente para pegar apenas o texto válido?
-            # exemplo:
-            #  quando uma matéria for alterada por uma emenda
-            #  ao usar esta função para gerar uma norma deve vir apenas
-            #  o texto válido, compilado...
-            if d.dispositivo_subsequente:
-                continue
-
-            d.id = None
+            pks = ascendentes(id_old)
+
+            d.id = map_ids[id_old]
+            d.dispositivo_pai_id = map_ids[d.dispositivo_pai_id] \
+                if d.dispositivo_pai_id else None
+            d.dispositivo_raiz_id = pks[0] if pks else None
+            d.caminho = '/' + ''.join('{}/'.format(pk) for pk in pks)
+            d.contagem_continua = d.tipo_dispositivo.contagem_continua
             d.inicio_vigencia = ta.data
             d.fim_vigencia = None
             d.inicio_eficacia = ta.data
@@ -465,68 +490,71 @@ class TextoArticulado(TimestampedMixin):
             d.dispositivo_substituido = None
             d.dispositivo_vigencia = None
             d.dispositivo_atualizador = None
-            d.save()
-            map_ids[id_old] = d.id
-
-        dispositivos = Dispositivo.objects.filter(ta=ta).order_by('ordem')
-
-        for d in dispositivos:
-            if not d.dispositivo_pai:
-                continue
 
-            d.dispositivo_pai_id = map_ids[d.dispositivo_pai_id]
-            d.save()
+        with transaction.atomic():
+            Dispositivo.objects.bulk_create(dispositivos, batch_size=500)
+        transaction.on_commit(lambda: incrementa_revisao_ta(ta.pk))
 
         return ta
 
+    def renumerar_dispositivos(self, pks, ordem_max):
+        """
+        Grava ordem = INTERVALO_ORDEM, 2 * INTERVALO_ORDEM, ... nos
+        dispositivos na sequência de pks, em uma transação com dois UPDATEs:
+        o primeiro desloca todas as ordens do texto para além das novas,
+        evitando conflitos na restrição única (ta, ordem), e o segundo
+        aplica as novas ordens de uma só vez.
+        """
+        # estritamente acima da maior ordem nova, mesmo para ordem 0
+        deslocamento = max(ordem_max, len(pks) * Dispositivo.INTERVALO_ORDEM) \
+            + Dispositivo.INTERVALO_ORDEM
+        with transaction.atomic():
+            Dispositivo.objects.filter(ta=self).update(
+                ordem=F('ordem') + deslocamento)
+            Dispositivo.objects.atualizar_em_lote('ordem', {
+                pk: (i + 1) * Dispositivo.INTERVALO_ORDEM
+                for i, pk in enumerate(pks)})
+        transaction.on_commit(lambda: incrementa_revisao_ta(self.pk))
+
     def reagrupar_ordem_de_dispositivos(self):
 
-        dpts = Dispositivo.objects.filter(ta=self)
+        dpts = list(Dispositivo.objects.filter(
+            ta=self).values_list('pk', 'ordem').order_by('ordem'))
 
-        if not dpts.exists():
+        if not dpts:
             return
 
-        ordem_max = dpts.last().ordem
-        dpts.update(ordem=F('ordem') + ordem_max)
-
-        dpts = Dispositivo.objects.filter(
-            ta=self).values_list('pk', flat=True).order_by('ordem')
-
-        count = 0
-        for d in dpts:
-            count += Dispositivo.INTERVALO_ORDEM
-            Dispositivo.objects.filter(pk=d).update(ordem=count)
+        self.renumerar_dispositivos([pk for pk, ordem in dpts], dpts[-1][1])
 
     def reordenar_dispositivos(self):
+        """
+        Renumera os dispositivos do texto em pré-ordem da árvore (cada
+        dispositivo seguido de seus filhos, na ordem atual), montando a
+        árvore em memória a partir de uma única consulta.
+        """
+        dpts = list(Dispositivo.objects.filter(
+            ta=self).values_list(
+            'pk', 'dispositivo_pai_id', 'ordem').order_by('ordem'))
 
-        dpts = Dispositivo.objects.filter(ta=self)
-
-        if not dpts.exists():
+        if not dpts:
             return
 
-        ordem_max = dpts.last().ordem
-        dpts.update(ordem=F('ordem') + ordem_max)
+        filhos = {}
+        for pk, pai_id, ordem in dpts:
+            filhos.setdefault(pai_id, []).append(pk)
 
-        raizes = Dispositivo.objects.filter(
-            ta=self,
-            dispositivo_pai__isnull=True).values_list(
-                'pk', flat=True).order_by('ordem')
+        pks = []
+        pilha = list(reversed(filhos.get(None, [])))
+        while pilha:
+            pk = pilha.pop()
+            pks.append(pk)
+            pilha.extend(reversed(filhos.get(pk, [])))
 
-        count = []
-        count.append(Dispositivo.INTERVALO_ORDEM)
+        # dispositivos cujo pai não pertence ao texto vão para o final
+        visitados = set(pks)
+        pks += [pk for pk, pai_id, ordem in dpts if pk not in visitados]
 
-        def update(dpk):
-            Dispositivo.objects.filter(pk=dpk).update(ordem=count[0])
-            count[0] = count[0] + Dispositivo.INTERVALO_ORDEM
-            filhos = Dispositivo.objects.filter(
-                dispositivo_pai_id=dpk).values_list(
-                'pk', flat=True).order_by('ordem')
-
-            for dpk in filhos:
-                update(dpk)
-
-        for dpk in raizes:
-            update(dpk)
+        self.renumerar_dispositivos(pks, dpts[-1][2])
 
 
 @reversion.register()
@@ -872,6 +900,238 @@ class Publicacao(TimestampedMixin):
             self.ta)
 
 
+class DispositivoQuerySet(models.QuerySet):
+
+    def texto_em(self, data, somente_vigentes=False):
+        """
+        Dispositivos que compõem o texto na data: os que iniciaram vigência
+        até ela, incluindo os já revogados ou substituídos (exibidos como
+        desativados no texto multivigente) a menos que somente_vigentes.
+        """
+        qs = self.filter(inicio_vigencia__lte=data)
+        if somente_vigentes:
+            qs = qs.filter(
+                Q(fim_vigencia__isnull=True) | Q(fim_vigencia__gte=data))
+        return qs
+
+    def intervalos_vigencia(self, ta_id):
+        """
+        Índice de intervalos de vigência de um Texto Articulado: lista,
+        ordenada pelo início, com um dispositivo representante de cada data
+        de início de vigência e fim_vigencia ajustado para a véspera do
+        início seguinte (None no intervalo atual). Guardado em cache por
+        revisão do texto.
+        """
+        chave = 'compilacao:ta:{}:vigencias:{}'.format(
+            ta_id, get_revisao_ta(ta_id))
+        intervalos = cache.get(chave)
+        if intervalos is None:
+            intervalos = list(self.filter(
+                ta_id=ta_id,
+            ).order_by(
+                'inicio_vigencia'
+            ).distinct(
+                'inicio_vigencia'
+            ).select_related(
+                'ta_publicado',
+                'ta',
+                'ta_publicado__tipo_ta',
+                'ta__tipo_ta',))
+
+            for atual, seguinte in zip(intervalos, intervalos[1:]):
+                atual.fim_vigencia = seguinte.inicio_vigencia - \
+                    timedelta(days=1)
+            if intervalos:
+                intervalos[-1].fim_vigencia = None
+
+            cache.set(chave, intervalos, COMPILACAO_CACHE_TIMEOUT)
+        return intervalos
+
+    def intervalo_vigencia_em(self, ta_id, data):
+        """
+        Retorna o intervalo de intervalos_vigencia que contém a data, ou
+        None se a data for anterior ao início de vigência do texto.
+        """
+        intervalos = self.intervalos_vigencia(ta_id)
+        i = bisect_right([d.inicio_vigencia for d in intervalos], data)
+        return intervalos[i - 1] if i else None
+
+    def blocos_atualizadores(self, blocos):
+        """
+        Dispositivos de cada bloco de alteração em blocos, em uma única
+        consulta: {pk do bloco: [dispositivos pela ordem_bloco_atualizador]}.
+        Um dispositivo pertence ao bloco do qual é filho (dispositivo_pai)
+        ou ao qual está vinculado como dispositivo_atualizador.
+        """
+        blocos = set(blocos)
+        r = {pk: [] for pk in blocos}
+        if not blocos:
+            return r
+
+        for d in self.filter(
+                Q(dispositivo_pai_id__in=blocos) |
+                Q(dispositivo_atualizador_id__in=blocos)
+        ).order_by('ordem_bloco_atualizador', 'pk'):
+            if d.dispositivo_pai_id in blocos:
+                r[d.dispositivo_pai_id].append(d)
+            if d.dispositivo_atualizador_id in blocos and \
+                    d.dispositivo_atualizador_id != d.dispositivo_pai_id:
+                r[d.dispositivo_atualizador_id].append(d)
+        return r
+
+    def textos_a_reagrupar(self, intervalo_minimo):
+        """
+        Ids dos Textos Articulados em que algum par de dispositivos
+        consecutivos tem intervalo de ordem menor que intervalo_minimo, ou
+        seja, cujos intervalos livres para inserção estão se esgotando.
+        """
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT ta_id FROM ('
+                '  SELECT ta_id, ordem - lag(ordem) OVER ('
+                '    PARTITION BY ta_id ORDER BY ordem) AS intervalo'
+                '  FROM {tabela}) AS i '
+                'GROUP BY ta_id HAVING min(intervalo) < %s '
+                'ORDER BY ta_id'.format(
+                    tabela=connection.ops.quote_name(
+                        self.model._meta.db_table)),
+                [intervalo_minimo])
+            return [row[0] for row in cursor.fetchall()]
+
+    def reservar_ids(self, quantidade):
+        """
+        Reserva, em uma única consulta à sequência da chave primária,
+        quantidade ids para inserções em lote que precisam conhecer os ids
+        antes de inserir (ex.: árvores de dispositivos).
+        """
+        if not quantidade:
+            return []
+
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [self.model._meta.db_table, self.model._meta.pk.column,
+                 quantidade])
+            return [row[0] for row in cursor.fetchall()]
+
+    def atualizar_em_lote(self, campos, valores):
+        """
+        Atribui valores[pk] aos campos de cada dispositivo com um único
+        UPDATE ... FROM (VALUES ...), em vez de um UPDATE por dispositivo.
+        campos é o nome de um campo, e valores[pk] o seu valor, ou uma
+        sequência de nomes, e valores[pk] a tupla de valores na mesma
+        ordem. Assim como QuerySet.update, não chama save() nem envia
+        signals.
+        """
+        if not valores:
+            return
+
+        if isinstance(campos, str):
+            campos = (campos, )
+            valores = {pk: (valor, ) for pk, valor in valores.items()}
+
+        connection = connections[self.db]
+        fields = [self.model._meta.get_field(campo) for campo in campos]
+        sql = (
+            'UPDATE {tabela} AS d SET {atribuicoes} '
+            'FROM (VALUES {valores}) AS v(id, {colunas}) '
+            'WHERE d.{pk} = v.id').format(
+            tabela=connection.ops.quote_name(self.model._meta.db_table),
+            atribuicoes=', '.join(
+                '{} = v.v{}::{}'.format(
+                    connection.ops.quote_name(field.column), i,
+                    field.rel_db_type(connection))
+                for i, field in enumerate(fields)),
+            colunas=', '.join('v{}'.format(i) for i in range(len(fields))),
+            pk=connection.ops.quote_name(self.model._meta.pk.column),
+            valores=', '.join(
+                ['({})'.format(', '.join(['%s'] * (len(fields) + 1)))] *
+                len(valores)))
+
+        params = []
+        for pk, valores_pk in valores.items():
+            params.append(pk)
+            params += [field.get_db_prep_save(valor, connection)
+                       for field, valor in zip(fields, valores_pk)]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def gravar_numeracao(self, dispositivos):
+        """
+        Grava rotulo e dispositivo0..5 dos dispositivos, renumerados em
+        memória, com UPDATEs em lote. A validação de unicidade feita por
+        Dispositivo.clean é executada uma única vez para todo o lote, com
+        uma consulta aos demais dispositivos dos mesmos tipos. Antes da
+        gravação final, dispositivo0 recebe valores temporários acima dos
+        existentes, evitando conflitos transitórios entre os números
+        antigos e novos na restrição única do banco.
+        """
+        if not dispositivos:
+            return
+
+        from django.core.exceptions import ValidationError
+
+        pks = {d.pk for d in dispositivos}
+        ta_ids = {d.ta_id for d in dispositivos}
+
+        campos_unicos = [campos for campos in Dispositivo._meta.unique_together
+                         if 'dispositivo0' in campos]
+        colunas = {'{}_id'.format(c) if isinstance(
+            Dispositivo._meta.get_field(c), models.ForeignKey) else c
+            for campos in campos_unicos for c in campos}
+        colunas = sorted(colunas | {'pk'})
+
+        def chaves(valores):
+            for campos in campos_unicos:
+                if 'contagem_continua' in campos and \
+                        not valores['contagem_continua']:
+                    continue
+                yield tuple(valores['{}_id'.format(c)]
+                            if '{}_id'.format(c) in valores else valores[c]
+                            for c in campos)
+
+        existentes = set()
+        for valores in self.filter(
+                ta_id__in=ta_ids,
+                tipo_dispositivo_id__in={
+                    d.tipo_dispositivo_id for d in dispositivos}
+        ).exclude(pk__in=pks).values(*colunas):
+            existentes.update(chaves(valores))
+
+        for d in dispositivos:
+            for chave in chaves(
+                    {c: getattr(d, c) for c in colunas}):
+                if chave in existentes:
+                    raise ValidationError(d.unique_error_message(
+                        Dispositivo, ('ta', 'dispositivo0', 'dispositivo1',
+                                      'dispositivo2', 'dispositivo3',
+                                      'dispositivo4', 'dispositivo5',
+                                      'tipo_dispositivo')))
+                existentes.add(chave)
+
+        agora = timezone.now()
+        with transaction.atomic():
+            maior = self.filter(ta_id__in=ta_ids).aggregate(
+                Max('dispositivo0'))['dispositivo0__max'] or 0
+            self.atualizar_em_lote('dispositivo0', {
+                d.pk: maior + i for i, d in enumerate(dispositivos, 1)})
+            self.atualizar_em_lote(
+                ('rotulo', 'dispositivo0', 'dispositivo1', 'dispositivo2',
+                 'dispositivo3', 'dispositivo4', 'dispositivo5', 'modified'),
+                {d.pk: (d.rotulo, ) + tuple(d.get_numero_completo()) +
+                 (agora, ) for d in dispositivos})
+
+        for d in dispositivos:
+            d.modified = agora
+            if reversion.is_active():
+                reversion.add_to_revision(d)
+        transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
+
+
 @reversion.register()
 class Dispositivo(BaseModel, TimestampedMixin):
     TEXTO_PADRAO_DISPOSITIVO_REVOGADO = force_text(_('(Revogado)'))
@@ -1005,6 +1265,14 @@ class Dispositivo(BaseModel, TimestampedMixin):
         blank=True, null=True, default=None,
         related_name='nodes',
         verbose_name=_('Dispositivo Raiz'))
+    # caminho materializado: pks dos ascendentes, da raiz ao pai, no formato
+    # '/raiz/.../pai/' ('/' para dispositivos sem pai)
+    caminho = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        db_index=True,
+        verbose_name=_('Caminho na Árvore de Dispositivos'))
     dispositivo_vigencia = models.ForeignKey(
         'self',
         blank=True, null=True, default=None,
@@ -1021,10 +1289,18 @@ class Dispositivo(BaseModel, TimestampedMixin):
         default=False,
         choices=YES_NO_CHOICES, verbose_name=_('Contagem contínua'))
 
+    objects = DispositivoQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Dispositivo')
         verbose_name_plural = _('Dispositivos')
         ordering = ['ta', 'ordem']
+        indexes = [
+            # consultas do texto em uma data (DispositivoQuerySet.texto_em)
+            models.Index(
+                fields=['ta', 'inicio_vigencia', 'fim_vigencia'],
+                name='dispositivo_ta_vigencia_idx'),
+        ]
         unique_together = (
             ('ta', 'ordem',),
             ('ta',
@@ -1104,12 +1380,23 @@ class Dispositivo(BaseModel, TimestampedMixin):
                         self.__class__, tuple(unique_fields))
                     raise ValidationError(msg)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._caminho_salvo = instance.__dict__.get('caminho')
+        return instance
+
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None, clean=True):
 
-        self.dispositivo_raiz = self.get_raiz()
-        if self.dispositivo_raiz == self:
-            self.dispositivo_raiz = None
+        novo = self.pk is None
+        self.caminho = self.calcula_caminho()
+        ascendentes = self.get_ascendentes_pks()
+        raiz_id = ascendentes[0] if ascendentes else None
+        if raiz_id != self.dispositivo_raiz_id:
+            self.dispositivo_raiz_id = raiz_id
+            self.__dict__.pop(
+                Dispositivo.dispositivo_raiz.field.get_cache_name(), None)
 
         self.contagem_continua = self.tipo_dispositivo.contagem_continua
 
@@ -1122,19 +1409,74 @@ class Dispositivo(BaseModel, TimestampedMixin):
         except:
             pass
 
-        return super().save(
+        r = super().save(
             force_insert=force_insert, force_update=force_update, using=using,
             update_fields=update_fields, clean=clean)
 
+        caminho_salvo = getattr(self, '_caminho_salvo', None)
+        if not novo and caminho_salvo and caminho_salvo != self.caminho:
+            # o dispositivo mudou de pai: os caminhos dos descendentes são
+            # reescritos com um único UPDATE pelo prefixo antigo
+            prefixo = '{}{}/'.format(caminho_salvo, self.pk)
+            Dispositivo.objects.filter(
+                caminho__startswith=prefixo
+            ).update(
+                caminho=Concat(
+                    Value(self.caminho_descendentes),
+                    Substr('caminho', len(prefixo) + 1),
+                    output_field=models.CharField()),
+                dispositivo_raiz_id=self.dispositivo_raiz_id or self.pk)
+        self._caminho_salvo = self.caminho
+
+        return r
+
     def __str__(self):
         return '%(rotulo)s' % {
             'rotulo': (self.rotulo if self.rotulo else self.tipo_dispositivo)}
 
-    def get_raiz(self):
+    @property
+    def caminho_descendentes(self):
+        """
+        Prefixo do caminho de todos os descendentes deste dispositivo.
+        """
+        return '{}{}/'.format(self.caminho or '/', self.pk)
+
+    def calcula_caminho(self):
+        if self.dispositivo_pai_id is None:
+            return '/'
+        pai = self.dispositivo_pai
+        if not pai.caminho:
+            # pai ainda sem caminho materializado
+            pai.caminho = pai.calcula_caminho()
+        return pai.caminho_descendentes
+
+    def get_ascendentes_pks(self):
+        """
+        pks dos ascendentes, da raiz ao pai, lidos do caminho materializado
+        quando este está coerente com dispositivo_pai.
+        """
+        pks = [int(pk) for pk in self.caminho.split('/') if pk]
+        if (pks[-1] if pks else None) == self.dispositivo_pai_id:
+            return pks
+
+        pks = []
         dp = self
         while dp.dispositivo_pai is not None:
             dp = dp.dispositivo_pai
-        return dp
+            pks.insert(0, dp.pk)
+        return pks
+
+    def descendentes(self):
+        return Dispositivo.objects.filter(
+            caminho__startswith=self.caminho_descendentes)
+
+    def get_raiz(self):
+        ascendentes = self.get_ascendentes_pks()
+        if not ascendentes:
+            return self
+        if len(ascendentes) == 1:
+            return self.dispositivo_pai
+        return Dispositivo.objects.get(pk=ascendentes[0])
 
     def rotulo_padrao(self, local_insert=0, for_insert_in=0):
         """
@@ -1403,8 +1745,16 @@ class Dispositivo(BaseModel, TimestampedMixin):
 
         return result
 
-    def criar_espaco(self, espaco_a_criar, local=None):
-
+    def alocar_ordens(self, quantidade, local=None):
+        """
+        Reserva quantidade valores de ordem, crescentes, para dispositivos
+        a serem inseridos conforme local (veja os ramos abaixo). Os valores
+        são distribuídos no intervalo livre entre o dispositivo anterior e
+        o próximo bloco, sem alterar nenhum registro. Somente quando o
+        intervalo se esgota, os dispositivos seguintes são deslocados em
+        INTERVALO_ORDEM * quantidade, o que reabre espaço para as próximas
+        inserções naquele ponto.
+        """
         if local == 'json_add_next':
             proximo_bloco = Dispositivo.objects.filter(
                 ordem__gt=self.ordem,
@@ -1425,17 +1775,7 @@ class Dispositivo(BaseModel, TimestampedMixin):
                 ordem__gte=self.ordem,
                 ta_id=self.ta_id).first()
 
-        if proximo_bloco:
-            ordem = proximo_bloco.ordem
-            proximo_bloco = Dispositivo.objects.order_by('-ordem').filter(
-                ordem__gte=ordem,
-                ta_id=self.ta_id)
-
-            proximo_bloco.update(ordem=F('ordem') + 1)
-            proximo_bloco.update(
-                ordem=F('ordem') + (
-                    Dispositivo.INTERVALO_ORDEM * espaco_a_criar - 1))
-        else:
+        if not proximo_bloco:
             # inserção no fim do ta
             ordem_max = Dispositivo.objects.order_by(
                 'ordem').filter(
@@ -1444,33 +1784,78 @@ class Dispositivo(BaseModel, TimestampedMixin):
             if ordem_max['ordem__max'] is None:
                 raise Exception(
                     _('Não existem registros base neste Texto Articulado'))
-            ordem = ordem_max['ordem__max'] + Dispositivo.INTERVALO_ORDEM
-        return ordem
+            return [ordem_max['ordem__max'] + Dispositivo.INTERVALO_ORDEM * i
+                    for i in range(1, quantidade + 1)]
+
+        ordem = proximo_bloco.ordem
+        anterior = Dispositivo.objects.filter(
+            ordem__lt=ordem,
+            ta_id=self.ta_id).aggregate(Max('ordem'))['ordem__max'] or 0
+
+        intervalo = ordem - anterior
+        if intervalo <= quantidade:
+            # rebalanceamento: intervalo esgotado, abre espaço deslocando
+            # os dispositivos seguintes
+            proximo_bloco = Dispositivo.objects.order_by('-ordem').filter(
+                ordem__gte=ordem,
+                ta_id=self.ta_id)
+
+            proximo_bloco.update(ordem=F('ordem') + 1)
+            proximo_bloco.update(
+                ordem=F('ordem') + (
+                    Dispositivo.INTERVALO_ORDEM * quantidade - 1))
+            intervalo += Dispositivo.INTERVALO_ORDEM * quantidade
+
+        passo = intervalo // (quantidade + 1)
+        return [anterior + passo * i for i in range(1, quantidade + 1)]
+
+    def criar_espaco(self, espaco_a_criar, local=None):
+        return self.alocar_ordens(espaco_a_criar, local)[0]
 
     def organizar_niveis(self):
+        """
+        Ajusta o nível deste dispositivo ao do pai e o de todos os seus
+        descendentes, percorridos em largura com uma consulta por nível da
+        árvore e gravados com um único UPDATE em lote.
+        """
         if self.dispositivo_pai is None:
             self.nivel = 0
         else:
             self.nivel = self.dispositivo_pai.nivel + 1
 
-        filhos = Dispositivo.objects.filter(
-            dispositivo_pai_id=self.pk)
-
-        for filho in filhos:
-            filho.nivel = self.nivel + 1
-            filho.save()
-            filho.organizar_niveis()
+        niveis = {}
+        visitados = {self.pk}
+        pais = [self.pk]
+        nivel = self.nivel
+        while pais:
+            nivel += 1
+            filhos = list(Dispositivo.objects.filter(
+                dispositivo_pai_id__in=pais).exclude(
+                pk__in=visitados).values_list('pk', 'nivel', 'ta_id'))
+            pais = [pk for pk, nivel_atual, ta_id in filhos]
+            visitados.update(pais)
+            niveis.update({
+                pk: (nivel, ta_id) for pk, nivel_atual, ta_id in filhos
+                if nivel_atual != nivel})
+
+        if niveis:
+            Dispositivo.objects.atualizar_em_lote(
+                'nivel', {pk: nivel for pk, (nivel, ta_id) in niveis.items()})
+            ta_ids = {ta_id for nivel, ta_id in niveis.values()}
+            transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
 
     def get_parents(self, ordem='desc'):
-        dp = self
-        p = []
-        while dp.dispositivo_pai:
-            dp = dp.dispositivo_pai
-            if ordem == 'desc':
-                p.append(dp)
-            else:
-                p.insert(0, dp)
+        ascendentes = self.get_ascendentes_pks()
+        dpts = Dispositivo.objects.in_bulk(ascendentes)
+        p = [dpts[pk] for pk in ascendentes]
+
+        # liga os ascendentes entre si para que dispositivo_pai não consulte
+        # novamente o banco
+        for pai, filho in zip(p, p[1:]):
+            filho.dispositivo_pai = pai
 
+        if ordem == 'desc':
+            p.reverse()
         return p
 
     def get_parents_asc(self):
@@ -1580,8 +1965,7 @@ class Dispositivo(BaseModel, TimestampedMixin):
                 self.dispositivo0 = 1
                 self.rotulo = self.rotulo_padrao()
 
-            irmao.clean()
-            irmao.save()
+        Dispositivo.objects.gravar_numeracao(irmaos_a_salvar)
 
     def select_roots(self):
         return Dispositivo.objects.order_by(
@@ -1716,6 +2100,11 @@ class Dispositivo(BaseModel, TimestampedMixin):
             Dispositivo.objects.filter(pk=d).update(
                 ordem_bloco_atualizador=count)
 
+        # update() não dispara post_save
+        ta_ids = {self.ta_id} | set(Dispositivo.objects.filter(
+            pk__in=filhos).values_list('ta_id', flat=True))
+        transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
+
 
 @reversion.register()
 class Vide(TimestampedMixin):
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from sapl.compilacao.models import (Dispositivo, Nota, TextoArticulado,
+                                    TipoDispositivo, Vide)
+from sapl.compilacao.utils import (incrementa_revisao_ta,
+                                   incrementa_revisao_tipos_dispositivo)
+
+
+# as revisões são trocadas somente após o commit, para que nenhum dado em
+# cache seja montado sob a nova revisão com linhas ainda não visíveis
+
+
+@receiver(post_save, sender=Dispositivo)
+@receiver(post_delete, sender=Dispositivo)
+def altera_revisao_ta(sender, instance, **kwargs):
+    # alterações publicadas em outro texto também compõem o texto de destino
+    ta_ids = [instance.ta_id, instance.ta_publicado_id]
+
+    # os vides exibem o dispositivo no texto que o cita e no citado
+    if not kwargs.get('created'):
+        for ta_ids_vide in Vide.objects.filter(
+                Q(dispositivo_base_id=instance.pk) |
+                Q(dispositivo_ref_id=instance.pk)).values_list(
+                'dispositivo_base__ta_id', 'dispositivo_ref__ta_id'):
+            ta_ids.extend(ta_ids_vide)
+
+    transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
+
+
+@receiver(post_save, sender=Nota)
+@receiver(post_delete, sender=Nota)
+@receiver(post_save, sender=Vide)
+@receiver(post_delete, sender=Vide)
+def altera_revisao_ta_nota_vide(sender, instance, **kwargs):
+    if sender is Nota:
+        dispositivos = [instance.dispositivo_id]
+    else:
+        dispositivos = [instance.dispositivo_base_id,
+                        instance.dispositivo_ref_id]
+    ta_ids = list(Dispositivo.objects.filter(
+        pk__in=dispositivos).values_list('ta_id', flat=True))
+    transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
+
+
+@receiver(post_save, sender=TextoArticulado)
+def altera_revisao_ta_texto(sender, instance, **kwargs):
+    # o nome do texto aparece nas notas de alteração dos textos alterados
+    ta_ids = [instance.pk] + list(Dispositivo.objects.filter(
+        ta_publicado=instance).order_by().values_list(
+        'ta_id', flat=True).distinct())
+    transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
+
+
+@receiver(post_save, sender=TipoDispositivo)
+@receiver(post_delete, sender=TipoDispositivo)
+def altera_revisao_tipos_dispositivo(sender, instance, **kwargs):
+    transaction.on_commit(incrementa_revisao_tipos_dispositivo)
@@ -1,11 +1,13 @@
 
 from django import template
+from django.core.cache import cache
 from django.core.signing import Signer
 from django.db.models import Q
 from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 
 from sapl.compilacao.models import Dispositivo
+from sapl.compilacao.utils import COMPILACAO_CACHE_TIMEOUT, get_revisao_ta
 
 register = template.Library()
 
@@ -63,6 +65,19 @@ def get_bloco_atualizador(pk_atualizador):
         Q(dispositivo_atualizador_id=pk_atualizador)).select_related()
 
 
+@register.simple_tag(takes_context=True)
+def bloco_atualizador(context, pk_atualizador):
+    """
+    Dispositivos do bloco de alteração. Usa blocos_atualizadores do contexto
+    quando a view já os carregou para todo o texto, evitando uma consulta
+    por bloco.
+    """
+    blocos = context.get('blocos_atualizadores')
+    if blocos is not None and pk_atualizador in blocos:
+        return blocos[pk_atualizador]
+    return get_bloco_atualizador(pk_atualizador)
+
+
 @register.simple_tag
 def dispositivo_desativado(dispositivo, inicio_vigencia, fim_vigencia):
     if inicio_vigencia and fim_vigencia:
@@ -180,68 +195,65 @@ def nomenclatura(d):
     return result
 
 
-def update_dispositivos_parents(dpts_parents, ta_id):
-
-    dpts = Dispositivo.objects.order_by('ordem').filter(
-        ta_id=ta_id).values_list(
-        'pk', 'dispositivo_pai_id', 'rotulo', 'tipo_dispositivo__nome',
-        'tipo_dispositivo__rotulo_prefixo_texto')
-
-    for d in dpts:
-        dpts_parents[str(d[0])] = {
-            'd': d, 'p': [], 'h': None}
-
-    def parents(k):
-        pai = dpts_parents[str(k)]['d'][1]
-        p = dpts_parents[str(k)]['p']
-        if not p:
-            if pai:
-                parent_k = [pai, ] + parents(pai)
-            else:
-                parent_k = []
-        else:
-            parent_k = p
-
-        return parent_k
-
-    for k in dpts_parents:
-        dpts_parents[str(k)]['p'] = parents(k)
+def get_estrutura_heranca(ta_id, request=None):
+    """
+    Retorna o índice {pk: (pai, rotulo, nome do tipo, prefixo do tipo)} dos
+    dispositivos de um Texto Articulado. O índice é compartilhado entre
+    processos e usuários pelo cache, valendo enquanto a revisão do texto
+    não mudar, e memorizado no request para as demais chamadas da página.
+    """
+    memo = getattr(request, '_estruturas_heranca', None)
+    if memo is None:
+        memo = {}
+        if request is not None:
+            request._estruturas_heranca = memo
+
+    if ta_id in memo:
+        return memo[ta_id]
+
+    chave = 'compilacao:ta:{}:heranca:{}'.format(ta_id, get_revisao_ta(ta_id))
+    estrutura = cache.get(chave)
+    if estrutura is None:
+        estrutura = monta_estrutura_heranca(ta_id)
+        cache.set(chave, estrutura, COMPILACAO_CACHE_TIMEOUT)
+
+    memo[ta_id] = estrutura
+    return estrutura
+
+
+def monta_estrutura_heranca(ta_id):
+    return {
+        d[0]: d[1:] for d in Dispositivo.objects.filter(
+            ta_id=ta_id).values_list(
+            'pk', 'dispositivo_pai_id', 'rotulo', 'tipo_dispositivo__nome',
+            'tipo_dispositivo__rotulo_prefixo_texto')}
+
+
+def get_ascendencia(d, request=None):
+    """
+    Retorna o índice de herança do texto de d e a lista de pks de d e de
+    seus ascendentes, do próprio dispositivo até a raiz.
+    """
+    estrutura = get_estrutura_heranca(d.ta_id, request)
+    if d.pk not in estrutura:
+        # dispositivo ainda não visível na revisão em cache: lê do banco,
+        # sem gravar no cache
+        estrutura = monta_estrutura_heranca(d.ta_id)
+        if request is not None:
+            request._estruturas_heranca[d.ta_id] = estrutura
+
+    pks = []
+    pk = d.pk
+    while pk is not None and pk in estrutura:
+        pks.append(pk)
+        pk = estrutura[pk][0]
+    return estrutura, pks
 
 
 @register.simple_tag
 def heranca(request, d, ignore_ultimo=0, ignore_primeiro=0):
-    ta_dpts_parents = request.session.get('herancas')
-
-    if not ta_dpts_parents:
-        ta_dpts_parents = {}
-
-    ta_id = str(d.ta_id)
-    d_pk = str(d.pk)
-    if ta_id not in ta_dpts_parents or d_pk not in ta_dpts_parents[ta_id]:
-        # print('recarregando estrutura temporaria de heranças')
-        dpts_parents = {}
-        ta_dpts_parents[ta_id] = dpts_parents
-        update_dispositivos_parents(dpts_parents, ta_id)
-
-        herancas_fila = request.session.get('herancas_fila')
-        if not herancas_fila:
-            herancas_fila = []
-
-        herancas_fila.append(ta_id)
-        if len(herancas_fila) > 100:
-            ta_remove = herancas_fila.pop(0)
-            del ta_dpts_parents[str(ta_remove)]
-
-        request.session['herancas_fila'] = herancas_fila
-        request.session['herancas'] = ta_dpts_parents
-
-    h = ta_dpts_parents[ta_id][d_pk]['h']
-
-    if h:
-        return h
-
-    dpts_parents = ta_dpts_parents[ta_id]
-    parents = dpts_parents[d_pk]['p']
+    dpts_parents, pks = get_ascendencia(d, request)
+    parents = pks[1:]
     result = ''
 
     if parents:
@@ -255,40 +267,40 @@ def heranca(request, d, ignore_ultimo=0, ignore_primeiro=0):
             ignore_primeiro = 0
             continue
 
-        p = dpts_parents[str(pk)]['d']
+        p = dpts_parents[pk]
 
-        if p[4] != '':
-            result = p[2] + ' ' + result
+        if p[3] != '':
+            result = p[1] + ' ' + result
         else:
-            result = '(' + p[3] + ' ' + \
-                p[2] + ')' + ' ' + result
+            result = '(' + p[2] + ' ' + \
+                p[1] + ')' + ' ' + result
 
-    dpts_parents[d_pk]['h'] = result
     return result
 
 
 @register.simple_tag
 def nomenclatura_heranca(d, ignore_ultimo=0, ignore_primeiro=0):
+    estrutura, pks = get_ascendencia(d)
     result = ''
-    while d is not None:
+    for pk in pks:
+        pai_id, rotulo, nome, prefixo = estrutura[pk]
 
-        if ignore_ultimo and d.dispositivo_pai is None:
+        if ignore_ultimo and pai_id is None:
             break
         if ignore_primeiro:
             ignore_primeiro = 0
-            d = d.dispositivo_pai
             continue
 
-        if d.rotulo != '':
-            if d.tipo_dispositivo.rotulo_prefixo_texto != '':
-                result = d.rotulo + ' ' + result
+        if rotulo != '':
+            if prefixo != '':
+                result = rotulo + ' ' + result
             else:
-                result = '(' + d.tipo_dispositivo.nome + ' ' + \
-                    d.rotulo + ')' + ' ' + result
+                result = '(' + nome + ' ' + \
+                    rotulo + ')' + ' ' + result
         else:
-            result = '(' + d.tipo_dispositivo.nome + \
-                d.rotulo_padrao() + ')' + ' ' + result
-        d = d.dispositivo_pai
+            dispositivo = d if pk == d.pk else Dispositivo.objects.get(pk=pk)
+            result = '(' + nome + \
+                dispositivo.rotulo_padrao() + ')' + ' ' + result
 
     return result
 
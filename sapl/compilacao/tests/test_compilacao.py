@@ -1,4 +1,9 @@
+import json
+
 import pytest
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from model_mommy import mommy
 
 from sapl.compilacao.models import PerfilEstruturalTextoArticulado
@@ -6,6 +11,10 @@ from sapl.compilacao.models import TipoTextoArticulado
 from sapl.compilacao.models import TextoArticulado, TipoNota
 from sapl.compilacao.models import TipoVide, TipoDispositivo
 from sapl.compilacao.models import TipoDispositivoRelationship
+from sapl.compilacao.models import Dispositivo, Nota, Vide
+from sapl.compilacao.templatetags.compilacao_filters import heranca
+from sapl.compilacao.utils import get_revisao_ta
+from sapl.compilacao.views import DispositivoDinamicEditView
 
 
 @pytest.mark.django_db(transaction=False)
@@ -110,3 +119,333 @@ def test_tipo_dispositivo_relationship_model():
     assert tipo_dispositivo_relationship.pai == tipo_dispositivo_pai
     assert tipo_dispositivo_relationship.perfil == p_e_texto_articulado
     assert tipo_dispositivo_relationship.filho_permitido == t_dispositivo_filho
+
+
+@pytest.mark.django_db(transaction=True)
+def test_heranca_usa_indice_compartilhado_por_revisao_do_ta(rf):
+    ta = mommy.make(TextoArticulado)
+    tipo = mommy.make(TipoDispositivo, nome='Capítulo',
+                      rotulo_prefixo_texto='')
+    capitulo = mommy.make(Dispositivo, ta=ta, ordem=1, rotulo='I',
+                          tipo_dispositivo=tipo)
+    artigo = mommy.make(Dispositivo, ta=ta, ordem=2, rotulo='Art. 1º',
+                        dispositivo_pai=capitulo)
+
+    assert heranca(rf.get('/'), artigo) == '(Capítulo I) '
+
+    revisao = get_revisao_ta(ta.pk)
+    capitulo.rotulo = 'II'
+    capitulo.save()
+    assert get_revisao_ta(ta.pk) != revisao
+
+    # outro request, sem memória local, enxerga a nova revisão
+    assert heranca(rf.get('/'), artigo) == '(Capítulo II) '
+
+
+@pytest.mark.django_db(transaction=False)
+def test_heranca_le_do_banco_dispositivo_fora_do_indice(rf):
+    ta = mommy.make(TextoArticulado)
+    tipo = mommy.make(TipoDispositivo, nome='Capítulo',
+                      rotulo_prefixo_texto='')
+    capitulo = mommy.make(Dispositivo, ta=ta, ordem=1, rotulo='I',
+                          tipo_dispositivo=tipo)
+    heranca(rf.get('/'), capitulo)
+
+    # bulk_create não dispara os signals que trocam a revisão
+    [artigo] = Dispositivo.objects.bulk_create([mommy.prepare(
+        Dispositivo, ta=ta, ordem=2, rotulo='Art. 1º',
+        dispositivo_pai=capitulo, tipo_dispositivo=tipo)])
+    revisao = get_revisao_ta(ta.pk)
+
+    assert heranca(rf.get('/'), artigo) == '(Capítulo I) '
+    assert get_revisao_ta(ta.pk) == revisao
+
+
+@pytest.mark.django_db(transaction=True)
+def test_revisao_ta_muda_com_notas_e_vides():
+    ta_a, ta_b = mommy.make(TextoArticulado, _quantity=2)
+    dpt_a = mommy.make(Dispositivo, ta=ta_a, ordem=1)
+    dpt_b = mommy.make(Dispositivo, ta=ta_b, ordem=1)
+
+    revisoes = get_revisao_ta(ta_a.pk), get_revisao_ta(ta_b.pk)
+    mommy.make(Nota, dispositivo=dpt_a)
+    assert get_revisao_ta(ta_a.pk) != revisoes[0]
+    assert get_revisao_ta(ta_b.pk) == revisoes[1]
+
+    revisoes = get_revisao_ta(ta_a.pk), get_revisao_ta(ta_b.pk)
+    mommy.make(Vide, dispositivo_base=dpt_a, dispositivo_ref=dpt_b)
+    assert get_revisao_ta(ta_a.pk) != revisoes[0]
+    assert get_revisao_ta(ta_b.pk) != revisoes[1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_revisao_ta_muda_somente_apos_o_commit():
+    ta = mommy.make(TextoArticulado)
+    revisao = get_revisao_ta(ta.pk)
+
+    with transaction.atomic():
+        mommy.make(Dispositivo, ta=ta, ordem=1)
+        assert get_revisao_ta(ta.pk) == revisao
+
+    assert get_revisao_ta(ta.pk) != revisao
+
+
+@pytest.mark.django_db(transaction=True)
+def test_revisao_ta_muda_ao_ordenar_bloco_de_alteracao():
+    ta = mommy.make(TextoArticulado)
+    tipo = mommy.make(TipoDispositivo, dispositivo_de_articulacao=True,
+                      dispositivo_de_alteracao=True)
+    bloco = mommy.make(Dispositivo, ta=ta, ordem=1, tipo_dispositivo=tipo)
+    mommy.make(Dispositivo, ta=ta, ordem=2, dispositivo_pai=bloco,
+               ordem_bloco_atualizador=5)
+
+    revisao = get_revisao_ta(ta.pk)
+    bloco.ordenar_bloco_alteracao()
+    assert get_revisao_ta(ta.pk) != revisao
+
+
+@pytest.mark.django_db(transaction=False)
+def test_acao_json_retorna_alteracoes_nos_dispositivos(rf):
+    ta = mommy.make(TextoArticulado)
+    tipo = mommy.make(TipoDispositivo, nome='Artigo',
+                      rotulo_prefixo_texto='')
+    pai = mommy.make(Dispositivo, ta=ta, ordem=1, nivel=0,
+                     tipo_dispositivo=tipo)
+    art1, art2, art3 = [
+        mommy.make(Dispositivo, ta=ta, ordem=ordem, nivel=1,
+                   rotulo='Art. %sº' % (ordem - 1), dispositivo_pai=pai,
+                   tipo_dispositivo=tipo)
+        for ordem in (2, 3, 4)]
+
+    def exclui_e_renumera(context):
+        art2.delete()
+        art3.rotulo = 'Art. 2º'
+        art3.save()
+        novo = mommy.make(Dispositivo, ta=ta, ordem=5, nivel=1,
+                          rotulo='Art. 3º', dispositivo_pai=pai,
+                          tipo_dispositivo=tipo)
+        return {'pk': novo.pk, 'pai': [pai.pk, ]}
+
+    view = DispositivoDinamicEditView()
+    view.request = rf.get('/')
+    view.request.session = {}
+    view.kwargs = {'ta_id': str(ta.pk), 'dispositivo_id': str(art2.pk)}
+    view.json_delete_item_dispositivo = exclui_e_renumera
+    art2_pk = art2.pk
+
+    response = view.render_to_json_response(
+        {'action': 'json_delete_item_dispositivo'})
+    alteracoes = json.loads(response.content.decode())['alteracoes']
+
+    assert alteracoes['removidos'] == [art2_pk]
+    assert alteracoes['alterados'] == [{
+        'pk': art3.pk, 'ordem': 4, 'rotulo': 'Art. 2º', 'nivel': 1,
+        'pai': pai.pk, 'publicado': False, 'auto_inserido': False,
+        'titulo': 'Artigo Art. 2º'}]
+    [novo] = alteracoes['inseridos']
+    assert (novo['ordem'], novo['rotulo'], novo['pai']) == (
+        5, 'Art. 3º', pai.pk)
+    assert art1.pk not in [
+        d['pk'] for d in alteracoes['alterados'] + alteracoes['inseridos']]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_acao_json_sem_alteracao_estrutural_nao_retorna_alteracoes(rf):
+    ta = mommy.make(TextoArticulado)
+    dpt = mommy.make(Dispositivo, ta=ta, ordem=1)
+
+    view = DispositivoDinamicEditView()
+    view.request = rf.get('/')
+    view.request.session = {}
+    view.kwargs = {'ta_id': str(ta.pk), 'dispositivo_id': str(dpt.pk)}
+
+    response = view.render_to_json_response({'action': 'json_get_perfis'})
+    assert 'alteracoes' not in json.loads(response.content.decode())
+
+
+@pytest.mark.django_db(transaction=False)
+def test_texto_em_data_pelo_indice_de_intervalos_de_vigencia():
+    from datetime import date
+
+    ta = mommy.make(TextoArticulado)
+    original = mommy.make(Dispositivo, ta=ta, ordem=1,
+                          inicio_vigencia=date(2010, 1, 1),
+                          fim_vigencia=date(2014, 12, 31))
+    alterado = mommy.make(Dispositivo, ta=ta, ordem=2,
+                          inicio_vigencia=date(2015, 1, 1),
+                          fim_vigencia=None)
+
+    intervalos = Dispositivo.objects.intervalos_vigencia(ta.pk)
+    assert [(i.inicio_vigencia, i.fim_vigencia) for i in intervalos] == [
+        (date(2010, 1, 1), date(2014, 12, 31)),
+        (date(2015, 1, 1), None)]
+
+    assert Dispositivo.objects.intervalo_vigencia_em(
+        ta.pk, date(2009, 1, 1)) is None
+    intervalo = Dispositivo.objects.intervalo_vigencia_em(
+        ta.pk, date(2012, 6, 1))
+    assert intervalo.inicio_vigencia == date(2010, 1, 1)
+
+    texto = Dispositivo.objects.filter(ta=ta)
+    assert list(texto.texto_em(date(2012, 6, 1))) == [original]
+    assert list(texto.texto_em(date(2016, 1, 1))) == [original, alterado]
+    assert list(texto.texto_em(
+        date(2016, 1, 1), somente_vigentes=True)) == [alterado]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_reordenar_dispositivos_em_pre_ordem():
+    ta = mommy.make(TextoArticulado)
+    titulo = mommy.make(Dispositivo, ta=ta, ordem=10)
+    outro_titulo = mommy.make(Dispositivo, ta=ta, ordem=20)
+    artigo = mommy.make(Dispositivo, ta=ta, ordem=30,
+                        dispositivo_pai=titulo)
+
+    ta.reordenar_dispositivos()
+
+    assert list(Dispositivo.objects.filter(ta=ta).order_by(
+        'ordem').values_list('pk', 'ordem')) == [
+        (titulo.pk, Dispositivo.INTERVALO_ORDEM),
+        (artigo.pk, 2 * Dispositivo.INTERVALO_ORDEM),
+        (outro_titulo.pk, 3 * Dispositivo.INTERVALO_ORDEM)]
+
+    ta.reagrupar_ordem_de_dispositivos()
+
+    assert list(Dispositivo.objects.filter(ta=ta).order_by(
+        'ordem').values_list('pk', flat=True)) == [
+        titulo.pk, artigo.pk, outro_titulo.pk]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_reagrupar_ordem_com_ordem_zero():
+    ta = mommy.make(TextoArticulado)
+    primeiro = mommy.make(Dispositivo, ta=ta, ordem=0)
+    segundo = mommy.make(Dispositivo, ta=ta, ordem=500)
+
+    # sem folga no deslocamento, 0 + 2 * INTERVALO_ORDEM colidiria com a
+    # nova ordem do segundo dispositivo
+    ta.reagrupar_ordem_de_dispositivos()
+
+    assert list(Dispositivo.objects.filter(ta=ta).order_by(
+        'ordem').values_list('pk', 'ordem')) == [
+        (primeiro.pk, Dispositivo.INTERVALO_ORDEM),
+        (segundo.pk, 2 * Dispositivo.INTERVALO_ORDEM)]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_reservar_ids_permite_inserir_arvore_em_lote():
+    ta = mommy.make(TextoArticulado)
+    tipo = mommy.make(TipoDispositivo)
+    pai_id, filho_id = Dispositivo.objects.reservar_ids(2)
+    assert pai_id != filho_id
+
+    Dispositivo.objects.bulk_create([
+        mommy.prepare(Dispositivo, id=filho_id, ta=ta, ordem=2,
+                      tipo_dispositivo=tipo, dispositivo_pai_id=pai_id),
+        mommy.prepare(Dispositivo, id=pai_id, ta=ta, ordem=1,
+                      tipo_dispositivo=tipo),
+    ])
+
+    assert Dispositivo.objects.get(pk=filho_id).dispositivo_pai_id == pai_id
+
+
+@pytest.mark.django_db(transaction=False)
+def test_blocos_atualizadores_agrupa_em_uma_consulta():
+    ta = mommy.make(TextoArticulado)
+    bloco, outro_bloco = mommy.make(Dispositivo, ta=ta, _quantity=2)
+    segundo = mommy.make(Dispositivo, ordem_bloco_atualizador=2,
+                         dispositivo_pai=bloco)
+    primeiro = mommy.make(Dispositivo, ordem_bloco_atualizador=1,
+                          dispositivo_atualizador=bloco)
+    mommy.make(Dispositivo, dispositivo_pai=outro_bloco,
+               dispositivo_atualizador=outro_bloco)
+
+    with CaptureQueriesContext(connection) as consultas:
+        blocos = Dispositivo.objects.blocos_atualizadores(
+            [bloco.pk, outro_bloco.pk])
+    assert len(consultas) == 1
+
+    assert blocos[bloco.pk] == [primeiro, segundo]
+    assert len(blocos[outro_bloco.pk]) == 1
+
+
+@pytest.mark.django_db(transaction=False)
+def test_alocar_ordens_usa_intervalo_livre_entre_dispositivos():
+    ta = mommy.make(TextoArticulado)
+    anterior = mommy.make(Dispositivo, ta=ta, ordem=1000)
+    seguinte = mommy.make(Dispositivo, ta=ta, ordem=2000)
+
+    assert seguinte.alocar_ordens(3) == [1250, 1500, 1750]
+    seguinte.refresh_from_db()
+    assert seguinte.ordem == 2000
+
+    seguinte.ordem = 1001
+    seguinte.save()
+    assert Dispositivo.objects.textos_a_reagrupar(2) == [ta.pk]
+
+    # intervalo esgotado: os seguintes são deslocados
+    assert seguinte.alocar_ordens(1) == [1500]
+    seguinte.refresh_from_db()
+    anterior.refresh_from_db()
+    assert (anterior.ordem, seguinte.ordem) == (1000, 2001)
+
+
+@pytest.mark.django_db(transaction=False)
+def test_gravar_numeracao_em_lote_valida_unicidade():
+    ta = mommy.make(TextoArticulado)
+    tipo = mommy.make(TipoDispositivo, contagem_continua=False)
+    pai = mommy.make(Dispositivo, ta=ta, tipo_dispositivo=tipo, ordem=1)
+    primeiro, segundo, terceiro = [
+        mommy.make(Dispositivo, ta=ta, tipo_dispositivo=tipo, ordem=i + 2,
+                   dispositivo_pai=pai, dispositivo0=i)
+        for i in range(1, 4)]
+
+    # 2 -> 3 e 3 -> 4: números antigos e novos se sobrepõem no lote
+    for d in (segundo, terceiro):
+        d.dispositivo0 += 1
+        d.rotulo = str(d.dispositivo0)
+    Dispositivo.objects.gravar_numeracao([segundo, terceiro])
+
+    assert list(pai.dispositivos_filhos_set.order_by('ordem').values_list(
+        'dispositivo0', 'rotulo')) == [(1, ''), (3, '3'), (4, '4')]
+
+    primeiro.dispositivo0 = 3
+    with pytest.raises(ValidationError):
+        Dispositivo.objects.gravar_numeracao([primeiro])
+
+
+@pytest.mark.django_db(transaction=False)
+def test_organizar_niveis_atualiza_descendentes_em_lote():
+    ta = mommy.make(TextoArticulado)
+    raiz = mommy.make(Dispositivo, ta=ta, ordem=1, nivel=0)
+    filho = mommy.make(Dispositivo, ta=ta, ordem=2, nivel=5,
+                       dispositivo_pai=raiz)
+    neto = mommy.make(Dispositivo, ta=ta, ordem=3, nivel=0,
+                      dispositivo_pai=filho)
+
+    raiz.organizar_niveis()
+
+    filho.refresh_from_db()
+    neto.refresh_from_db()
+    assert (raiz.nivel, filho.nivel, neto.nivel) == (0, 1, 2)
+
+
+@pytest.mark.django_db(transaction=False)
+def test_caminho_materializado_acompanha_mudanca_de_pai():
+    ta = mommy.make(TextoArticulado)
+    titulo, outro_titulo = mommy.make(Dispositivo, ta=ta, _quantity=2)
+    capitulo = mommy.make(Dispositivo, ta=ta, dispositivo_pai=titulo)
+    artigo = mommy.make(Dispositivo, ta=ta, dispositivo_pai=capitulo)
+
+    assert artigo.caminho == '/{}/{}/'.format(titulo.pk, capitulo.pk)
+    assert artigo.dispositivo_raiz_id == titulo.pk
+    assert artigo.get_parents() == [capitulo, titulo]
+    assert list(titulo.descendentes().order_by('pk')) == [capitulo, artigo]
+
+    capitulo.dispositivo_pai = outro_titulo
+    capitulo.save()
+
+    artigo.refresh_from_db()
+    assert artigo.caminho == '/{}/{}/'.format(outro_titulo.pk, capitulo.pk)
+    assert artigo.dispositivo_raiz_id == outro_titulo.pk
+    assert not titulo.descendentes().exists()
@@ -1,4 +1,11 @@
 import sys
+import uuid
+
+from django.core.cache import cache
+
+COMPILACAO_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+CHAVE_REVISAO_TIPOS_DISPOSITIVO = 'compilacao:tipos_dispositivo:revisao'
 
 DISPOSITIVO_SELECT_RELATED = (
     'tipo_dispositivo',
@@ -66,3 +73,35 @@ def get_integrations_view_names():
                         if 'IntegracaoTaView' in str(base):
                             result.append(v)
     return result
+
+
+def chave_revisao_ta(ta_id):
+    return 'compilacao:ta:{}:revisao'.format(ta_id)
+
+
+def get_revisao_ta(ta_id):
+    """
+    Retorna a revisão atual da estrutura de um Texto Articulado. A revisão
+    é um identificador opaco, trocado por incrementa_revisao_ta sempre que
+    um dispositivo do texto (ou um tipo de dispositivo) é alterado, e
+    compõe as chaves dos dados derivados do texto guardados em cache.
+    """
+    chaves = [chave_revisao_ta(ta_id), CHAVE_REVISAO_TIPOS_DISPOSITIVO]
+    revisoes = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in revisoes:
+            cache.add(chave, uuid.uuid4().hex, COMPILACAO_CACHE_TIMEOUT)
+            revisoes[chave] = cache.get(chave)
+    return '{}{}'.format(*[revisoes[chave] for chave in chaves])
+
+
+def incrementa_revisao_ta(*ta_ids):
+    for ta_id in ta_ids:
+        if ta_id:
+            cache.set(chave_revisao_ta(ta_id), uuid.uuid4().hex,
+                      COMPILACAO_CACHE_TIMEOUT)
+
+
+def incrementa_revisao_tipos_dispositivo():
+    cache.set(CHAVE_REVISAO_TIPOS_DISPOSITIVO, uuid.uuid4().hex,
+              COMPILACAO_CACHE_TIMEOUT)
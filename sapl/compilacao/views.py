@@ -10,6 +10,7 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.signing import Signer
 from django.core.urlresolvers import reverse, reverse_lazy
@@ -19,8 +20,10 @@ from django.db.models.query import QuerySet
 from django.http.response import (HttpResponse, HttpResponseRedirect,
                                   JsonResponse, Http404)
 from django.shortcuts import get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.utils.dateparse import parse_date
 from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
 from django.utils.translation import string_concat
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic.base import TemplateView
@@ -47,9 +50,11 @@ from sapl.compilacao.models import (STATUS_TA_EDITION, STATUS_TA_PRIVATE,
                                     TipoDispositivo, TipoNota, TipoPublicacao,
                                     TipoTextoArticulado, TipoVide,
                                     VeiculoPublicacao, Vide)
-from sapl.compilacao.utils import (DISPOSITIVO_SELECT_RELATED,
+from sapl.compilacao.utils import (COMPILACAO_CACHE_TIMEOUT,
+                                   DISPOSITIVO_SELECT_RELATED,
                                    DISPOSITIVO_SELECT_RELATED_EDIT,
-                                   get_integrations_view_names)
+                                   get_integrations_view_names,
+                                   get_revisao_ta, incrementa_revisao_ta)
 from sapl.crud.base import RP_DETAIL, RP_LIST, Crud, CrudAux, CrudListView,\
     make_pagination
 from sapl.settings import BASE_DIR
@@ -843,6 +848,10 @@ class TextView(CompMixin, ListView):
     inicio_vigencia = None
     fim_vigencia = None
     ta_vigencia = None
+    somente_vigentes = False
+
+    template_texto_renderizado = 'compilacao/text_list_bloco.html'
+    usa_cache_texto = True
 
     def has_permission(self):
         self.object = self.ta
@@ -855,12 +864,47 @@ class TextView(CompMixin, ListView):
             self.template_name = 'compilacao/text_list__embedded.html'
         return ListView.get(self, request, *args, **kwargs)
 
+    def get_chave_texto_renderizado(self):
+        """
+        Chave do fragmento HTML do texto compilado, por revisão do texto e
+        pela janela de vigência definida em get_queryset. As versões
+        normal, de impressão e embutida incluem o mesmo fragmento. Só
+        visitantes anônimos usam o cache, pois o fragmento exibe ações e
+        notas conforme o usuário.
+        """
+        if not self.usa_cache_texto or self.request.user.is_authenticated:
+            return None
+
+        return 'compilacao:ta:{}:texto:{}:{}:{}:{}:{}'.format(
+            self.kwargs['ta_id'],
+            get_revisao_ta(self.kwargs['ta_id']),
+            self.ta_vigencia,
+            self.inicio_vigencia,
+            self.fim_vigencia,
+            self.somente_vigentes)
+
+    def get_ta_pub_list(self):
+        tas_pub = TextoArticulado.objects.filter(
+            pk__in=Dispositivo.objects.filter(
+                ordem__gt=0,
+                ta_id=self.kwargs['ta_id'],
+                ta_publicado__isnull=False
+            ).values('ta_publicado_id'))
+        return {ta.pk: str(ta) for ta in tas_pub}
+
     def get_context_data(self, **kwargs):
         context = super(TextView, self).get_context_data(**kwargs)
 
         context['object'] = TextoArticulado.objects.get(
             pk=self.kwargs['ta_id'])
 
+        chave = self.get_chave_texto_renderizado()
+        texto_renderizado = cache.get(chave) if chave else None
+        if texto_renderizado is not None:
+            context['ta_pub_list'] = self.get_ta_pub_list()
+            context['texto_renderizado'] = mark_safe(texto_renderizado)
+            return context
+
         cita = Vide.objects.filter(
             Q(dispositivo_base__ta_id=self.kwargs['ta_id'])).\
             select_related(
@@ -906,8 +950,24 @@ class TextView(CompMixin, ListView):
             ta_pub_list[ta.pk] = str(ta)
         context['ta_pub_list'] = ta_pub_list
 
+        context['blocos_atualizadores'] = Dispositivo.objects.select_related(
+            'ta',
+            'tipo_dispositivo',
+            'dispositivo_pai',
+            'dispositivo_pai__ta',
+            'dispositivo_pai__tipo_dispositivo'
+        ).blocos_atualizadores(
+            d.pk for d in self.object_list
+            if d.tipo_dispositivo.dispositivo_de_alteracao)
+
         # context['vigencias'] = self.get_vigencias()
 
+        if chave:
+            texto_renderizado = render_to_string(
+                self.template_texto_renderizado, context, self.request)
+            cache.set(chave, texto_renderizado, COMPILACAO_CACHE_TIMEOUT)
+            context['texto_renderizado'] = mark_safe(texto_renderizado)
+
         return context
 
     def get_queryset(self):
@@ -918,6 +978,13 @@ class TextView(CompMixin, ListView):
         self.inicio_vigencia = None
         self.fim_vigencia = None
         self.ta_vigencia = None
+        self.somente_vigentes = 'vigente' in self.request.GET
+
+        r = Dispositivo.objects.filter(
+            ordem__gt=0,
+            ta_id=self.kwargs['ta_id'],
+        ).select_related(*DISPOSITIVO_SELECT_RELATED)
+
         if 'sign' in self.kwargs:
             signer = Signer()
             try:
@@ -926,51 +993,43 @@ class TextView(CompMixin, ListView):
                 self.inicio_vigencia = parse_date(string[1])
                 self.fim_vigencia = parse_date(string[2])
             except:
-                return Dispositivo.objects.filter(
-                    ordem__gt=0,
-                    ta_id=self.kwargs['ta_id'],
-                ).select_related(*DISPOSITIVO_SELECT_RELATED)
-
-            return Dispositivo.objects.filter(
-                inicio_vigencia__lte=self.fim_vigencia,
-                ordem__gt=0,
-                ta_id=self.kwargs['ta_id'],
-            ).select_related(*DISPOSITIVO_SELECT_RELATED)
-        else:
-
-            r = Dispositivo.objects.filter(
-                ordem__gt=0,
-                ta_id=self.kwargs['ta_id'],
-            ).select_related(*DISPOSITIVO_SELECT_RELATED)
-
-            return r
+                self.ta_vigencia = None
+                self.inicio_vigencia = None
+                self.fim_vigencia = None
+                return r
+
+        elif self.request.GET.get('data'):
+            # texto em uma data qualquer: localiza, no índice de intervalos,
+            # a janela de vigência que contém a data
+            try:
+                data = parse_date(self.request.GET['data'])
+            except ValueError:
+                data = None
+            if not data:
+                return r
+
+            intervalo = Dispositivo.objects.intervalo_vigencia_em(
+                self.kwargs['ta_id'], data)
+            if not intervalo:
+                return r.none()
+            if not intervalo.fim_vigencia:
+                # intervalo atual
+                return r.texto_em(data, self.somente_vigentes)
+
+            self.ta_vigencia = intervalo.ta_publicado_id or 0
+            self.inicio_vigencia = intervalo.inicio_vigencia
+            self.fim_vigencia = intervalo.fim_vigencia
+
+        if self.fim_vigencia:
+            return r.texto_em(self.fim_vigencia, self.somente_vigentes)
+
+        if self.somente_vigentes:
+            return r.filter(fim_vigencia__isnull=True)
+        return r
 
     def get_vigencias(self):
-        itens = Dispositivo.objects.filter(
-            ta_id=self.kwargs['ta_id'],
-        ).order_by(
-            'inicio_vigencia'
-        ).distinct(
-            'inicio_vigencia'
-        ).select_related(
-            'ta_publicado',
-            'ta',
-            'ta_publicado__tipo_ta',
-            'ta__tipo_ta',)
-
-        ajuste_datas_vigencia = []
-
-        for item in itens:
-            ajuste_datas_vigencia.append(item)
-
-        lenLista = len(ajuste_datas_vigencia)
-        for i in range(lenLista):
-            if i + 1 < lenLista:
-                ajuste_datas_vigencia[
-                    i].fim_vigencia = ajuste_datas_vigencia[
-                        i + 1].inicio_vigencia - timedelta(days=1)
-            else:
-                ajuste_datas_vigencia[i].fim_vigencia = None
+        ajuste_datas_vigencia = Dispositivo.objects.intervalos_vigencia(
+            self.kwargs['ta_id'])
 
         self.itens_de_vigencia = {}
 
@@ -1011,6 +1070,7 @@ class TextView(CompMixin, ListView):
 class DispositivoView(TextView):
     # template_name = 'compilacao/index.html'
     template_name = 'compilacao/text_list_bloco.html'
+    usa_cache_texto = False
 
     def get_queryset(self):
         self.flag_alteradora = -1
@@ -1025,22 +1085,12 @@ class DispositivoView(TextView):
         self.flag_nivel_old = bloco.nivel - 1
         self.flag_nivel_ini = bloco.nivel
 
-        proximo_bloco = Dispositivo.objects.filter(
-            ordem__gt=bloco.ordem,
-            nivel__lte=bloco.nivel,
-            ta_id=self.kwargs['ta_id'])[:1]
-
-        if proximo_bloco.count() == 0:
-            itens = Dispositivo.objects.filter(
-                ordem__gte=bloco.ordem,
-                ta_id=self.kwargs['ta_id']
-            ).select_related(*DISPOSITIVO_SELECT_RELATED)
-        else:
-            itens = Dispositivo.objects.filter(
-                ordem__gte=bloco.ordem,
-                ordem__lt=proximo_bloco[0].ordem,
-                ta_id=self.kwargs['ta_id']
-            ).select_related(*DISPOSITIVO_SELECT_RELATED)
+        # o bloco e sua subárvore, pelo caminho materializado
+        itens = Dispositivo.objects.filter(
+            Q(pk=bloco.pk) |
+            Q(caminho__startswith=bloco.caminho_descendentes),
+            ta_id=self.kwargs['ta_id']
+        ).select_related(*DISPOSITIVO_SELECT_RELATED)
         return itens
 
 
@@ -1121,7 +1171,9 @@ class TextEditView(CompMixin, TemplateView):
             self.object = ta
 
         context['object'] = self.object
-        context['dispositivos_list'] = self.dispositivos_list()
+        if not self.request.GET.get('action', '').startswith('json_'):
+            # ações json não renderizam a árvore de dispositivos
+            context['dispositivos_list'] = self.dispositivos_list()
 
         if 'action' in self.request.GET:
             context['action'] = self.request.GET['action']
@@ -1151,16 +1203,8 @@ class TextEditView(CompMixin, TemplateView):
                     bloco.ta_id != ta_id and bloco.ta_publicado_id == ta_id):
                 dispositivos = [bloco, ]
             else:
-                proximo_bloco = Dispositivo.objects.filter(
-                    ordem__gt=bloco.ordem,
-                    nivel__lte=bloco.nivel,
-                    ta_id=ta_id)[:1]
-
-                if not proximo_bloco.exists():
-                    q = q & Q(ordem__gte=bloco.ordem)
-                else:
-                    q = q & Q(ordem__gte=bloco.ordem) & \
-                        Q(ordem__lt=proximo_bloco[0].ordem)
+                q = q & (Q(pk=bloco.pk) |
+                         Q(caminho__startswith=bloco.caminho_descendentes))
 
                 dispositivos_de_alteracao = Dispositivo.objects.filter(
                     ta_id=ta_id,
@@ -1173,10 +1217,12 @@ class TextEditView(CompMixin, TemplateView):
                 q).select_related(*DISPOSITIVO_SELECT_RELATED_EDIT)
 
         dispositivos_alterados = Dispositivo.objects.filter(
-            ta_publicado_id=ta_id)
+            ta_publicado_id=ta_id
+        ).select_related(*DISPOSITIVO_SELECT_RELATED_EDIT)
 
         dispositivos_alteradores = Dispositivo.objects.filter(
-            dispositivos_alterados_set__ta_id=ta_id)
+            dispositivos_alterados_set__ta_id=ta_id
+        ).select_related(*DISPOSITIVO_SELECT_RELATED_EDIT)
 
         dpts = list(dispositivos) + \
             list(dispositivos_de_alteracao) + \
@@ -1202,6 +1248,16 @@ class TextEditView(CompMixin, TemplateView):
                 if d.ta_id == ta_id else None
                 } for d in dpts}
 
+        # dispositivos de todos os blocos de alteração em uma só consulta
+        blocos = Dispositivo.objects.only(
+            'dispositivo_pai_id',
+            'dispositivo_atualizador_id',
+            'ordem_bloco_atualizador'
+        ).blocos_atualizadores(
+            d.pk for d in dispositivos
+            if tds[d.tipo_dispositivo_id].dispositivo_de_alteracao and
+            tds[d.tipo_dispositivo_id].dispositivo_de_articulacao)
+
         apagar = []
         for d in dispositivos:
             try:
@@ -1237,18 +1293,9 @@ class TextEditView(CompMixin, TemplateView):
             except:
                 pass
             try:
-                if tds[d.tipo_dispositivo_id].dispositivo_de_alteracao and\
-                        tds[d.tipo_dispositivo_id].dispositivo_de_articulacao:
-
-                    alts = Dispositivo.objects.values_list(
-                        'pk', flat=True).order_by(
-                        'ordem_bloco_atualizador').filter(
-                        Q(dispositivo_pai_id=d.pk) |
-                        Q(dispositivo_atualizador_id=d.pk))
-
-                    for dAlt in alts:
-                        dpts[d.pk]['alts'].append(dpts[dAlt])
-                        dpts[dAlt]['da'] = dpts[d.pk]
+                for dAlt in blocos.get(d.pk, []):
+                    dpts[d.pk]['alts'].append(dpts[dAlt.pk])
+                    dpts[dAlt.pk]['da'] = dpts[d.pk]
             except:
                 pass
 
@@ -1329,6 +1376,11 @@ class TextEditView(CompMixin, TemplateView):
 
 class ActionsCommonsMixin:
 
+    campos_estado_dispositivo = (
+        'pk', 'ordem', 'rotulo', 'nivel', 'dispositivo_pai_id', 'ta_id',
+        'auto_inserido', 'tipo_dispositivo__nome',
+        'tipo_dispositivo__rotulo_prefixo_texto')
+
     def set_message(self, data, _type, message, time=None, modal=False):
         data['message'] = {
             'type': _type,
@@ -1338,6 +1390,56 @@ class ActionsCommonsMixin:
         data['message']['modal'] = modal
         return
 
+    def get_estado_dispositivos(self):
+        """
+        Retrato leve dos dispositivos do texto em edição (e dos publicados
+        por ele), usado para calcular as alterações feitas por uma ação.
+        """
+        ta_id = int(self.kwargs['ta_id'])
+        return {
+            d[0]: d[1:] for d in Dispositivo.objects.filter(
+                Q(ta_id=ta_id) | Q(ta_publicado_id=ta_id)
+            ).values_list(*self.campos_estado_dispositivo)}
+
+    def get_alteracoes_dispositivos(self, estado_anterior):
+        """
+        Diferença entre o estado anterior e o atual dos dispositivos:
+        inseridos e alterados, com ordem, rótulo, nível e pai novos, e pks
+        dos removidos. Com ela, o editor atualiza a página no lugar, sem
+        recarregar blocos inteiros.
+        """
+        estado = self.get_estado_dispositivos()
+        ta_id = int(self.kwargs['ta_id'])
+
+        def item(pk):
+            ordem, rotulo, nivel, pai, ta, auto, nome, prefixo = estado[pk]
+            return {
+                'pk': pk,
+                'ordem': ordem,
+                'rotulo': rotulo,
+                'nivel': nivel,
+                'pai': pai,
+                # dispositivos publicados por este texto em outro
+                'publicado': ta != ta_id,
+                # auto inseridos não exibem o próprio rótulo
+                'auto_inserido': auto,
+                # rótulo do botão de edição, como em text_edit_bloco.html
+                'titulo': rotulo if prefixo else '{} {}'.format(
+                    nome, rotulo),
+            }
+
+        def por_ordem(pks):
+            return [item(pk) for pk in sorted(
+                pks, key=lambda pk: (estado[pk][0], pk))]
+
+        return {
+            'inseridos': por_ordem(estado.keys() - estado_anterior.keys()),
+            'alterados': por_ordem(
+                pk for pk in estado.keys() & estado_anterior.keys()
+                if estado[pk][:4] != estado_anterior[pk][:4]),
+            'removidos': sorted(estado_anterior.keys() - estado.keys()),
+        }
+
     def get_json_for_refresh(self, dp, dpauto=None):
 
         if dp.tipo_dispositivo.contagem_continua:
@@ -2121,6 +2223,10 @@ class ActionDispositivoCreateMixin(ActionsCommonsMixin):
                     d.fim_eficacia = ds.inicio_eficacia - timedelta(days=1)
                     d.save()
 
+            # update() não dispara post_save
+            ta_ids = {dvt.ta_id} | set(dps.values_list('ta_id', flat=True))
+            transaction.on_commit(lambda: incrementa_revisao_ta(*ta_ids))
+
             data = {'pk': dvt.pk,
                     'pai': [dvt.pk, ]}
             self.set_message(data, 'success',
@@ -2285,13 +2391,13 @@ class ActionDispositivoCreateMixin(ActionsCommonsMixin):
             # Inserção automática
             if count_auto_insert:
 
-                ordem = dp.criar_espaco(
-                    espaco_a_criar=count_auto_insert, local='json_add_in')
+                ordens = dp.alocar_ordens(
+                    len(tipos_dp_auto_insert), local='json_add_in')
 
                 dp_pk = dp.pk
-                dp.ordem = ordem
                 dp.nivel += 1
-                for tipoauto in tipos_dp_auto_insert:
+                for tipoauto, ordem in zip(tipos_dp_auto_insert, ordens):
+                    dp.ordem = ordem
                     dp.dispositivo_pai_id = dp_pk
                     dp.pk = None
                     dp.tipo_dispositivo = tipoauto.filho_permitido
@@ -2306,8 +2412,6 @@ class ActionDispositivoCreateMixin(ActionsCommonsMixin):
                     dp.auto_inserido = True
                     dp.save()
                     dp_auto_insert = dp
-
-                    ordem += Dispositivo.INTERVALO_ORDEM
                 dp = Dispositivo.objects.get(pk=dp_pk)
 
             ''' Reenquadrar todos os dispositivos que possuem pai
@@ -2444,6 +2548,17 @@ class ActionsEditMixin(ActionDragAndMoveDispositivoAlteradoMixin,
                        ActionDispositivoCreateMixin):
     logger = logging.getLogger(__name__)
 
+    # ações cuja resposta inclui as alterações nos dispositivos
+    acoes_com_alteracoes = (
+        'json_delete_item_dispositivo',
+        'json_delete_bloco_dispositivo',
+        'json_add_prior',
+        'json_add_in',
+        'json_add_next',
+        'json_add_next_registra_inclusao',
+        'json_add_in_registra_inclusao',
+    )
+
     def render_to_json_response(self, context, **response_kwargs):
 
         action = getattr(self, context['action'])
@@ -2460,11 +2575,17 @@ class ActionsEditMixin(ActionDragAndMoveDispositivoAlteradoMixin,
         if 'perfil_estrutural' in self.request.session:
             context['perfil_pk'] = self.request.session['perfil_estrutural']
 
+        estado = self.get_estado_dispositivos() \
+            if context['action'] in self.acoes_com_alteracoes else None
+
         data = action(context)
 
         if 'message' in context and 'message' not in data:
             data['message'] = context['message']
 
+        if estado is not None and data:
+            data['alteracoes'] = self.get_alteracoes_dispositivos(estado)
+
         return JsonResponse(data, safe=False)
 
     def json_get_perfis(self, context):
@@ -2714,10 +2835,11 @@ class ActionsEditMixin(ActionDragAndMoveDispositivoAlteradoMixin,
             ndp.inicio_vigencia = bloco_alteracao.inicio_eficacia
 
         try:
-            ordem = dsp_a_alterar.criar_espaco(
-                espaco_a_criar=1, local='json_add_in_with_auto')
-
-            ndp.ordem = ordem
+            # o novo dispositivo fica entre o alterado e o primeiro filho
+            # dele, que passa a ser seu; a pré-ordem do texto se mantém sem
+            # renumerar os demais dispositivos
+            ndp.ordem = dsp_a_alterar.alocar_ordens(
+                1, local='json_add_in_with_auto')[0]
             ndp.dispositivo_atualizador = bloco_alteracao
             ndp.ta_publicado = bloco_alteracao.ta
 
@@ -2751,7 +2873,7 @@ class ActionsEditMixin(ActionDragAndMoveDispositivoAlteradoMixin,
             p.save()
 
             if n:
-                # a ordem desse objeto foi alterada pela função criar_espaco
+                # a ordem desse objeto pode ter sido alterada por alocar_ordens
                 # deve ser recarregado para atualização
                 n.refresh_from_db()
                 n.dispositivo_substituido = ndp
@@ -2762,7 +2884,6 @@ class ActionsEditMixin(ActionDragAndMoveDispositivoAlteradoMixin,
                 d.dispositivo_pai = ndp
                 d.save()
 
-            ndp.ta.reordenar_dispositivos()
             bloco_alteracao.ordenar_bloco_alteracao()
 
             if not revogacao:
@@ -2886,6 +3007,11 @@ class DispositivoDinamicEditView(
             pk=self.kwargs['dispositivo_id'])
 
         formtype = request.POST['formtype']
+
+        # a edição de texto (get_form_base) não altera a estrutura
+        estado = self.get_estado_dispositivos() \
+            if formtype != 'get_form_base' else None
+
         if formtype == 'get_form_alteracao':
 
             data = self.registra_alteracao(
@@ -2955,6 +3081,9 @@ class DispositivoDinamicEditView(
             self.set_message(data, 'success',
                              _('Dispositivo alterado com sucesso.'))
 
+        if estado is not None and data:
+            data['alteracoes'] = self.get_alteracoes_dispositivos(estado)
+
         return JsonResponse(data, safe=False)
 
 
@@ -1,3 +1,4 @@
+import hashlib
 import unicodedata
 from datetime import datetime
 
@@ -5,12 +6,17 @@ import oaipmh
 import oaipmh.error
 import oaipmh.metadata
 import oaipmh.server
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from lxml import etree
 from lxml.builder import ElementMaker
 
 from sapl.base.models import AppConfig, CasaLegislativa
-from sapl.lexml.models import LexmlPublicador, LexmlProvedor
+from sapl.lexml.models import (LexmlMetadadoNorma, LexmlProvedor,
+                               LexmlPublicador)
 from sapl.norma.models import NormaJuridica
 from sapl.utils import LISTA_DE_UFS
 
@@ -67,24 +73,33 @@ class OAIServer:
         metadata.record = record
         return header, metadata
 
-    def list_query(self, from_=None, until=None, offset=0, batch_size=10, identifier=None):
+    def list_query(self, from_=None, until=None, chave=None, batch_size=10, identifier=None, metadados=True):
         if identifier:
             identifier = int(identifier.split('/')[-1])  # Get internal id
         else:
             identifier = ''
         until = datetime.now() if not until or until > datetime.now() else until
-        return self.oai_query(offset=offset, batch_size=batch_size, from_=from_, until=until,
-                              identifier=identifier)
+        return self.oai_query(chave=chave, batch_size=batch_size, from_=from_, until=until,
+                              identifier=identifier, metadados=metadados)
 
     def check_metadata_prefix(self, metadata_prefix):
         if not metadata_prefix in self.config['metadata_prefixes']:
             raise oaipmh.error.CannotDisseminateFormatError
 
-    def listRecords(self, metadataPrefix, from_=None, until=None, cursor=0, batch_size=10):
+    def listRecords(self, metadataPrefix, from_=None, until=None, chave=None, batch_size=10):
+        """
+            Gera pares (chave, registro), onde chave é a posição do
+            registro na ordenação (timestamp, pk) usada por KeysetResumption
+        """
         self.check_metadata_prefix(metadataPrefix)
-        for record in self.list_query(from_, until, cursor, batch_size):
+        for record in self.list_query(from_, until, chave, batch_size):
             header, metadata = self.create_header_and_metadata(record)
-            yield header, metadata, None  # None?
+            yield record['chave'], (header, metadata, None)  # None?
+
+    def listIdentifiers(self, metadataPrefix, from_=None, until=None, chave=None, batch_size=10):
+        self.check_metadata_prefix(metadataPrefix)
+        for record in self.list_query(from_, until, chave, batch_size, metadados=False):
+            yield record['chave'], self.create_header(record)
 
     def get_oai_id(self, internal_id):
         return "oai:{}".format(internal_id)
@@ -97,11 +112,62 @@ class OAIServer:
         deleted = record['record']['deleted']
         return oaipmh.common.Header(None, oai_id, timestamp, sets, deleted)
 
-    def get_esfera_federacao(self):
+    # Os dados da casa abaixo são calculados uma vez por requisição, já que
+    # um OAIServer é criado por requisição em OAIServerFactory
+
+    @cached_property
+    def esfera_federacao(self):
         appconfig = AppConfig.objects.first()
         return appconfig.esfera_federacao
 
-    def recupera_norma(self, offset, batch_size, from_, until, identifier, esfera):
+    @cached_property
+    def publicador(self):
+        return LexmlPublicador.objects.first()
+
+    @cached_property
+    def base_url_sapl(self):
+        base_url = self.config['base_url']
+        return base_url[:base_url.find('/', 8)]
+
+    @cached_property
+    def prefixo_oai(self):
+        num = len(casa.endereco_web.split('.'))
+        dominio = '.'.join(casa.endereco_web.split('.')[1:num])
+        return '{}.{}:sapl/'.format(casa.sigla.lower(), dominio)
+
+    @cached_property
+    def localidade_urn(self):
+        municipio = self.remove_acentos(casa.municipio.lower())
+        uf_map = dict(LISTA_DE_UFS)
+        uf_desc = uf_map.get(casa.uf.upper(), '').lower()
+        uf_desc = self.remove_acentos(uf_desc)
+        for x in [' ', '.de.', '.da.', '.das.', '.do.', '.dos.']:
+            municipio = municipio.replace(x, '.')
+            uf_desc = uf_desc.replace(x, '.')
+        return uf_desc, municipio
+
+    @cached_property
+    def contexto_xml(self):
+        """
+            Identifica os dados da casa usados em monta_urn/monta_xml, para
+            que o XML gravado de uma norma não seja servido com outra URL
+            base, esfera ou publicador
+        """
+        contexto = '{}|{}|{}|{}|{}|{}'.format(
+            self.base_url_sapl, self.esfera_federacao,
+            self.publicador.id_publicador if self.publicador else '',
+            casa.sigla, casa.municipio, casa.uf)
+        return hashlib.md5(contexto.encode('utf-8')).hexdigest()
+
+    def get_esfera_federacao(self):
+        return self.esfera_federacao
+
+    def recupera_norma(self, chave, batch_size, from_, until, identifier, esfera):
+        """
+            Paginação por chave (timestamp, pk): cada lote continua a partir
+            do último registro do lote anterior, sem OFFSET. Normas sem
+            timestamp ficam no final da ordenação.
+        """
         kwargs = {'data__lte': until}
         if from_:
             kwargs['data__gte'] = from_
@@ -109,13 +175,21 @@ class OAIServer:
             kwargs['numero'] = identifier
         if esfera:
             kwargs['esfera_federacao'] = esfera
-        return NormaJuridica.objects.select_related('tipo').filter(**kwargs)[offset:offset + batch_size]
+        normas = NormaJuridica.objects.select_related(
+            'tipo', 'metadado_lexml').filter(**kwargs)
+        if chave:
+            timestamp, pk = chave
+            if timestamp is None:
+                normas = normas.filter(timestamp__isnull=True, pk__gt=pk)
+            else:
+                normas = normas.filter(Q(timestamp__gt=timestamp) |
+                                       Q(timestamp=timestamp, pk__gt=pk) |
+                                       Q(timestamp__isnull=True))
+        return normas.order_by(F('timestamp').asc(nulls_last=True), 'pk')[:batch_size].iterator()
 
     def monta_id(self, norma):
         if norma:
-            num = len(casa.endereco_web.split('.'))
-            dominio = '.'.join(casa.endereco_web.split('.')[1:num])
-            prefixo_oai = '{}.{}:sapl/'.format(casa.sigla.lower(), dominio)
+            prefixo_oai = self.prefixo_oai
             numero_interno = norma.numero
             tipo_norma = norma.tipo.equivalente_lexml
             ano_norma = norma.ano
@@ -137,13 +211,7 @@ class OAIServer:
         if norma:
             urn = 'urn:lex:br;'
             esferas = {'M': 'municipal', 'E': 'estadual'}
-            municipio = self.remove_acentos(casa.municipio.lower())
-            uf_map = dict(LISTA_DE_UFS)
-            uf_desc = uf_map.get(casa.uf.upper(), '').lower()
-            uf_desc = self.remove_acentos(uf_desc)
-            for x in [' ', '.de.', '.da.', '.das.', '.do.', '.dos.']:
-                municipio = municipio.replace(x, '.')
-                uf_desc = uf_desc.replace(x, '.')
+            uf_desc, municipio = self.localidade_urn
             if esfera == 'M':
                 urn += '{};{}:'.format(uf_desc, municipio)
                 if norma.tipo.equivalente_lexml == 'regimento.interno' or norma.tipo.equivalente_lexml == 'resolucao':
@@ -179,10 +247,9 @@ class OAIServer:
             return ''
 
     def monta_xml(self, urn, norma):
-        BASE_URL_SAPL = self.config['base_url']
-        BASE_URL_SAPL = BASE_URL_SAPL[:BASE_URL_SAPL.find('/', 8)]
+        BASE_URL_SAPL = self.base_url_sapl
 
-        publicador = LexmlPublicador.objects.first()
+        publicador = self.publicador
         if norma and publicador:
             LEXML = ElementMaker(namespace=self.ns['lexml'], nsmap=self.ns)
             oai_lexml = LEXML.LexML()
@@ -231,24 +298,109 @@ class OAIServer:
         else:
             return None
 
-    def oai_query(self, offset=0, batch_size=10, from_=None, until=None, identifier=None):
+    def recupera_xmls(self, normas, esfera):
+        """
+            Retorna {pk: xml} das normas do lote a partir de
+            LexmlMetadadoNorma, gerando e gravando apenas os metadados
+            ausentes ou gerados com outros dados da casa
+        """
+        xmls = {}
+        novos = []
+        for norma in normas:
+            metadado = getattr(norma, 'metadado_lexml', None)
+            if metadado and metadado.contexto == self.contexto_xml:
+                xmls[norma.pk] = metadado.xml
+                continue
+
+            urn = self.monta_urn(norma, esfera)
+            xml = self.monta_xml(urn, norma)
+            if xml is None:
+                xmls[norma.pk] = None
+                continue
+            xmls[norma.pk] = xml = xml.decode('utf-8')
+            novos.append(LexmlMetadadoNorma(
+                norma=norma, contexto=self.contexto_xml, urn=urn, xml=xml))
+
+        if novos:
+            try:
+                with transaction.atomic():
+                    LexmlMetadadoNorma.objects.filter(
+                        norma__in=[m.norma for m in novos]).delete()
+                    LexmlMetadadoNorma.objects.bulk_create(novos)
+            except IntegrityError:
+                # outra coleta simultânea gravou os mesmos metadados
+                pass
+        return xmls
+
+    def oai_query(self, chave=None, batch_size=10, from_=None, until=None, identifier=None, metadados=True):
         esfera = self.get_esfera_federacao()
-        offset = 0 if offset < 0 else offset
         batch_size = 10 if batch_size < 0 else batch_size
         until = datetime.now() if not until or until > datetime.now() else until
-        normas = self.recupera_norma(offset, batch_size, from_, until, identifier, esfera)
+        normas = list(self.recupera_norma(chave, batch_size, from_, until, identifier, esfera))
+        xmls = self.recupera_xmls(normas, esfera) if metadados else {}
         for norma in normas:
             resultado = {}
             identificador = self.monta_id(norma)
-            urn = self.monta_urn(norma, esfera)
-            xml_lexml = self.monta_xml(urn, norma)
-            resultado['tx_metadado_xml'] = xml_lexml
+            resultado['tx_metadado_xml'] = xmls.get(norma.pk)
             resultado['cd_status'] = 'N'
             resultado['id'] = identificador
             resultado['when_modified'] = norma.timestamp
             resultado['deleted'] = 0
             yield {'record': resultado,
-                   'metadata': resultado['tx_metadado_xml']}
+                   'metadata': resultado['tx_metadado_xml'],
+                   'chave': (norma.timestamp, norma.pk)}
+
+
+class KeysetResumption(oaipmh.server.BatchingResumption):
+    """
+        Substitui o cursor numérico (OFFSET) do BatchingResumption do pyoai
+        por uma chave (timestamp, pk) do último registro entregue, gravada
+        no resumptionToken. Assim cada página de ListRecords/ListIdentifiers
+        custa o mesmo, e uma coleta completa do acervo é linear.
+    """
+
+    verbos_paginados = ('ListIdentifiers', 'ListRecords')
+
+    @staticmethod
+    def codifica_chave(chave):
+        timestamp, pk = chave
+        return '{}|{}'.format(timestamp.isoformat() if timestamp else '', pk)
+
+    @staticmethod
+    def decodifica_chave(valor):
+        try:
+            timestamp, pk = valor.split('|')
+            timestamp = parse_datetime(timestamp) if timestamp else None
+            return timestamp, int(pk)
+        except ValueError:
+            raise oaipmh.error.BadResumptionTokenError(
+                'Unable to decode resumption token (bad key): %s' % valor)
+
+    def handleVerb(self, verb, kw):
+        if verb not in self.verbos_paginados:
+            return super().handleVerb(verb, kw)
+
+        cursor = 0
+        if 'resumptionToken' in kw:
+            kw, cursor = oaipmh.server.decodeResumptionToken(
+                kw['resumptionToken'])
+
+        kw = kw.copy()
+        chave = kw.pop('chave', None)
+        if chave is not None:
+            chave = self.decodifica_chave(chave)
+
+        method = oaipmh.common.getMethodForVerb(self._server, verb)
+        # busca um registro além do lote para saber se há próxima página
+        result = list(method(chave=chave, batch_size=self._batch_size + 1, **kw))
+
+        resumptionToken = None
+        if len(result) > self._batch_size:
+            result.pop()
+            kw['chave'] = self.codifica_chave(result[-1][0])
+            resumptionToken = oaipmh.server.encodeResumptionToken(
+                kw, cursor + self._batch_size)
+        return [item for _, item in result], resumptionToken
 
 
 def OAIServerFactory(config={}):
@@ -258,10 +410,9 @@ def OAIServerFactory(config={}):
     for prefix in config['metadata_prefixes']:
         metadata_registry = oaipmh.metadata.MetadataRegistry()
         metadata_registry.registerWriter(prefix, OAILEXML(prefix))
-    return oaipmh.server.BatchingServer(
-        OAIServer(config),
-        metadata_registry=metadata_registry,
-        resumption_batch_size=config['batch_size']
+    return oaipmh.server.ServerBase(
+        KeysetResumption(OAIServer(config), config['batch_size']),
+        metadata_registry=metadata_registry
     )
 
 
@@ -6,3 +6,6 @@ class AppConfig(apps.AppConfig):
     name = 'sapl.lexml'
     label = 'lexml'
     verbose_name = _('LexML')
+
+    def ready(self):
+        from sapl.lexml import receivers
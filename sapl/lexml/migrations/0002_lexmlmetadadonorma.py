@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('norma', '0026_normajuridica_timestamp_id_idx'),
+        ('lexml', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LexmlMetadadoNorma',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('contexto', models.CharField(max_length=32, verbose_name='Hash dos dados da casa usados na geração')),
+                ('urn', models.TextField(blank=True, verbose_name='URN')),
+                ('xml', models.TextField(blank=True, verbose_name='XML')),
+                ('data_geracao', models.DateTimeField(auto_now=True, verbose_name='Data de geração')),
+                ('norma', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='metadado_lexml', to='norma.NormaJuridica', verbose_name='Norma Jurídica')),
+            ],
+            options={
+                'verbose_name': 'Metadado Lexml de Norma',
+                'verbose_name_plural': 'Metadados Lexml de Normas',
+            },
+        ),
+    ]
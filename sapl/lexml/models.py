@@ -65,3 +65,28 @@ class LexmlPublicador(models.Model):
 
     def __str__(self):
         return self.nome
+
+
+class LexmlMetadadoNorma(models.Model):
+    """
+    XML oai_lexml já gerado de uma norma, servido diretamente pelo
+    OAIServer. É apagado quando a norma, seu tipo ou a casa legislativa são
+    alterados e gerado novamente na próxima coleta.
+    """
+    norma = models.OneToOneField(
+        'norma.NormaJuridica', on_delete=models.CASCADE,
+        related_name='metadado_lexml', verbose_name=_('Norma Jurídica'))
+    contexto = models.CharField(
+        max_length=32,
+        verbose_name=_('Hash dos dados da casa usados na geração'))
+    urn = models.TextField(blank=True, verbose_name=_('URN'))
+    xml = models.TextField(blank=True, verbose_name=_('XML'))
+    data_geracao = models.DateTimeField(
+        auto_now=True, verbose_name=_('Data de geração'))
+
+    class Meta:
+        verbose_name = _('Metadado Lexml de Norma')
+        verbose_name_plural = _('Metadados Lexml de Normas')
+
+    def __str__(self):
+        return self.urn
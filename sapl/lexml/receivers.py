@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from sapl.base.models import AppConfig, CasaLegislativa
+from sapl.lexml.models import LexmlMetadadoNorma, LexmlPublicador
+from sapl.norma.models import NormaJuridica, TipoNormaJuridica
+
+
+@receiver(post_save, sender=NormaJuridica)
+def invalida_metadado_norma(sender, instance, **kwargs):
+    LexmlMetadadoNorma.objects.filter(norma=instance).delete()
+
+
+@receiver(post_save, sender=TipoNormaJuridica)
+def invalida_metadado_tipo_norma(sender, instance, **kwargs):
+    LexmlMetadadoNorma.objects.filter(norma__tipo=instance).delete()
+
+
+@receiver(post_save, sender=CasaLegislativa)
+@receiver(post_save, sender=AppConfig)
+@receiver(post_save, sender=LexmlPublicador)
+def invalida_metadados_normas(sender, instance, **kwargs):
+    LexmlMetadadoNorma.objects.all().delete()
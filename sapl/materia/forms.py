@@ -25,6 +25,7 @@ import django_filters
 
 import sapl
 from sapl.base.models import AppConfig, Autor, TipoAutor
+from sapl.base.signals import tramitacoes_em_lote_signal
 from sapl.comissoes.models import Comissao, Participacao, Composicao
 from sapl.compilacao.models import (STATUS_TA_IMMUTABLE_PUBLIC,
                                     STATUS_TA_PRIVATE)
@@ -46,11 +47,12 @@ from sapl.utils import (YES_NO_CHOICES, SEPARADOR_HASH_PROPOSICAO,
                         autor_label, autor_modal, gerar_hash_arquivo,
                         models_with_gr_for_model, qs_override_django_filter,
                         choice_anos_com_materias, FilterOverridesMetaMixin, FileFieldCheckMixin,
-                        lista_anexados)
+                        lista_anexados, anexados_em_lote)
 
 from .models import (AcompanhamentoMateria, Anexada, Autoria, DespachoInicial,
                      DocumentoAcessorio, Numeracao, Proposicao, Relatoria,
-                     TipoMateriaLegislativa, Tramitacao, UnidadeTramitacao)
+                     TipoMateriaLegislativa, Tramitacao, UnidadeTramitacao,
+                     atualiza_ultima_tramitacao)
 
 
 def CHOICE_TRAMITACAO():
@@ -1084,34 +1086,27 @@ class MateriaLegislativaFilterSet(django_filters.FilterSet):
 
 
 def pega_ultima_tramitacao():
-    return Tramitacao.objects.values(
-        'materia_id').annotate(data_encaminhamento=Max(
-            'data_encaminhamento'),
-        id=Max('id')).values_list('id', flat=True)
+    return MateriaLegislativa.objects.filter(
+        ultima_tramitacao__isnull=False).values_list(
+        'ultima_tramitacao_id', flat=True)
 
 
 def filtra_tramitacao_status(status):
-    lista = pega_ultima_tramitacao()
-    return Tramitacao.objects.filter(
-        id__in=lista,
-        status=status).distinct().values_list('materia_id', flat=True)
+    return MateriaLegislativa.objects.filter(
+        ultima_tramitacao__status=status).values_list('id', flat=True)
 
 
 def filtra_tramitacao_destino(destino):
-    lista = pega_ultima_tramitacao()
-    return Tramitacao.objects.filter(
-        id__in=lista,
-        unidade_tramitacao_destino=destino).distinct().values_list(
-            'materia_id', flat=True)
+    return MateriaLegislativa.objects.filter(
+        ultima_tramitacao__unidade_tramitacao_destino=destino).values_list(
+            'id', flat=True)
 
 
 def filtra_tramitacao_destino_and_status(status, destino):
-    lista = pega_ultima_tramitacao()
-    return Tramitacao.objects.filter(
-        id__in=lista,
-        status=status,
-        unidade_tramitacao_destino=destino).distinct().values_list(
-            'materia_id', flat=True)
+    return MateriaLegislativa.objects.filter(
+        ultima_tramitacao__status=status,
+        ultima_tramitacao__unidade_tramitacao_destino=destino).values_list(
+            'id', flat=True)
 
 
 class DespachoInicialForm(ModelForm):
@@ -1656,16 +1651,42 @@ class TramitacaoEmLoteForm(ModelForm):
 
     @transaction.atomic
     def save(self, commit=True):
+        """
+        Tramita as matérias selecionadas (e, conforme a configuração, suas
+        anexadas) em lote: as anexadas são resolvidas com uma consulta ao
+        grafo de anexação, as tramitações inseridas com bulk_create e
+        em_tramitacao e ultima_tramitacao atualizados com UPDATEs em
+        conjunto. As tramitações criadas ficam em self.tramitacoes, para
+        o envio dos emails de acompanhamento em lote.
+        """
         cd = self.cleaned_data
-        materias = self.initial['materias']
+        materias = [int(pk) for pk in self.initial['materias']]
         user = self.initial['user'] if 'user' in self.initial else None
         ip = self.initial['ip'] if 'ip' in self.initial else ''
         tramitar_anexadas = AppConfig.attr('tramitacao_materia')
-        for mat_id in materias:
-            mat = MateriaLegislativa.objects.get(id=mat_id)
-            tramitacao = Tramitacao.objects.create(
+
+        materias = list(MateriaLegislativa.objects.filter(
+            id__in=materias).values_list('id', flat=True))
+
+        a_tramitar = list(materias)
+        if tramitar_anexadas:
+            anexadas = set()
+            for pks in anexados_em_lote(materias).values():
+                anexadas.update(pks)
+            anexadas -= set(materias)
+
+            # só tramitam as anexadas ainda sem tramitação ou que estão na
+            # unidade de origem desta tramitação
+            a_tramitar += MateriaLegislativa.objects.filter(
+                Q(ultima_tramitacao__isnull=True) |
+                Q(ultima_tramitacao__unidade_tramitacao_destino=cd[
+                    'unidade_tramitacao_local']),
+                id__in=anexadas).values_list('id', flat=True)
+
+        self.tramitacoes = Tramitacao.objects.bulk_create([
+            Tramitacao(
                 status=cd['status'],
-                materia=mat,
+                materia_id=materia_id,
                 data_tramitacao=cd['data_tramitacao'],
                 unidade_tramitacao_local=cd['unidade_tramitacao_local'],
                 unidade_tramitacao_destino=cd['unidade_tramitacao_destino'],
@@ -1675,37 +1696,17 @@ class TramitacaoEmLoteForm(ModelForm):
                 texto=cd['texto'],
                 data_fim_prazo=cd['data_fim_prazo'],
                 user=user,
-                ip=ip
-            )
-            mat.em_tramitacao = False if tramitacao.status.indicador == "F" else True
-            mat.save()
-
-            if tramitar_anexadas:
-                lista_tramitacao = []
-                anexadas = lista_anexados(mat)
-                for ml in anexadas:
-                    if not ml.tramitacao_set.all() \
-                        or ml.tramitacao_set.last() \
-                        .unidade_tramitacao_destino == tramitacao.unidade_tramitacao_local:
-                        ml.em_tramitacao = False if tramitacao.status.indicador == "F" else True
-                        ml.save()
-                        lista_tramitacao.append(Tramitacao(
-                                                status=tramitacao.status,
-                                                materia=ml,
-                                                data_tramitacao=tramitacao.data_tramitacao,
-                                                unidade_tramitacao_local=tramitacao.unidade_tramitacao_local,
-                                                data_encaminhamento=tramitacao.data_encaminhamento,
-                                                unidade_tramitacao_destino=tramitacao.unidade_tramitacao_destino,
-                                                urgente=tramitacao.urgente,
-                                                turno=tramitacao.turno,
-                                                texto=tramitacao.texto,
-                                                data_fim_prazo=tramitacao.data_fim_prazo,
-                                                user=tramitacao.user,
-                                                ip=tramitacao.ip
-                                                ))
-                Tramitacao.objects.bulk_create(lista_tramitacao)     
+                ip=ip)
+            for materia_id in a_tramitar], batch_size=500)
 
-        return tramitacao
+        MateriaLegislativa.objects.filter(id__in=a_tramitar).update(
+            em_tramitacao=cd['status'].indicador != "F",
+            data_ultima_atualizacao=timezone.now())
+        atualiza_ultima_tramitacao(a_tramitar)
+        tramitacoes_em_lote_signal.send(sender=Tramitacao,
+                                        materias=a_tramitar)
+
+        return self.tramitacoes[-1] if self.tramitacoes else None
 
 
 class ProposicaoForm(FileFieldCheckMixin, forms.ModelForm):
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materia', '0050_auto_20190521_1148'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materialegislativa',
+            name='ultima_tramitacao',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='materia.Tramitacao', verbose_name='Última Tramitação'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE materia_materialegislativa m
+            SET ultima_tramitacao_id = t.id
+            FROM (SELECT materia_id, max(id) AS id
+                  FROM materia_tramitacao
+                  GROUP BY materia_id) t
+            WHERE t.materia_id = m.id;
+            """,
+            migrations.RunSQL.noop),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import Group
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.db.models.functions import Concat
 from django.template import defaultfilters
 from django.utils import formats, timezone
@@ -18,7 +19,8 @@ from sapl.parlamentares.models import Parlamentar
 #from sapl.protocoloadm.models import Protocolo
 from sapl.utils import (RANGE_ANOS, YES_NO_CHOICES, SaplGenericForeignKey,
                         SaplGenericRelation, restringe_tipos_de_arquivo_txt,
-                        texto_upload_path, get_settings_auth_user_model)
+                        texto_upload_path, get_settings_auth_user_model,
+                        campos_exceto)
 
 
 EM_TRAMITACAO = [(1, 'Sim'),
@@ -233,6 +235,15 @@ class MateriaLegislativa(models.Model):
         verbose_name=_('Em Tramitação?'),
         default=False,
         choices=YES_NO_CHOICES)
+    # mantida por sapl.base.receivers (veja atualiza_ultima_tramitacao)
+    ultima_tramitacao = models.ForeignKey(
+        'Tramitacao',
+        blank=True,
+        null=True,
+        editable=False,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        verbose_name=_('Última Tramitação'))
     polemica = models.NullBooleanField(
         blank=True, verbose_name=_('Matéria Polêmica?'))
     objeto = models.CharField(
@@ -358,6 +369,14 @@ class MateriaLegislativa(models.Model):
                               update_fields=update_fields)
             self.texto_original = texto_original
 
+        if update_fields is None and not force_insert and \
+                not self._state.adding:
+            # ultima_tramitacao é mantida apenas por
+            # atualiza_ultima_tramitacao: uma instância lida antes da última
+            # tramitação não grava de volta o ponteiro antigo
+            update_fields = campos_exceto(
+                MateriaLegislativa, 'ultima_tramitacao')
+
         return models.Model.save(self, force_insert=force_insert,
                                  force_update=force_update,
                                  using=using,
@@ -988,6 +1007,18 @@ class UnidadeTramitacao(models.Model):
             return _('%(parlamentar)s') % {'parlamentar': self.parlamentar}
 
 
+def atualiza_ultima_tramitacao(materias):
+    """
+    Aponta ultima_tramitacao de cada matéria (ids ou queryset) para a sua
+    tramitação de maior id, com um único UPDATE.
+    """
+    MateriaLegislativa.objects.filter(pk__in=materias).update(
+        ultima_tramitacao=Subquery(
+            Tramitacao.objects.filter(
+                materia_id=OuterRef('pk')
+            ).order_by('-id').values('id')[:1]))
+
+
 @reversion.register()
 class Tramitacao(models.Model):
     TURNO_CHOICES = Choices(
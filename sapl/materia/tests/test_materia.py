@@ -3,7 +3,9 @@ from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
 from model_mommy import mommy
 import pytest
 
@@ -16,11 +18,13 @@ from sapl.materia.models import (Anexada, Autoria, DespachoInicial,
                                  TipoMateriaLegislativa, TipoProposicao,
                                  Tramitacao, UnidadeTramitacao)
 from sapl.materia.forms import (TramitacaoForm, compara_tramitacoes_mat, 
-                                TramitacaoUpdateForm)
+                                TramitacaoUpdateForm, filtra_tramitacao_status,
+                                TramitacaoEmLoteForm)
 from sapl.norma.models import (LegislacaoCitada, NormaJuridica,
                                TipoNormaJuridica)
 from sapl.parlamentares.models import Legislatura
-from sapl.utils import models_with_gr_for_model, lista_anexados
+from sapl.utils import (models_with_gr_for_model, lista_anexados,
+                        anexados_em_lote, anexacoes_ciclicas)
 
 
 @pytest.mark.django_db(transaction=False)
@@ -962,4 +966,99 @@ def test_tramitacoes_materias_anexadas(admin_client):
                     kwargs={'pk': tramitacao_principal.pk})
     response = admin_client.post(url, {'confirmar':'confirmar'} ,follow=True)
     assert Tramitacao.objects.filter(id=tramitacao_principal.pk).count() == 0
-    assert Tramitacao.objects.filter(id=tramitacao_anexada.pk).count() == 1
\ No newline at end of file
+    assert Tramitacao.objects.filter(id=tramitacao_anexada.pk).count() == 1
+
+@pytest.mark.django_db(transaction=False)
+def test_ultima_tramitacao_mantida_pelas_tramitacoes():
+    materia = mommy.make(MateriaLegislativa)
+    materia_desatualizada = MateriaLegislativa.objects.get(pk=materia.pk)
+
+    primeira = mommy.make(Tramitacao, materia=materia)
+    segunda = mommy.make(Tramitacao, materia=materia)
+
+    materia.refresh_from_db()
+    assert materia.ultima_tramitacao == segunda
+    assert list(filtra_tramitacao_status(segunda.status)) == [materia.pk]
+    assert not filtra_tramitacao_status(primeira.status).exists()
+
+    # o save de uma instância carregada antes não perde o ponteiro
+    # e não grava ultima_tramitacao
+    with CaptureQueriesContext(connection) as queries:
+        materia_desatualizada.save()
+    assert not any('"ultima_tramitacao_id"' in q['sql']
+                   for q in queries.captured_queries)
+    materia.refresh_from_db()
+    assert materia.ultima_tramitacao == segunda
+
+    segunda.delete()
+    materia.refresh_from_db()
+    assert materia.ultima_tramitacao == primeira
+
+
+@pytest.mark.django_db(transaction=False)
+def test_anexados_em_lote_com_ciclo():
+    a, b, c, d = mommy.make(MateriaLegislativa, _quantity=4)
+
+    mommy.make(Anexada, materia_principal=a, materia_anexada=b)
+    mommy.make(Anexada, materia_principal=b, materia_anexada=c)
+    mommy.make(Anexada, materia_principal=c, materia_anexada=a)
+
+    grafo = anexados_em_lote([a.pk, c.pk, d.pk])
+
+    assert grafo == {a.pk: {b.pk, c.pk}, c.pk: {a.pk, b.pk}, d.pk: set()}
+    assert grafo[a.pk] == {m.pk for m in lista_anexados(a)}
+
+
+@pytest.mark.django_db(transaction=False)
+def test_anexacoes_ciclicas():
+    a, b, c, d = mommy.make(MateriaLegislativa, _quantity=4)
+
+    mommy.make(Anexada, materia_principal=a, materia_anexada=b,
+               data_anexacao='2019-01-01')
+    ciclo = [
+        mommy.make(Anexada, materia_principal=b, materia_anexada=c,
+                   data_anexacao='2019-01-02'),
+        mommy.make(Anexada, materia_principal=c, materia_anexada=b,
+                   data_anexacao='2019-01-03'),
+        mommy.make(Anexada, materia_principal=d, materia_anexada=d,
+                   data_anexacao='2019-01-04'),
+    ]
+
+    assert list(anexacoes_ciclicas()) == ciclo
+    assert not anexacoes_ciclicas(False).exists()
+
+
+@pytest.mark.django_db(transaction=False)
+def test_tramitacao_em_lote_com_anexadas():
+    mommy.make(AppConfig, tramitacao_materia=True)
+
+    local = mommy.make(UnidadeTramitacao)
+    destino = mommy.make(UnidadeTramitacao)
+    status = mommy.make(StatusTramitacao, indicador='R')
+
+    principal, outra, anexada = mommy.make(MateriaLegislativa, _quantity=3)
+    # anexada a duas das matérias tramitadas: só uma tramitação é criada
+    mommy.make(Anexada, materia_principal=principal, materia_anexada=anexada)
+    mommy.make(Anexada, materia_principal=outra, materia_anexada=anexada)
+
+    form = TramitacaoEmLoteForm(initial={
+        'materias': [str(principal.pk), str(outra.pk)], 'ip': ''})
+    form.cleaned_data = {
+        'status': status,
+        'data_tramitacao': date(2020, 1, 10),
+        'unidade_tramitacao_local': local,
+        'unidade_tramitacao_destino': destino,
+        'data_encaminhamento': None,
+        'urgente': False,
+        'turno': '',
+        'texto': 'Texto',
+        'data_fim_prazo': None,
+    }
+    form.save()
+
+    assert len(form.tramitacoes) == 3
+    for materia in (principal, outra, anexada):
+        materia.refresh_from_db()
+        assert materia.em_tramitacao
+        assert materia.ultima_tramitacao.unidade_tramitacao_destino == destino
+        assert materia.tramitacao_set.count() == 1
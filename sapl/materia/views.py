@@ -16,6 +16,7 @@ from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.db.models import Max, Q
 from django.http import HttpResponse, JsonResponse
 from django.http.response import Http404, HttpResponseRedirect
@@ -30,7 +31,8 @@ from django_filters.views import FilterView
 import weasyprint
 
 import sapl
-from sapl.base.email_utils import do_envia_email_confirmacao
+from sapl.base.email_utils import (do_envia_email_confirmacao,
+                                   enfileira_email_tramitacao_em_lote)
 from sapl.base.models import Autor, CasaLegislativa, AppConfig as BaseAppConfig
 from sapl.base.signals import tramitacao_signal
 from sapl.comissoes.models import Comissao, Participacao, Composicao
@@ -2305,7 +2307,10 @@ class PrimeiraTramitacaoEmLoteView(PermissionRequiredMixin, FilterView):
                                                 'user': user, 'ip':ip})
 
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+                enfileira_email_tramitacao_em_lote(
+                    get_base_url(request), 'materia', form.tramitacoes)
 
             msg = _('Tramitação completa.')
             self.logger.info('user=' + user.username + '. Tramitação completa.')
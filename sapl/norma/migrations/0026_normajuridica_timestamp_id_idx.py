@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('norma', '0025_auto_20190704_1403'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='normajuridica',
+            index=models.Index(fields=['timestamp', 'id'], name='norma_timestamp_id_idx'),
+        ),
+    ]
@@ -158,6 +158,11 @@ class NormaJuridica(models.Model):
         verbose_name = _('Norma Jurídica')
         verbose_name_plural = _('Normas Jurídicas')
         ordering = ['-data', '-numero']
+        indexes = [
+            # paginação por chave do OAI-PMH (sapl.lexml.OAIServer)
+            models.Index(fields=['timestamp', 'id'],
+                         name='norma_timestamp_id_idx'),
+        ]
 
     def get_normas_relacionadas(self):
         principais = NormaRelacionada.objects.filter(
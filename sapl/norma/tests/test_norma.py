@@ -4,6 +4,7 @@ from model_mommy import mommy
 import pytest
 
 from sapl.base.models import AppConfig
+from sapl.lexml.models import LexmlMetadadoNorma
 from sapl.materia.models import MateriaLegislativa, TipoMateriaLegislativa
 from sapl.norma.forms import (NormaJuridicaForm, NormaPesquisaSimplesForm,
                               NormaRelacionadaForm)
@@ -156,3 +157,18 @@ def test_norma_pesquisa_form_datas_invalidas():
     assert not form.is_valid()
     assert form.errors['__all__'] == [_('A Data Final não pode ser menor que '
                                         'a Data Inicial')]
+
+
+@pytest.mark.django_db(transaction=False)
+def test_metadado_lexml_invalidado_ao_alterar_norma_ou_tipo():
+    tipo = mommy.make(TipoNormaJuridica)
+    norma_a, norma_b = mommy.make(NormaJuridica, tipo=tipo, _quantity=2)
+    for norma in (norma_a, norma_b):
+        mommy.make(LexmlMetadadoNorma, norma=norma)
+
+    norma_a.save()
+    assert list(LexmlMetadadoNorma.objects.values_list(
+        'norma_id', flat=True)) == [norma_b.id]
+
+    tipo.save()
+    assert not LexmlMetadadoNorma.objects.exists()
@@ -6,3 +6,6 @@ class AppConfig(apps.AppConfig):
     name = 'sapl.painel'
     label = 'painel'
     verbose_name = _('Painel Eletrônico')
+
+    def ready(self):
+        from sapl.painel import receivers
@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from sapl.base.cache_utils import get_sessao_plenaria_id, publica_painel
+from sapl.sessao.models import (ExpedienteMateria, OradorExpediente, OrdemDia,
+                                PresencaOrdemDia, RegistroVotacao,
+                                SessaoPlenaria, SessaoPlenariaPresenca,
+                                VotoParlamentar)
+
+
+@receiver(post_save, sender=SessaoPlenaria)
+@receiver(post_save, sender=OrdemDia)
+@receiver(post_save, sender=ExpedienteMateria)
+@receiver(post_save, sender=PresencaOrdemDia)
+@receiver(post_save, sender=SessaoPlenariaPresenca)
+@receiver(post_save, sender=RegistroVotacao)
+@receiver(post_save, sender=VotoParlamentar)
+@receiver(post_save, sender=OradorExpediente)
+@receiver(post_delete, sender=SessaoPlenaria)
+@receiver(post_delete, sender=OrdemDia)
+@receiver(post_delete, sender=ExpedienteMateria)
+@receiver(post_delete, sender=PresencaOrdemDia)
+@receiver(post_delete, sender=SessaoPlenariaPresenca)
+@receiver(post_delete, sender=RegistroVotacao)
+@receiver(post_delete, sender=VotoParlamentar)
+@receiver(post_delete, sender=OradorExpediente)
+def handle_painel_alterado(sender, instance, **kwargs):
+    sessao_plenaria_id = get_sessao_plenaria_id(instance)
+    if sessao_plenaria_id:
+        # publica somente após o commit, para que o novo snapshot
+        # não seja calculado com dados ainda não visíveis
+        transaction.on_commit(lambda: publica_painel(sessao_plenaria_id))
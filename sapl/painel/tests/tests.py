@@ -1,3 +1,92 @@
-# from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import pytest
+from django.core.urlresolvers import reverse
+
+from sapl.base.cache_utils import get_versao_painel, publica_painel
+from sapl.painel.views import get_snapshot_painel
+
+
+def test_publica_painel_altera_versao():
+    versao = get_versao_painel(-1)
+
+    assert get_versao_painel(-1) == versao
+
+    publica_painel(-1)
+
+    assert get_versao_painel(-1) != versao
+
+
+def test_snapshot_painel_calculado_uma_vez_por_versao():
+    publica_painel(-2)
+
+    with mock.patch('sapl.painel.views.monta_dados_painel') as monta:
+        monta.return_value = {'sessao_plenaria': 'Sessão'}
+
+        versao, dados = get_snapshot_painel(-2)
+        assert dados == {'sessao_plenaria': 'Sessão'}
+        assert get_snapshot_painel(-2) == (versao, dados)
+        assert monta.call_count == 1
+
+        publica_painel(-2)
+        assert get_snapshot_painel(-2)[0] != versao
+        assert monta.call_count == 2
+
+
+def test_snapshot_painel_libera_trava_se_montagem_falha():
+    publica_painel(-4)
+
+    with mock.patch('sapl.painel.views.monta_dados_painel') as monta:
+        monta.side_effect = Exception('erro')
+        with pytest.raises(Exception):
+            get_snapshot_painel(-4)
+
+        # a próxima requisição monta o snapshot sem esperar pela trava
+        monta.side_effect = None
+        monta.return_value = {'sessao_plenaria': 'Sessão'}
+        with mock.patch('sapl.base.cache_utils.time.sleep') as sleep:
+            assert get_snapshot_painel(-4)[1] == {'sessao_plenaria': 'Sessão'}
+            assert not sleep.called
+
+
+@pytest.mark.django_db(transaction=False)
+def test_dados_painel_responde_304_para_etag_atual(admin_client):
+    url = reverse('sapl.painel:dados_painel', kwargs={'pk': 9003})
+    publica_painel(9003)
+
+    with mock.patch('sapl.painel.views.monta_dados_painel') as monta:
+        monta.return_value = {'sessao_plenaria': 'Sessão'}
+
+        response = admin_client.get(url)
+        assert response.status_code == 200
+        assert response.json()['sessao_plenaria'] == 'Sessão'
+
+        etag = response['ETag']
+        assert etag == '"{}."'.format(get_versao_painel(9003))
+        response = admin_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert monta.call_count == 1
+
+        publica_painel(9003)
+        response = admin_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+
+@pytest.mark.django_db(transaction=False)
+def test_dados_painel_atualizados_com_cronometro_alterado(admin_client):
+    url = reverse('sapl.painel:dados_painel_atualizados',
+                  kwargs={'pk': 9005})
+    publica_painel(9005)
+
+    with mock.patch('sapl.painel.views.monta_dados_painel') as monta:
+        monta.return_value = {'sessao_plenaria': 'Sessão'}
+
+        versao = admin_client.get(url).json()['versao']
+
+        admin_client.get(reverse('sapl.painel:cronometro_painel'),
+                         {'tipo': 'discurso', 'action': 'start'})
+
+        response = admin_client.get(url, {'versao': versao})
+        assert response.status_code == 200
+        assert response.json()['cronometro_discurso'] == 'start'
+        assert response.json()['versao'] != versao
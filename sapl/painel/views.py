@@ -1,18 +1,26 @@
 import html
 import json
 import logging
+import time
+import uuid
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.http.response import Http404, HttpResponseRedirect
 from django.shortcuts import render
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.http import condition
 
+from sapl.base.cache_utils import (PAINEL_CACHE_TIMEOUT,
+                                   chave_snapshot_painel, get_snapshot,
+                                   get_versao_painel)
 from sapl.base.models import AppConfig as ConfiguracoesAplicacao
 from sapl.base.models import CasaLegislativa
 from sapl.crud.base import Crud
@@ -22,12 +30,18 @@ from sapl.sessao.models import (ExpedienteMateria, OradorExpediente, OrdemDia,
                                 PresencaOrdemDia, RegistroVotacao,
                                 SessaoPlenaria, SessaoPlenariaPresenca,
                                 VotoParlamentar)
-from sapl.utils import filiacao_data, get_client_ip, sort_lista_chave
+from sapl.sessao.views import get_presencas_parlamentares
+from sapl.utils import get_client_ip, sort_lista_chave
 
 from .models import Cronometro
 
 VOTACAO_NOMINAL = 2
 
+# Intervalo, em segundos, entre as verificações de versão no long-poll
+PAINEL_INTERVALO_VERIFICACAO = 0.5
+
+CRONOMETROS = ('aparte', 'discurso', 'ordem', 'consideracoes')
+
 CronometroPainelCrud = Crud.build(Cronometro, '')
 
 # FIXME mudar lógica
@@ -334,6 +348,8 @@ def painel_votacao_view(request):
 @user_passes_test(check_permission)
 def cronometro_painel(request):
     request.session[request.GET['tipo']] = request.GET['action']
+    request.session.save()
+    publica_cronometros(request)
     return HttpResponse({})
 
 
@@ -355,18 +371,18 @@ def get_materia_aberta(pk):
 
 
 def get_presentes(pk, response, materia):
+    sessao = SessaoPlenaria.objects.get(id=pk)
+
     if type(materia) == OrdemDia:
-        presentes = PresencaOrdemDia.objects.filter(
-            sessao_plenaria_id=pk)
+        presencas = get_presencas_parlamentares(sessao, PresencaOrdemDia)
     else:
-        presentes = SessaoPlenariaPresenca.objects.filter(
-            sessao_plenaria_id=pk)
+        presencas = get_presencas_parlamentares(sessao,
+                                                SessaoPlenariaPresenca)
 
-    sessao = SessaoPlenaria.objects.get(id=pk)
-    num_presentes = len(presentes)
-    data_sessao = sessao.data_inicio
+    num_presentes = len(presencas)
     oradores = OradorExpediente.objects.filter(
-        sessao_plenaria_id=pk).order_by('numero_ordem')
+        sessao_plenaria_id=pk).select_related(
+        'parlamentar').order_by('numero_ordem')
 
     oradores_list = []
     for o in oradores:
@@ -378,27 +394,18 @@ def get_presentes(pk, response, materia):
             })
 
     presentes_list = []
-    for p in presentes:
-        legislatura = sessao.legislatura
-        # Recupera os mandatos daquele parlamentar
-        mandatos = p.parlamentar.mandato_set.filter(legislatura=legislatura)
-
-        if p.parlamentar.ativo and mandatos:
-            filiacao = filiacao_data(p.parlamentar, data_sessao, data_sessao)
-            if not filiacao:
-                partido = 'Sem Registro'
-            else:
-                partido = filiacao
+    for p in presencas:
+        parlamentar = p['parlamentar']
 
+        if parlamentar.ativo and p['mandato']:
             presentes_list.append(
-                {'id': p.id,
-                 'parlamentar_id': p.parlamentar.id,
-                 'nome': p.parlamentar.nome_parlamentar,
-                 'partido': partido,
+                {'id': p['presenca'].id,
+                 'parlamentar_id': parlamentar.id,
+                 'nome': parlamentar.nome_parlamentar,
+                 'partido': p['partido'] or 'Sem Registro',
                  'voto': ''
                  })
-
-        elif not p.parlamentar.ativo or not mandatos:
+        else:
             num_presentes += -1
 
     if materia:
@@ -436,11 +443,10 @@ def get_materia_expediente_aberta(pk):
 def response_nenhuma_materia(response):
     response.update({
         'msg_painel': str(_('Nenhuma matéria disponivel para votação.'))})
-    return JsonResponse(response)
+    return response
 
 
 def get_votos(response, materia):
-    logger = logging.getLogger(__name__)
     if type(materia) == OrdemDia:
         registro = RegistroVotacao.objects.filter(
             ordem=materia, materia=materia.materia).last()
@@ -463,22 +469,16 @@ def get_votos(response, materia):
         if materia.tipo_votacao == 2:
             if tipo == 'ordem':
                 votos_parlamentares = VotoParlamentar.objects.filter(
-                    ordem_id=materia.id).order_by(
-                        'parlamentar__nome_parlamentar')
+                    ordem_id=materia.id)
             else:
                 votos_parlamentares = VotoParlamentar.objects.filter(
-                    expediente_id=materia.id).order_by(
-                        'parlamentar__nome_parlamentar')
-
-            for i, p in enumerate(response['presentes']):
-                try:
-                    logger.info("Tentando obter votos do parlamentar (id={}).".format(p['parlamentar_id']))
-                    if votos_parlamentares.get(parlamentar_id=p['parlamentar_id']).voto:
-                        response['presentes'][i]['voto'] = 'Voto Informado'
-                except ObjectDoesNotExist:
-                    logger.error("Votos do parlamentar (id={}) não encontrados. Retornado vazio."
-                                 .format(p['parlamentar_id']))
-                    response['presentes'][i]['voto'] = ''
+                    expediente_id=materia.id)
+
+            votos = dict(votos_parlamentares.values_list(
+                'parlamentar_id', 'voto'))
+            for p in response['presentes']:
+                p['voto'] = 'Voto Informado' \
+                    if votos.get(p['parlamentar_id']) else ''
 
     else:
         total = (registro.numero_votos_sim +
@@ -486,18 +486,10 @@ def get_votos(response, materia):
                  registro.numero_abstencoes)
 
         if materia.tipo_votacao == 2:
-            votos_parlamentares = VotoParlamentar.objects.filter(
-                votacao_id=registro.id).order_by(
-                    'parlamentar__nome_parlamentar')
-
-            for i, p in enumerate(response['presentes']):
-                try:
-                    logger.debug("Tentando obter votos do parlamentar (id={}).".format(p['parlamentar_id']))
-                    response['presentes'][i]['voto'] = votos_parlamentares.get(
-                        parlamentar_id=p['parlamentar_id']).voto
-                except ObjectDoesNotExist:
-                    logger.error("Votos do parlamentar (id={}) não encontrados. Retornado None.".format(p['parlamentar_id']))
-                    response['presentes'][i]['voto'] = None
+            votos = dict(VotoParlamentar.objects.filter(
+                votacao_id=registro.id).values_list('parlamentar_id', 'voto'))
+            for p in response['presentes']:
+                p['voto'] = votos.get(p['parlamentar_id'])
 
         response.update({
             'numero_votos_sim': registro.numero_votos_sim,
@@ -511,8 +503,52 @@ def get_votos(response, materia):
     return response
 
 
-@user_passes_test(check_permission)
-def get_dados_painel(request, pk):
+def chave_cronometros(session_key):
+    return 'painel:cronometros:{}'.format(session_key)
+
+
+def get_snapshot_painel(pk):
+    """
+    Retorna a tupla (versao, dados) com o estado do painel calculado
+    para a versão atual. Apenas uma requisição calcula o snapshot de
+    cada versão; as demais aguardam o resultado no cache.
+    """
+    versao = get_versao_painel(pk)
+    dados = get_snapshot(chave_snapshot_painel(pk, versao),
+                         lambda: monta_dados_painel(pk),
+                         PAINEL_CACHE_TIMEOUT)
+    return versao, dados
+
+
+def publica_cronometros(request):
+    """
+    Publica no cache, com uma nova versão, os cronômetros guardados na
+    sessão do usuário, para que o painel os leia sem recarregar a sessão.
+    """
+    cache.set(chave_cronometros(request.session.session_key), {
+        'versao': uuid.uuid4().hex,
+        'cronometros': {'cronometro_' + c: get_cronometro_status(request, c)
+                        for c in CRONOMETROS}},
+        PAINEL_CACHE_TIMEOUT)
+
+
+def get_cronometros(request):
+    """
+    Retorna a tupla (versao, cronometros) publicada por publica_cronometros.
+    """
+    estado = cache.get(chave_cronometros(request.session.session_key))
+    if estado:
+        return estado['versao'], estado['cronometros']
+    # cronômetros ainda não publicados: estão apenas na sessão
+    return '', {'cronometro_' + c: get_cronometro_status(request, c)
+                for c in CRONOMETROS}
+
+
+def monta_dados_painel(pk):
+    """
+    Monta o estado do painel que é comum a todas as telas, ou seja,
+    tudo exceto os cronômetros, que ficam na sessão do usuário.
+    """
     sessao = SessaoPlenaria.objects.get(id=pk)
 
     casa = CasaLegislativa.objects.first()
@@ -531,10 +567,6 @@ def get_dados_painel(request, pk):
         'sessao_solene': sessao.tipo.nome == "Solene",
         'sessao_finalizada': sessao.finalizada,
         'tema_solene': sessao.tema_solene,
-        'cronometro_aparte': get_cronometro_status(request, 'aparte'),
-        'cronometro_discurso': get_cronometro_status(request, 'discurso'),
-        'cronometro_ordem': get_cronometro_status(request, 'ordem'),
-        'cronometro_consideracoes': get_cronometro_status(request, 'consideracoes'),
         'status_painel': sessao.painel_aberto,
         'brasao': brasao
     }
@@ -545,13 +577,9 @@ def get_dados_painel(request, pk):
     # Caso tenha alguma matéria com votação aberta, ela é mostrada no painel
     # com prioridade para Ordem do Dia.
     if ordem_dia:
-        return JsonResponse(get_votos(
-            get_presentes(pk, response, ordem_dia),
-            ordem_dia))
+        return get_votos(get_presentes(pk, response, ordem_dia), ordem_dia)
     elif expediente:
-        return JsonResponse(get_votos(
-            get_presentes(pk, response, expediente),
-            expediente))
+        return get_votos(get_presentes(pk, response, expediente), expediente)
 
     # Caso não tenha nenhuma aberta,
     # a matéria a ser mostrada no Painel deve ser a última votada
@@ -580,9 +608,46 @@ def get_dados_painel(request, pk):
         elif last_expediente_voto:
             materia = ultimo_expediente_votado
 
-        return JsonResponse(get_votos(
-                            get_presentes(pk, response, materia),
-                            materia))
+        return get_votos(get_presentes(pk, response, materia), materia)
 
     # Retorna que não há nenhuma matéria já votada ou aberta
     return response_nenhuma_materia(get_presentes(pk, response, None))
+
+
+def get_etag_painel(request, pk):
+    return '{}.{}'.format(get_versao_painel(pk),
+                          get_cronometros(request)[0])
+
+
+@user_passes_test(check_permission)
+@condition(etag_func=get_etag_painel)
+def get_dados_painel(request, pk):
+    dados = get_snapshot_painel(pk)[1]
+    return JsonResponse(dict(dados, **get_cronometros(request)[1]))
+
+
+@user_passes_test(check_permission)
+def get_dados_painel_atualizados(request, pk):
+    """
+    Long-poll do painel: mantém a requisição aberta por até
+    PAINEL_LONG_POLL_TIMEOUT segundos, até que a versão do painel (ou dos
+    cronômetros do usuário) seja diferente da informada pelo cliente.
+    Se nada mudar, responde 304 e o cliente volta a perguntar.
+    """
+    versao_cliente = request.GET.get('versao', '')
+    limite = time.time() + settings.PAINEL_LONG_POLL_TIMEOUT
+
+    versao = get_etag_painel(request, pk)
+    while versao == versao_cliente and time.time() < limite:
+        time.sleep(PAINEL_INTERVALO_VERIFICACAO)
+        versao = get_etag_painel(request, pk)
+
+    if versao == versao_cliente:
+        return HttpResponseNotModified()
+
+    versao_painel, dados = get_snapshot_painel(pk)
+    versao_cronometros, cronometros = get_cronometros(request)
+    response = dict(dados)
+    response.update(cronometros)
+    response['versao'] = '{}.{}'.format(versao_painel, versao_cronometros)
+    return JsonResponse(response)
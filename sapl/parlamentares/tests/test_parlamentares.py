@@ -348,3 +348,28 @@ def test_frente_form_valido():
                             })
 
     assert form.is_valid()
+
+
+@pytest.mark.django_db(transaction=False)
+def test_filiacoes_data_em_lote():
+    from sapl.utils import filiacao_data, filiacoes_data
+
+    parlamentar_a = mommy.make(Parlamentar)
+    parlamentar_b = mommy.make(Parlamentar)
+    parlamentar_c = mommy.make(Parlamentar)
+    partido_x = mommy.make(Partido, sigla='PX')
+    partido_y = mommy.make(Partido, sigla='PY')
+
+    mommy.make(Filiacao, parlamentar=parlamentar_a, partido=partido_x,
+               data='2016-01-01', data_desfiliacao=None)
+    mommy.make(Filiacao, parlamentar=parlamentar_b, partido=partido_x,
+               data='2015-01-01', data_desfiliacao='2016-06-01')
+    mommy.make(Filiacao, parlamentar=parlamentar_b, partido=partido_y,
+               data='2016-06-02', data_desfiliacao=None)
+
+    siglas = filiacoes_data(
+        [parlamentar_a, parlamentar_b, parlamentar_c], '2016-03-01')
+
+    assert siglas == {parlamentar_a.pk: 'PX', parlamentar_b.pk: 'PX'}
+    assert filiacao_data(parlamentar_b, '2016-07-01') == 'PY'
+    assert filiacao_data(parlamentar_c, '2016-07-01') == ''
@@ -8,7 +8,6 @@ from django import forms
 from django.core.exceptions import (MultipleObjectsReturned,
                                     ObjectDoesNotExist, ValidationError)
 from django.db import models, transaction
-from django.db.models import Max
 from django.forms import ModelForm
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
@@ -1321,34 +1320,27 @@ class DesvincularMateriaForm(forms.Form):
 
 
 def pega_ultima_tramitacao_adm():
-    return TramitacaoAdministrativo.objects.values(
-        'documento_id').annotate(data_encaminhamento=Max(
-            'data_encaminhamento'),
-        id=Max('id')).values_list('id', flat=True)
+    return DocumentoAdministrativo.objects.filter(
+        ultima_tramitacao__isnull=False).values_list(
+        'ultima_tramitacao_id', flat=True)
 
 
 def filtra_tramitacao_adm_status(status):
-    lista = pega_ultima_tramitacao_adm()
-    return TramitacaoAdministrativo.objects.filter(
-        id__in=lista,
-        status=status).distinct().values_list('documento_id', flat=True)
+    return DocumentoAdministrativo.objects.filter(
+        ultima_tramitacao__status=status).values_list('id', flat=True)
 
 
 def filtra_tramitacao_adm_destino(destino):
-    lista = pega_ultima_tramitacao_adm()
-    return TramitacaoAdministrativo.objects.filter(
-        id__in=lista,
-        unidade_tramitacao_destino=destino).distinct().values_list(
-            'documento_id', flat=True)
+    return DocumentoAdministrativo.objects.filter(
+        ultima_tramitacao__unidade_tramitacao_destino=destino).values_list(
+            'id', flat=True)
 
 
 def filtra_tramitacao_adm_destino_and_status(status, destino):
-    lista = pega_ultima_tramitacao_adm()
-    return TramitacaoAdministrativo.objects.filter(
-        id__in=lista,
-        status=status,
-        unidade_tramitacao_destino=destino).distinct().values_list(
-            'documento_id', flat=True)
+    return DocumentoAdministrativo.objects.filter(
+        ultima_tramitacao__status=status,
+        ultima_tramitacao__unidade_tramitacao_destino=destino).values_list(
+            'id', flat=True)
 
 
 class FichaPesquisaAdmForm(forms.Form):
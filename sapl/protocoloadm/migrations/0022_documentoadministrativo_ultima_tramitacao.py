@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('protocoloadm', '0021_merge_20190429_1531'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentoadministrativo',
+            name='ultima_tramitacao',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='protocoloadm.TramitacaoAdministrativo', verbose_name='Última Tramitação'),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE protocoloadm_documentoadministrativo d
+            SET ultima_tramitacao_id = t.id
+            FROM (SELECT documento_id, max(id) AS id
+                  FROM protocoloadm_tramitacaoadministrativo
+                  GROUP BY documento_id) t
+            WHERE t.documento_id = d.id;
+            """,
+            migrations.RunSQL.noop),
+    ]
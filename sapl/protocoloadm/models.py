@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from model_utils import Choices
@@ -7,7 +8,7 @@ import reversion
 from sapl.base.models import Autor
 from sapl.materia.models import TipoMateriaLegislativa, UnidadeTramitacao
 from sapl.utils import (RANGE_ANOS, YES_NO_CHOICES, texto_upload_path,
-                        get_settings_auth_user_model)
+                        get_settings_auth_user_model, campos_exceto)
 
 
 @reversion.register()
@@ -154,6 +155,15 @@ class DocumentoAdministrativo(models.Model):
         verbose_name=_('Em Tramitação?'),
         choices=YES_NO_CHOICES,
         default=False)
+    # mantida por sapl.base.receivers (veja atualiza_ultima_tramitacao_adm)
+    ultima_tramitacao = models.ForeignKey(
+        'TramitacaoAdministrativo',
+        blank=True,
+        null=True,
+        editable=False,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        verbose_name=_('Última Tramitação'))
     assunto = models.TextField(verbose_name=_('Assunto'))
     numero_externo = models.PositiveIntegerField(
         blank=True,
@@ -210,6 +220,14 @@ class DocumentoAdministrativo(models.Model):
                               update_fields=update_fields)
             self.texto_integral = texto_integral
 
+        if update_fields is None and not force_insert and \
+                not self._state.adding:
+            # ultima_tramitacao é mantida apenas por
+            # atualiza_ultima_tramitacao_adm: uma instância lida antes da
+            # última tramitação não grava de volta o ponteiro antigo
+            update_fields = campos_exceto(
+                DocumentoAdministrativo, 'ultima_tramitacao')
+
         return models.Model.save(self, force_insert=force_insert,
                                  force_update=force_update,
                                  using=using,
@@ -292,6 +310,18 @@ class StatusTramitacaoAdministrativo(models.Model):
         return self.descricao
 
 
+def atualiza_ultima_tramitacao_adm(documentos):
+    """
+    Aponta ultima_tramitacao de cada documento (ids ou queryset) para a sua
+    tramitação de maior id, com um único UPDATE.
+    """
+    DocumentoAdministrativo.objects.filter(pk__in=documentos).update(
+        ultima_tramitacao=Subquery(
+            TramitacaoAdministrativo.objects.filter(
+                documento_id=OuterRef('pk')
+            ).order_by('-id').values('id')[:1]))
+
+
 @reversion.register()
 class TramitacaoAdministrativo(models.Model):
     status = models.ForeignKey(
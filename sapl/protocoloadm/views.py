@@ -47,6 +47,7 @@ from .forms import (AcompanhamentoDocumentoForm, AnularProtocoloAdmForm,
                     DesvincularDocumentoForm, DesvincularMateriaForm,
                     filtra_tramitacao_adm_destino_and_status,
                     filtra_tramitacao_adm_destino, filtra_tramitacao_adm_status,
+                    pega_ultima_tramitacao_adm,
                     AnexadoForm, AnexadoEmLoteFilterSet,
                     PrimeiraTramitacaoEmLoteAdmFilterSet,
                     TramitacaoEmLoteAdmForm,
@@ -1559,33 +1560,14 @@ class TramitacaoEmLoteAdmView(PrimeiraTramitacaoEmLoteAdmView):
 
         return context
 
-
     def pega_ultima_tramitacao(self):
-        return TramitacaoAdministrativo.objects.values(
-            'documento_id').annotate(data_encaminhamento=Max(
-                'data_encaminhamento'),
-            id=Max('id')).values_list('id', flat=True)
+        return pega_ultima_tramitacao_adm()
 
-    
     def filtra_tramitacao_status(self, status):
-        lista = self.pega_ultima_tramitacao()
-        return TramitacaoAdministrativo.objects.filter(
-            id__in=lista,
-            status=status).distinct().values_list('documento_id', flat=True)
-
+        return filtra_tramitacao_adm_status(status)
 
     def filtra_tramitacao_destino(self, destino):
-        lista = self.pega_ultima_tramitacao()
-        return TramitacaoAdministrativo.objects.filter(
-            id__in=lista,
-            unidade_tramitacao_destino=destino).distinct().values_list(
-                'documento_id', flat=True)
-
+        return filtra_tramitacao_adm_destino(destino)
 
     def filtra_tramitacao_destino_and_status(self, status, destino):
-        lista = self.pega_ultima_tramitacao()
-        return TramitacaoAdministrativo.objects.filter(
-            id__in=lista,
-            status=status,
-            unidade_tramitacao_destino=destino).distinct().values_list(
-                'documento_id', flat=True)
+        return filtra_tramitacao_adm_destino_and_status(status, destino)
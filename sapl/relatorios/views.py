@@ -25,12 +25,14 @@ from sapl.sessao.models import (ExpedienteMateria, ExpedienteSessao,
                                 SessaoPlenariaPresenca, OcorrenciaSessao,
                                 RegistroVotacao, VotoParlamentar, OradorOrdemDia)
 from sapl.settings import STATIC_ROOT
-from sapl.utils import LISTA_DE_UFS, TrocaTag, filiacao_data
+from sapl.utils import LISTA_DE_UFS, TrocaTag
 
 from sapl.sessao.views import (get_identificação_basica, get_mesa_diretora,
-                               get_presenca_sessao, get_expedientes,
+                               get_presenca_sessao, get_presencas_parlamentares,
+                               get_expedientes,
                                get_materias_expediente, get_oradores_expediente,
                                get_presenca_ordem_do_dia, get_materias_ordem_do_dia,
+                               get_dados_materias_sessao, get_snapshot_pauta,
                                get_oradores_ordemdia,
                                get_oradores_explicações_pessoais, get_ocorrencias_da_sessão, get_assinaturas)
 
@@ -555,15 +557,12 @@ def get_sessao_plenaria(sessao, casa):
 
     # Lista de presença na sessão
     lst_presenca_sessao = []
-    presenca = SessaoPlenariaPresenca.objects.filter(
-        sessao_plenaria=sessao).order_by('parlamentar__nome_parlamentar')
-
-    for parlamentar in [p.parlamentar for p in presenca]:
+    for presenca in get_presencas_parlamentares(
+            sessao, SessaoPlenariaPresenca):
         dic_presenca = {}
-        dic_presenca["nom_parlamentar"] = parlamentar.nome_parlamentar
-        partido_sigla = filiacao_data(parlamentar, sessao.data_inicio)
-
-        dic_presenca['sgl_partido'] = partido_sigla
+        dic_presenca["nom_parlamentar"] = (
+            presenca['parlamentar'].nome_parlamentar)
+        dic_presenca['sgl_partido'] = presenca['partido']
         lst_presenca_sessao.append(dic_presenca)
 
     # Lista de ausencias na sessão
@@ -678,7 +677,9 @@ def get_sessao_plenaria(sessao, casa):
         registro = RegistroVotacao.objects.filter(expediente=mevn)
         
         if registro:
-            for vp in VotoParlamentar.objects.filter(votacao=registro).order_by('parlamentar'):
+            for vp in VotoParlamentar.objects.filter(
+                    votacao=registro).select_related(
+                    'parlamentar').order_by('parlamentar'):
                 votos_materia.append(vp)
         
         dic_expediente_materia_vot_nom = {
@@ -711,15 +712,11 @@ def get_sessao_plenaria(sessao, casa):
 
     # Lista presença na ordem do dia
     lst_presenca_ordem_dia = []
-    presenca_ordem_dia = PresencaOrdemDia.objects.filter(
-        sessao_plenaria=sessao).order_by('parlamentar__nome_parlamentar')
-    for parlamentar in [p.parlamentar for p in presenca_ordem_dia]:
+    for presenca in get_presencas_parlamentares(sessao, PresencaOrdemDia):
         dic_presenca_ordem_dia = {}
         dic_presenca_ordem_dia['nom_parlamentar'] = (
-            parlamentar.nome_parlamentar)
-        sigla = filiacao_data(parlamentar, sessao.data_inicio)
-
-        dic_presenca_ordem_dia['sgl_partido'] = sigla
+            presenca['parlamentar'].nome_parlamentar)
+        dic_presenca_ordem_dia['sgl_partido'] = presenca['partido']
         lst_presenca_ordem_dia.append(dic_presenca_ordem_dia)
 
     # Lista das matérias da Ordem do Dia, incluindo o resultado das votacoes
@@ -789,7 +786,9 @@ def get_sessao_plenaria(sessao, casa):
         registro_od = RegistroVotacao.objects.filter(ordem=modvn)
         
         if registro_od:
-            for vp_od in VotoParlamentar.objects.filter(votacao=registro_od).order_by('parlamentar'):
+            for vp_od in VotoParlamentar.objects.filter(
+                    votacao=registro_od).select_related(
+                    'parlamentar').order_by('parlamentar'):
                 votos_materia_od.append(vp_od)
         
         dic_votacao_vot_nom = {
@@ -1181,86 +1180,34 @@ def get_pauta_sessao(sessao, casa):
     inf_basicas_dic["hr_fim_sessao"] = sessao.hora_fim
     inf_basicas_dic["nom_camara"] = casa.nome
 
-    lst_expediente_materia = []
-    for expediente_materia in ExpedienteMateria.objects.filter(sessao_plenaria=sessao):
-
-        materia = MateriaLegislativa.objects.filter(
-            id=expediente_materia.materia.id).first()
-
-        dic_expediente_materia = {}
-        dic_expediente_materia["tipo_materia"] = materia.tipo.sigla + \
-            ' - ' + materia.tipo.descricao
-        dic_expediente_materia["num_ordem"] = str(
-            expediente_materia.numero_ordem)
-        dic_expediente_materia["id_materia"] = str(
-            materia.numero) + "/" + str(materia.ano)
-        dic_expediente_materia["txt_ementa"] = materia.ementa
-        dic_expediente_materia["ordem_observacao"] = str(
-            expediente_materia.observacao)
-
-        dic_expediente_materia["des_numeracao"] = ' '
-
-        numeracao = Numeracao.objects.filter(materia=materia)
-        if numeracao:
-            numeracao = numeracao.first()
-            dic_expediente_materia["des_numeracao"] = str(numeracao)
-
-        dic_expediente_materia["nom_autor"] = ''
-        autoria = materia.autoria_set.all()
-        dic_expediente_materia['num_autores'] = 'Autores' if len(
-            autoria) > 1 else 'Autor'
-        if autoria:
-            for a in autoria:
-                if a.autor.nome:
-                    dic_expediente_materia['nom_autor'] += a.autor.nome + ', '
-            dic_expediente_materia['nom_autor'] = dic_expediente_materia['nom_autor'][:-2]
-        else:
-            dic_expediente_materia["nom_autor"] = 'Desconhecido'
-
-        turno, tramitacao = get_turno(materia)
-
-        dic_expediente_materia["des_turno"] = turno
-        dic_expediente_materia["des_situacao"] = tramitacao
+    def dic_item_pauta(item):
+        dic_item = {}
+        dic_item["tipo_materia"] = item['tipo_materia']
+        dic_item["num_ordem"] = item['numero']
+        dic_item["id_materia"] = item['identificacao']
+        dic_item["txt_ementa"] = item['ementa']
+        dic_item["ordem_observacao"] = item['observacao']
+        dic_item["des_numeracao"] = item['numeracao'] or ' '
+        dic_item["des_turno"] = item['turno']
+        dic_item["des_situacao"] = (item['situacao'] or 'Não informada'
+                                    if item['tramitada'] else '')
+        dic_item['num_autores'] = 'Autores' if len(
+            item['autor']) > 1 else 'Autor'
+        dic_item["nom_autor"] = ', '.join(
+            item['nomes_autores']) if item['autor'] else 'Desconhecido'
+        return dic_item
+
+    # a pauta em cache é compartilhada com PautaSessaoDetailView
+    pauta = get_snapshot_pauta(sessao.pk)
 
+    lst_expediente_materia = []
+    for item in pauta['materia_expediente']:
+        dic_expediente_materia = dic_item_pauta(item)
+        dic_expediente_materia["num_ordem"] = str(item['numero'])
+        dic_expediente_materia["ordem_observacao"] = str(item['observacao'])
         lst_expediente_materia.append(dic_expediente_materia)
 
-    lst_votacao = []
-    for votacao in OrdemDia.objects.filter(
-            sessao_plenaria=sessao):
-        materia = MateriaLegislativa.objects.filter(
-            id=votacao.materia.id).first()
-        dic_votacao = {}
-        dic_votacao["tipo_materia"] = materia.tipo.sigla + \
-            ' - ' + materia.tipo.descricao
-        dic_votacao["num_ordem"] = votacao.numero_ordem
-        dic_votacao["id_materia"] = str(
-            materia.numero) + "/" + str(materia.ano)
-        dic_votacao["txt_ementa"] = materia.ementa
-        dic_votacao["ordem_observacao"] = votacao.observacao
-
-        dic_votacao["des_numeracao"] = ' '
-
-        numeracao = Numeracao.objects.filter(materia=votacao.materia).first()
-        if numeracao:
-            dic_votacao["des_numeracao"] = str(
-                numeracao.numero_materia) + '/' + str(numeracao.ano_materia)
-
-        turno, tramitacao = get_turno(materia)
-        dic_votacao["des_turno"] = turno
-        dic_votacao["des_situacao"] = tramitacao
-
-        dic_votacao["nom_autor"] = ''
-        autoria = materia.autoria_set.all()
-        dic_votacao['num_autores'] = 'Autores' if len(autoria) > 1 else 'Autor'
-        if autoria:
-            for a in autoria:
-                if a.autor.nome:
-                    dic_votacao['nom_autor'] += a.autor.nome + ', '
-            dic_votacao['nom_autor'] = dic_votacao['nom_autor'][:-2]
-        else:
-            dic_votacao["nom_autor"] = 'Desconhecido'
-
-        lst_votacao.append(dic_votacao)
+    lst_votacao = [dic_item_pauta(item) for item in pauta['materias_ordem']]
 
     return (lst_expediente_materia,
             lst_votacao,
@@ -1305,10 +1252,11 @@ def resumo_ata_pdf(request,pk):
     context.update(get_mesa_diretora(sessao_plenaria))
     context.update(get_presenca_sessao(sessao_plenaria))
     context.update(get_expedientes(sessao_plenaria))
-    context.update(get_materias_expediente(sessao_plenaria))
+    dados_materias = get_dados_materias_sessao(sessao_plenaria)
+    context.update(get_materias_expediente(sessao_plenaria, dados_materias))
     context.update(get_oradores_expediente(sessao_plenaria))
     context.update(get_presenca_ordem_do_dia(sessao_plenaria))
-    context.update(get_materias_ordem_do_dia(sessao_plenaria))
+    context.update(get_materias_ordem_do_dia(sessao_plenaria, dados_materias))
     context.update(get_oradores_ordemdia(sessao_plenaria))
     context.update(get_oradores_explicações_pessoais(sessao_plenaria))
     context.update(get_ocorrencias_da_sessão(sessao_plenaria))
@@ -231,6 +231,10 @@ rules_group_geral = {
          [RP_ADD], __perms_publicas__),
         (base.TipoAutor, __base__, __perms_publicas__),
         (base.Autor, __base__, __perms_publicas__),
+        (base.IndexacaoPendente, __base__, set()),
+        (base.TextoExtraido, __base__, set()),
+        (base.ControleReindexacao, __base__, set()),
+        (base.EmailTramitacaoPendente, __base__, set()),
 
         (protocoloadm.StatusTramitacaoAdministrativo, __base__, set()),
         (protocoloadm.TipoDocumentoAdministrativo, __base__, set()),
@@ -294,6 +298,7 @@ rules_group_geral = {
 
         (lexml.LexmlProvedor, __base__, set()),
         (lexml.LexmlPublicador, __base__, set()),
+        (lexml.LexmlMetadadoNorma, __base__, set()),
 
         (compilacao.VeiculoPublicacao, __base__, __perms_publicas__),
         (compilacao.TipoTextoArticulado, __base__, __perms_publicas__),
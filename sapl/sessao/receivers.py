@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from sapl.base.cache_utils import (get_sessao_plenaria_id, publica_pauta,
+                                   publica_pautas_materias)
+from sapl.base.signals import tramitacoes_em_lote_signal
+from sapl.materia.models import (Autoria, MateriaLegislativa, Numeracao,
+                                 TipoMateriaLegislativa, Tramitacao)
+from sapl.sessao.models import (ExpedienteMateria, ExpedienteSessao, OrdemDia,
+                                RegistroVotacao, SessaoPlenaria)
+
+
+@receiver(post_save, sender=SessaoPlenaria)
+@receiver(post_save, sender=ExpedienteMateria)
+@receiver(post_save, sender=OrdemDia)
+@receiver(post_save, sender=RegistroVotacao)
+@receiver(post_save, sender=ExpedienteSessao)
+@receiver(post_delete, sender=SessaoPlenaria)
+@receiver(post_delete, sender=ExpedienteMateria)
+@receiver(post_delete, sender=OrdemDia)
+@receiver(post_delete, sender=RegistroVotacao)
+@receiver(post_delete, sender=ExpedienteSessao)
+def handle_pauta_alterada(sender, instance, **kwargs):
+    sessao_plenaria_id = get_sessao_plenaria_id(instance)
+    if sessao_plenaria_id:
+        # publica somente após o commit, para que a nova pauta
+        # não seja montada com dados ainda não visíveis
+        transaction.on_commit(lambda: publica_pauta(sessao_plenaria_id))
+
+
+@receiver(post_save, sender=MateriaLegislativa)
+@receiver(post_save, sender=Tramitacao)
+@receiver(post_save, sender=Autoria)
+@receiver(post_save, sender=Numeracao)
+@receiver(post_delete, sender=Tramitacao)
+@receiver(post_delete, sender=Autoria)
+@receiver(post_delete, sender=Numeracao)
+def handle_materia_pauta_alterada(sender, instance, **kwargs):
+    materia_id = instance.pk if sender == MateriaLegislativa \
+        else instance.materia_id
+    transaction.on_commit(lambda: publica_pautas_materias([materia_id]))
+
+
+@receiver(post_save, sender=TipoMateriaLegislativa)
+def handle_tipo_materia_pauta_alterado(sender, instance, **kwargs):
+    materias = MateriaLegislativa.objects.filter(
+        tipo=instance).values('id')
+    transaction.on_commit(lambda: publica_pautas_materias(materias))
+
+
+@receiver(tramitacoes_em_lote_signal)
+def handle_tramitacoes_em_lote(sender, materias, **kwargs):
+    materias = list(materias)
+    transaction.on_commit(lambda: publica_pautas_materias(materias))
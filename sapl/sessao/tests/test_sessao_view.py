@@ -1,5 +1,9 @@
+from unittest import mock
+
 import pytest
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.translation import ugettext_lazy as _
 from model_mommy import mommy
 
@@ -8,7 +12,9 @@ from sapl.sessao.models import (SessaoPlenaria, TipoSessaoPlenaria,
                                  IntegranteMesa, SessaoPlenariaPresenca,
                                  JustificativaAusencia, ExpedienteSessao,
                                  TipoExpediente, ExpedienteMateria,
-                                 Orador, OcorrenciaSessao)
+                                 Orador, OcorrenciaSessao, OrdemDia,
+                                 RegistroVotacao, VotoParlamentar)
+from sapl.materia.models import MateriaLegislativa, Numeracao, Tramitacao
 
 from sapl.parlamentares.models import Parlamentar, CargoMesa, Filiacao
 
@@ -17,8 +23,12 @@ from sapl.sessao.views import (get_identificação_basica, get_conteudo_multimid
                                 get_expedientes, get_materias_expediente,
                                 get_oradores_expediente, get_presenca_ordem_do_dia,
                                 get_materias_ordem_do_dia, get_oradores_explicações_pessoais,
-                                get_ocorrencias_da_sessão
+                                get_ocorrencias_da_sessão, get_turno,
+                                get_snapshot_pauta, get_dados_materias_sessao,
+                                get_votos_nominais
                                 )
+from sapl.base.cache_utils import (get_versao_pauta, publica_pauta,
+                                   publica_pautas_materias)
 
 
 @pytest.mark.django_db(transaction=False)
@@ -127,7 +137,50 @@ class TestResumoView():
         }]
 
     def test_get_materias_expediente(self):
-        pass
+        materia = mommy.make(MateriaLegislativa)
+        mommy.make(Tramitacao, materia=materia, turno='P')
+        mommy.make(Tramitacao, materia=materia, turno='')
+        expediente = mommy.make(ExpedienteMateria,
+                                sessao_plenaria=self.sessao_plenaria,
+                                materia=materia)
+        registro = mommy.make(RegistroVotacao, expediente=expediente,
+                              materia=materia)
+
+        resultado = get_materias_expediente(self.sessao_plenaria)
+
+        [mat] = resultado['materia_expediente']
+        assert mat['titulo'] == materia
+        assert mat['turno'] == get_turno('P')
+        assert mat['resultado'] == registro.tipo_resultado_votacao.nome
+        assert mat['autor'] == []
+        assert mat['numero_processo'] is None
+
+    def test_get_materias_ordem_do_dia_consultas_constantes(self):
+        def consultas():
+            with CaptureQueriesContext(connection) as ctx:
+                get_materias_ordem_do_dia(self.sessao_plenaria)
+            return len(ctx)
+
+        def cria_item():
+            ordem = mommy.make(OrdemDia, sessao_plenaria=self.sessao_plenaria,
+                               tipo_votacao=2)
+            registro = mommy.make(RegistroVotacao, ordem=ordem,
+                                  materia=ordem.materia)
+            mommy.make(VotoParlamentar, ordem=ordem, votacao=registro)
+            mommy.make(Tramitacao, materia=ordem.materia, turno='U')
+            return ordem
+
+        cria_item()
+        numero_consultas = consultas()
+
+        for _i in range(3):
+            cria_item()
+        assert consultas() == numero_consultas
+
+        materias = get_materias_ordem_do_dia(
+            self.sessao_plenaria)['materias_ordem']
+        assert len(materias) == 4
+        assert all(len(m['voto_nominal']) == 1 for m in materias)
 
     def test_get_oradores_explicações_pessoais(self):
         parlamentar = mommy.make(Parlamentar)
@@ -146,4 +199,70 @@ class TestResumoView():
         ocorrencia = mommy.make(OcorrenciaSessao, sessao_plenaria=self.sessao_plenaria)
         resultado_get_ocorrencia = get_ocorrencias_da_sessão(self.sessao_plenaria)
 
-        assert resultado_get_ocorrencia['ocorrencias_da_sessao'][0] == ocorrencia
\ No newline at end of file
+        assert resultado_get_ocorrencia['ocorrencias_da_sessao'][0] == ocorrencia
+
+
+@pytest.mark.django_db(transaction=False)
+def test_votos_nominais_em_ordem_alfabetica_de_parlamentar():
+    ordem = mommy.make(OrdemDia, tipo_votacao=2)
+    registro = mommy.make(RegistroVotacao, ordem=ordem, materia=ordem.materia)
+    for nome in ('Carla', 'Ana', 'Bruno'):
+        mommy.make(VotoParlamentar, ordem=ordem, votacao=registro,
+                   parlamentar=mommy.make(Parlamentar, nome_parlamentar=nome))
+
+    dados = get_dados_materias_sessao(ordem.sessao_plenaria)
+    [votacao] = get_votos_nominais(dados, 'ordens')
+
+    assert [v.parlamentar.nome_parlamentar for v in votacao['votos']] == [
+        'Ana', 'Bruno', 'Carla']
+
+
+@pytest.mark.django_db(transaction=False)
+def test_pauta_montada_uma_vez_por_versao():
+    sessao = mommy.make(SessaoPlenaria)
+    publica_pauta(sessao.pk)
+
+    with mock.patch('sapl.sessao.views.monta_pauta_sessao') as monta:
+        monta.return_value = {'materias_ordem': []}
+
+        assert get_snapshot_pauta(sessao.pk) == {'materias_ordem': []}
+        get_snapshot_pauta(sessao.pk)
+        assert monta.call_count == 1
+
+        publica_pauta(sessao.pk)
+        get_snapshot_pauta(sessao.pk)
+        assert monta.call_count == 2
+
+
+@pytest.mark.django_db(transaction=False)
+def test_pauta_publicada_pelas_materias():
+    ordem = mommy.make(OrdemDia)
+    outra_sessao = mommy.make(SessaoPlenaria)
+    mommy.make(Tramitacao, materia=ordem.materia, turno='P')
+
+    versao = get_versao_pauta(ordem.sessao_plenaria_id)
+    versao_outra = get_versao_pauta(outra_sessao.pk)
+
+    publica_pautas_materias([ordem.materia_id])
+
+    assert get_versao_pauta(ordem.sessao_plenaria_id) != versao
+    assert get_versao_pauta(outra_sessao.pk) == versao_outra
+
+    [item] = get_snapshot_pauta(ordem.sessao_plenaria_id)['materias_ordem']
+    assert item['titulo'] == str(ordem.materia)
+    assert item['turno'] == get_turno('P')
+    assert item['autor'] == []
+
+
+@pytest.mark.django_db(transaction=False)
+def test_pauta_publicada_ao_alterar_numeracao():
+    ordem = mommy.make(OrdemDia)
+    versao = get_versao_pauta(ordem.sessao_plenaria_id)
+
+    with mock.patch('sapl.sessao.receivers.transaction.on_commit') as commit:
+        mommy.make(Numeracao, materia=ordem.materia)
+        # executa o que seria feito após o commit
+        for chamada in commit.call_args_list:
+            chamada[0][0]()
+
+    assert get_versao_pauta(ordem.sessao_plenaria_id) != versao
@@ -1,4 +1,6 @@
 
+from collections import defaultdict
+from itertools import chain
 import logging
 from re import sub
 
@@ -23,19 +25,22 @@ from django.views.generic.detail import DetailView
 from django.views.generic.edit import FormMixin
 from django_filters.views import FilterView
 
+from sapl.base.cache_utils import (PAUTA_CACHE_TIMEOUT, chave_snapshot_pauta,
+                                   get_snapshot, get_versao_pauta)
 from sapl.base.models import AppConfig as AppsAppConfig
 from sapl.crud.base import (RP_DETAIL, RP_LIST, Crud, CrudAux,
                             MasterDetailCrud,
                             PermissionRequiredForAppCrudMixin, make_pagination)
 from sapl.materia.forms import filtra_tramitacao_status
-from sapl.materia.models import (Autoria, TipoMateriaLegislativa,
+from sapl.materia.models import (Autoria, Numeracao, TipoMateriaLegislativa,
                                  Tramitacao)
 from sapl.materia.views import MateriaLegislativaPesquisaView
 from sapl.parlamentares.models import (Filiacao, Legislatura, Mandato,
                                        Parlamentar, SessaoLegislativa)
 from sapl.sessao.apps import AppConfig
 from sapl.sessao.forms import ExpedienteMateriaForm, OrdemDiaForm
-from sapl.utils import show_results_filter_set, remover_acentos, get_client_ip
+from sapl.utils import (anota_filiacoes_data, get_client_ip,
+                        remover_acentos, show_results_filter_set)
 
 from .forms import (AdicionarVariasMateriasFilterSet, BancadaForm,
                     ExpedienteForm, JustificativaAusenciaForm, OcorrenciaSessaoForm, ListMateriaForm,
@@ -1575,19 +1580,50 @@ def get_conteudo_multimidia(sessao_plenaria):
     return context
 
 
+def get_presencas_parlamentares(sessao_plenaria,
+                                model=SessaoPlenariaPresenca):
+    """
+    Resolve as presenças (SessaoPlenariaPresenca ou PresencaOrdemDia) de uma
+    sessão em número constante de consultas: carrega os parlamentares, os
+    que têm mandato na legislatura da sessão e as filiações na data da
+    sessão, que ficam anotadas nos parlamentares para filiacao_data.
+    """
+    presencas = list(model.objects.filter(
+        sessao_plenaria_id=sessao_plenaria.id
+    ).select_related('parlamentar').order_by('parlamentar__nome_parlamentar'))
+
+    parlamentares = [p.parlamentar for p in presencas]
+    anota_filiacoes_data(parlamentares, sessao_plenaria.data_inicio)
+
+    com_mandato = set(Mandato.objects.filter(
+        legislatura_id=sessao_plenaria.legislatura_id,
+        parlamentar__in=parlamentares).values_list(
+        'parlamentar_id', flat=True))
+
+    return [{'presenca': p,
+             'parlamentar': p.parlamentar,
+             'mandato': p.parlamentar_id in com_mandato,
+             'partido': p.parlamentar._filiacoes_data[
+                 sessao_plenaria.data_inicio]}
+            for p in presencas]
+
+
 def get_mesa_diretora(sessao_plenaria):
     mesa = IntegranteMesa.objects.filter(
-        sessao_plenaria=sessao_plenaria).order_by('cargo_id')
+        sessao_plenaria=sessao_plenaria).select_related(
+        'parlamentar', 'cargo').order_by('cargo_id')
     integrantes = [{'parlamentar': m.parlamentar,
                     'cargo': m.cargo} for m in mesa]
+    anota_filiacoes_data([i['parlamentar'] for i in integrantes],
+                         sessao_plenaria.data_inicio)
     return {'mesa': integrantes}
 
 
 def get_presenca_sessao(sessao_plenaria):
 
-    parlamentares_sessao = [p.parlamentar for p in SessaoPlenariaPresenca.objects.filter(
-        sessao_plenaria_id=sessao_plenaria.id
-    ).order_by('parlamentar__nome_parlamentar')]
+    parlamentares_sessao = [
+        p['parlamentar'] for p in get_presencas_parlamentares(
+            sessao_plenaria, SessaoPlenariaPresenca)]
 
     ausentes_sessao = JustificativaAusencia.objects.filter(
         sessao_plenaria_id=sessao_plenaria.id
@@ -1609,53 +1645,142 @@ def get_expedientes(sessao_plenaria):
     return ({'expedientes': expedientes})
 
 
-def get_materias_expediente(sessao_plenaria):
-    materias = ExpedienteMateria.objects.filter(
-        sessao_plenaria_id=sessao_plenaria.id)
-
-    materias_expediente = []
-    for m in materias:
-
-        ementa = m.materia.ementa
-        titulo = m.materia
-        numero = m.numero_ordem
-
-        tramitacao = ''
-        tramitacoes = Tramitacao.objects.filter(
-            materia=m.materia).order_by('-pk')
-        for aux_tramitacao in tramitacoes:
-            if aux_tramitacao.turno:
-                tramitacao = aux_tramitacao
-                break
+def get_dados_materias_sessao(sessao_plenaria):
+    """
+    Carrega as matérias do expediente e da ordem do dia de uma sessão com
+    tudo o que o resumo e a ata usam: último turno tramitado, registros de
+    votação, retiradas de pauta, votos nominais, autorias e numerações.
+    O número de consultas não depende da quantidade de itens da sessão.
+    """
+    expedientes = list(ExpedienteMateria.objects.filter(
+        sessao_plenaria_id=sessao_plenaria.id).select_related(
+        'materia__tipo'))
+    ordens = list(OrdemDia.objects.filter(
+        sessao_plenaria_id=sessao_plenaria.id).select_related(
+        'materia__tipo'))
+
+    materias = {i.materia_id for i in chain(expedientes, ordens)}
+    ids_expediente = {e.id for e in expedientes}
+    ids_ordem = {o.id for o in ordens}
+
+    # último turno tramitado de cada matéria
+    turnos = dict(Tramitacao.objects.filter(
+        materia_id__in=materias).exclude(turno='').order_by(
+        'materia_id', '-pk').distinct('materia_id').values_list(
+        'materia_id', 'turno'))
+
+    registros_expediente = defaultdict(list)
+    registros_ordem = defaultdict(list)
+    for r in RegistroVotacao.objects.filter(
+            Q(expediente_id__in=ids_expediente) |
+            Q(ordem_id__in=ids_ordem)).select_related(
+            'tipo_resultado_votacao').order_by('pk'):
+        if r.expediente_id:
+            registros_expediente[r.expediente_id].append(r)
+        if r.ordem_id:
+            registros_ordem[r.ordem_id].append(r)
+
+    retiradas_expediente = defaultdict(list)
+    retiradas_ordem = defaultdict(list)
+    for r in RetiradaPauta.objects.filter(
+            Q(expediente_id__in=ids_expediente) |
+            Q(ordem_id__in=ids_ordem)).select_related(
+            'tipo_de_retirada').order_by('pk'):
+        if r.expediente_id:
+            retiradas_expediente[r.expediente_id].append(r)
+        if r.ordem_id:
+            retiradas_ordem[r.ordem_id].append(r)
+
+    registros = [r.id for r in chain(*registros_expediente.values(),
+                                     *registros_ordem.values())]
+    votos_ordem = defaultdict(list)
+    votos_registro = defaultdict(list)
+    for v in VotoParlamentar.objects.filter(
+            Q(ordem_id__in=ids_ordem) |
+            Q(votacao_id__in=registros)).select_related(
+            'parlamentar').order_by('pk'):
+        if v.ordem_id in ids_ordem:
+            votos_ordem[v.ordem_id].append(v)
+        if v.votacao_id:
+            votos_registro[v.votacao_id].append(v)
+
+    autores = defaultdict(list)
+    for a in Autoria.objects.filter(
+            materia_id__in=materias).select_related(
+            'autor__user').prefetch_related('autor__autor_related'):
+        autores[a.materia_id].append(str(a.autor))
+
+    # a última numeração na ordenação padrão, como em numeracao_set.last()
+    numeracoes = {n.materia_id: n for n in Numeracao.objects.filter(
+        materia_id__in=materias)}
+
+    return {'expedientes': expedientes,
+            'ordens': ordens,
+            'turnos': turnos,
+            'registros_expediente': registros_expediente,
+            'registros_ordem': registros_ordem,
+            'retiradas_expediente': retiradas_expediente,
+            'retiradas_ordem': retiradas_ordem,
+            'votos_ordem': votos_ordem,
+            'votos_registro': votos_registro,
+            'autores': autores,
+            'numeracoes': numeracoes}
+
+
+def get_resultado_item(registro, retirada):
+    if registro:
+        return registro.tipo_resultado_votacao.nome, registro.observacao
+    elif retirada:
+        return retirada.tipo_de_retirada.descricao, retirada.observacao
+    return _('Matéria não votada'), _(' ')
+
+
+def get_votos_nominais(dados, tipo='ordens'):
+    """
+    Votos das votações nominais das matérias do expediente
+    (tipo='expedientes') ou da ordem do dia (tipo='ordens') a partir de
+    get_dados_materias_sessao.
+    """
+    registros = dados['registros_expediente' if tipo == 'expedientes'
+                      else 'registros_ordem']
+    itens = sorted((i for i in dados[tipo] if i.tipo_votacao == 2),
+                   key=lambda i: i.materia_id, reverse=True)
+
+    votacoes = []
+    for item in itens:
+        votos = [v for r in registros[item.id]
+                 for v in dados['votos_registro'][r.id]]
+        votacoes.append({
+            'titulo': item.materia,
+            # como order_by('parlamentar'), que segue Parlamentar.Meta.ordering
+            'votos': sorted(votos, key=lambda v: (
+                v.parlamentar.nome_parlamentar, v.parlamentar_id))
+        })
+    return votacoes
 
-        turno = None
-        if tramitacao:
-            turno = get_turno(tramitacao.turno)
-
-        rv = m.registrovotacao_set.first()
-        rp = m.retiradapauta_set.filter(materia=m.materia).first()
-        if rv:
-            resultado = rv.tipo_resultado_votacao.nome
-            resultado_observacao = rv.observacao
-        elif rp:
-            resultado = rp.tipo_de_retirada.descricao
-            resultado_observacao = rp.observacao
-        else:
-            resultado = _('Matéria não votada')
-            resultado_observacao = _(' ')
 
-        autoria = Autoria.objects.filter(materia_id=m.materia_id)
-        autor = [str(x.autor) for x in autoria]
+def get_materias_expediente(sessao_plenaria, dados=None):
+    if dados is None:
+        dados = get_dados_materias_sessao(sessao_plenaria)
 
-        mat = {'ementa': ementa,
-               'titulo': titulo,
-               'numero': numero,
-               'turno': turno,
+    materias_expediente = []
+    for m in dados['expedientes']:
+        turno = dados['turnos'].get(m.materia_id)
+
+        rv = next(iter(dados['registros_expediente'][m.id]), None)
+        rp = next((r for r in dados['retiradas_expediente'][m.id]
+                   if r.materia_id == m.materia_id), None)
+        resultado, resultado_observacao = get_resultado_item(rv, rp)
+
+        mat = {'ementa': m.materia.ementa,
+               'titulo': m.materia,
+               'numero': m.numero_ordem,
+               'turno': get_turno(turno) if turno else None,
                'resultado': resultado,
                'resultado_observacao': resultado_observacao,
-               'autor': autor,
+               'autor': dados['autores'][m.materia_id],
                'numero_protocolo': m.materia.numero_protocolo,
-               'numero_processo': m.materia.numeracao_set.last(),
+               'numero_processo': dados['numeracoes'].get(m.materia_id),
                'observacao': m.observacao
                }
         materias_expediente.append(mat)
@@ -1683,9 +1808,9 @@ def get_oradores_expediente(sessao_plenaria):
 
 
 def get_presenca_ordem_do_dia(sessao_plenaria):
-    parlamentares_ordem = [p.parlamentar for p in PresencaOrdemDia.objects.filter(
-        sessao_plenaria_id=sessao_plenaria.id
-    ).order_by('parlamentar__nome_parlamentar')]
+    parlamentares_ordem = [
+        p['parlamentar'] for p in get_presencas_parlamentares(
+            sessao_plenaria, PresencaOrdemDia)]
 
     return {'presenca_ordem': parlamentares_ordem}
 
@@ -1697,9 +1822,9 @@ def get_assinaturas(sessao_plenaria):
         [m['parlamentar'] for m in mesa_dia if m['cargo'].descricao == 'Presidente']),
         '')]
 
-    parlamentares_ordem = [p.parlamentar for p in PresencaOrdemDia.objects.filter(
-        sessao_plenaria_id=sessao_plenaria.id
-    ).order_by('parlamentar__nome_parlamentar')]
+    parlamentares_ordem = [
+        p['parlamentar'] for p in get_presencas_parlamentares(
+            sessao_plenaria, PresencaOrdemDia)]
 
     parlamentares_mesa = [m['parlamentar'] for m in mesa_dia]
 
@@ -1727,75 +1852,46 @@ def get_assinaturas(sessao_plenaria):
     return context
 
 
-def get_materias_ordem_do_dia(sessao_plenaria):
-    ordem = OrdemDia.objects.filter(sessao_plenaria_id=sessao_plenaria.id)
+def get_materias_ordem_do_dia(sessao_plenaria, dados=None):
+    if dados is None:
+        dados = get_dados_materias_sessao(sessao_plenaria)
+
     materias_ordem = []
-    for o in ordem:
-        ementa = o.materia.ementa
-        ementa_observacao = o.observacao
-        titulo = o.materia
-        numero = o.numero_ordem
-
-        tramitacao = ''
-        tramitacoes = Tramitacao.objects.filter(
-            materia=o.materia).order_by('-pk')
-        for aux_tramitacao in tramitacoes:
-            if aux_tramitacao.turno:
-                tramitacao = aux_tramitacao
-                break
-
-        turno = None
-        if tramitacao:
-            turno = get_turno(tramitacao.turno)
+    for o in dados['ordens']:
+        turno = dados['turnos'].get(o.materia_id)
+        registros = dados['registros_ordem'][o.id]
 
         # Verificar resultado
-        rv = o.registrovotacao_set.filter(materia=o.materia).first()
-        rp = o.retiradapauta_set.filter(materia=o.materia).first()
-        if rv:
-            resultado = rv.tipo_resultado_votacao.nome
-            resultado_observacao = rv.observacao
-
-        elif rp:
-            resultado = rp.tipo_de_retirada.descricao
-            resultado_observacao = rp.observacao
+        rv = next((r for r in registros
+                   if r.materia_id == o.materia_id), None)
+        rp = next((r for r in dados['retiradas_ordem'][o.id]
+                   if r.materia_id == o.materia_id), None)
+        resultado, resultado_observacao = get_resultado_item(rv, rp)
 
-        else:
-            resultado = _('Matéria não votada')
-            resultado_observacao = _(' ')
-
-        voto_sim = ""
-        voto_nao = ""
-        voto_abstencoes = ""
         voto_nominal = []
-
         if o.tipo_votacao == 2:
-            votos = VotoParlamentar.objects.filter(ordem=o.id)
-            for voto in votos:
-                aux_voto = (voto.parlamentar.nome_completo, voto.voto)
-                voto_nominal.append(aux_voto)
-        try:
-            voto = RegistroVotacao.objects.filter(ordem=o.id).last()
-            voto_sim = voto.numero_votos_sim
-            voto_nao = voto.numero_votos_nao
-            voto_abstencoes = voto.numero_abstencoes
-        except AttributeError:
+            voto_nominal = [(v.parlamentar.nome_completo, v.voto)
+                            for v in dados['votos_ordem'][o.id]]
+
+        if registros:
+            voto_sim = registros[-1].numero_votos_sim
+            voto_nao = registros[-1].numero_votos_nao
+            voto_abstencoes = registros[-1].numero_abstencoes
+        else:
             voto_sim = " Não Informado"
             voto_nao = " Não Informado"
             voto_abstencoes = " Não Informado"
 
-        autoria = Autoria.objects.filter(
-            materia_id=o.materia_id)
-        autor = [str(x.autor) for x in autoria]
-        mat = {'ementa': ementa,
-               'ementa_observacao': ementa_observacao,
-               'titulo': titulo,
-               'numero': numero,
-               'turno': turno,
+        mat = {'ementa': o.materia.ementa,
+               'ementa_observacao': o.observacao,
+               'titulo': o.materia,
+               'numero': o.numero_ordem,
+               'turno': get_turno(turno) if turno else None,
                'resultado': resultado,
                'resultado_observacao': resultado_observacao,
-               'autor': autor,
+               'autor': dados['autores'][o.materia_id],
                'numero_protocolo': o.materia.numero_protocolo,
-               'numero_processo': o.materia.numeracao_set.last(),
+               'numero_processo': dados['numeracoes'].get(o.materia_id),
                'tipo_votacao': o.TIPO_VOTACAO_CHOICES[o.tipo_votacao],
                'voto_sim': voto_sim,
                'voto_nao': voto_nao,
@@ -1872,28 +1968,11 @@ class ResumoView(DetailView):
         self.object = self.get_object()
         context = self.get_context_data(object=self.object)
 
-        # Votos de Votação Nominal de Matérias Expediente
-        materias_expediente_votacao_nominal = ExpedienteMateria.objects.filter(
-            sessao_plenaria_id=self.object.id,
-            tipo_votacao=2).order_by('-materia')
-
-        votacoes = []
-        for mevn in materias_expediente_votacao_nominal:
-
-            votos_materia = []
-            titulo_materia = mevn.materia
-            registro = RegistroVotacao.objects.filter(expediente=mevn)
-            if registro:
-                for vp in VotoParlamentar.objects.filter(votacao=registro).order_by('parlamentar'):
-                    votos_materia.append(vp)
-
-            dados_votacao = {
-                'titulo': titulo_materia,
-                'votos': votos_materia
-            }
-            votacoes.append(dados_votacao)
+        dados_materias = get_dados_materias_sessao(self.object)
 
-        context.update({'votos_nominais_materia_expediente': votacoes})
+        # Votos de Votação Nominal de Matérias Expediente
+        context.update({'votos_nominais_materia_expediente':
+                        get_votos_nominais(dados_materias, 'expedientes')})
 
         # =====================================================================
         # Identificação Básica
@@ -1912,7 +1991,7 @@ class ResumoView(DetailView):
         context.update(get_expedientes(self.object))
         # =====================================================================
         # Matérias Expediente
-        context.update(get_materias_expediente(self.object))
+        context.update(get_materias_expediente(self.object, dados_materias))
         # =====================================================================
         # Oradores Expediente
         context.update(get_oradores_expediente(self.object))
@@ -1925,28 +2004,10 @@ class ResumoView(DetailView):
         # =====================================================================
         # Matérias Ordem do Dia
         # Votos de Votação Nominal de Matérias Ordem do Dia
-        materias_ordem_dia_votacao_nominal = OrdemDia.objects.filter(
-            sessao_plenaria_id=self.object.id,
-            tipo_votacao=2).order_by('-materia')
-
-        votacoes_od = []
-        for modvn in materias_ordem_dia_votacao_nominal:
-            votos_materia_od = []
-            t_materia = modvn.materia
-            registro_od = RegistroVotacao.objects.filter(ordem=modvn)
-            if registro_od:
-                for vp_od in VotoParlamentar.objects.filter(votacao=registro_od).order_by('parlamentar'):
-                    votos_materia_od.append(vp_od)
-
-            dados_votacao_od = {
-                'titulo': t_materia,
-                'votos': votos_materia_od
-            }
-            votacoes_od.append(dados_votacao_od)
-
-        context.update({'votos_nominais_materia_ordem_dia': votacoes_od})
+        context.update({'votos_nominais_materia_ordem_dia':
+                        get_votos_nominais(dados_materias, 'ordens')})
 
-        context.update(get_materias_ordem_do_dia(self.object))
+        context.update(get_materias_ordem_do_dia(self.object, dados_materias))
         # =====================================================================
         # Oradores Ordem do Dia
         context.update(get_oradores_ordemdia(self.object))
@@ -3238,6 +3299,101 @@ class PautaSessaoView(TemplateView):
             reverse('sapl.sessao:pauta_sessao_detail', kwargs={'pk': sessao.pk}))
 
 
+def get_snapshot_pauta(pk):
+    """
+    Retorna a pauta da Sessão Plenária montada para a versão atual. Apenas
+    uma requisição monta a pauta de cada versão; as demais aguardam o
+    resultado no cache.
+    """
+    return get_snapshot(chave_snapshot_pauta(pk, get_versao_pauta(pk)),
+                        lambda: monta_pauta_sessao(pk),
+                        PAUTA_CACHE_TIMEOUT)
+
+
+def monta_pauta_sessao(pk):
+    """
+    Monta a pauta da Sessão Plenária apenas com dados simples, sem
+    instâncias de modelos, para ser guardada no cache e compartilhada pela
+    página pública da pauta e pelo relatório em PDF.
+    """
+    expedientes = list(ExpedienteMateria.objects.filter(
+        sessao_plenaria_id=pk).select_related(
+        'materia__tipo', 'materia__ultima_tramitacao__status'))
+    ordens = list(OrdemDia.objects.filter(
+        sessao_plenaria_id=pk).select_related(
+        'materia__tipo', 'materia__ultima_tramitacao__status'))
+
+    materias = {i.materia_id for i in chain(expedientes, ordens)}
+
+    registros = {}
+    for r in RegistroVotacao.objects.filter(
+            Q(expediente__sessao_plenaria_id=pk) |
+            Q(ordem__sessao_plenaria_id=pk)).select_related(
+            'tipo_resultado_votacao').order_by('-pk'):
+        # em ordem decrescente, fica o primeiro registro de cada item
+        registros[('expediente', r.expediente_id)] = r
+        registros[('ordem', r.ordem_id)] = r
+
+    autores = defaultdict(list)
+    for a in Autoria.objects.filter(
+            materia_id__in=materias).select_related(
+            'autor__user').prefetch_related('autor__autor_related'):
+        autores[a.materia_id].append(a.autor)
+
+    numeracoes = {}
+    for n in Numeracao.objects.filter(materia_id__in=materias):
+        numeracoes.setdefault(n.materia_id, n)
+
+    def item_pauta(item, registro):
+        materia = item.materia
+        tramitacao = materia.ultima_tramitacao
+        numeracao = numeracoes.get(materia.id)
+
+        if registro:
+            resultado = registro.tipo_resultado_votacao.nome
+            resultado_observacao = registro.observacao
+        else:
+            resultado = str(_('Matéria não votada'))
+            resultado_observacao = ' '
+
+        return {
+            'id': materia.id,
+            'titulo': str(materia),
+            'tipo_materia': '{} - {}'.format(materia.tipo.sigla,
+                                             materia.tipo.descricao),
+            'identificacao': '{}/{}'.format(materia.numero, materia.ano),
+            'ementa': materia.ementa,
+            'observacao': item.observacao,
+            'numero': item.numero_ordem,
+            'resultado': resultado,
+            'resultado_observacao': resultado_observacao,
+            'tramitada': bool(tramitacao),
+            'situacao': str(tramitacao.status)
+            if tramitacao and tramitacao.status else None,
+            'turno': get_turno(tramitacao.turno) if tramitacao else '',
+            'autor': [str(a) for a in autores[materia.id]],
+            'nomes_autores': [a.nome for a in autores[materia.id] if a.nome],
+            'numeracao': str(numeracao) if numeracao else None,
+        }
+
+    expedientes_sessao = [{
+        'tipo': str(e.tipo),
+        'conteudo': sub('&nbsp;', ' ', strip_tags(
+            e.conteudo.replace('<br/>', '\n')))
+    } for e in ExpedienteSessao.objects.filter(
+        sessao_plenaria_id=pk).select_related('tipo')]
+
+    return {
+        'materia_expediente': [
+            item_pauta(e, registros.get(('expediente', e.id)))
+            for e in expedientes],
+        'materias_ordem': [
+            item_pauta(o, registros.get(('ordem', o.id)))
+            for o in ordens],
+        'expedientes': expedientes_sessao,
+    }
+
+
 class PautaSessaoDetailView(DetailView):
     template_name = "sessao/pauta_sessao_detail.html"
     model = SessaoPlenaria
@@ -3261,110 +3417,14 @@ class PautaSessaoDetailView(DetailView):
                 'encerramento': encerramento},
         ]})
         # =====================================================================
-        # Matérias Expediente
-        materias = ExpedienteMateria.objects.filter(
-            sessao_plenaria_id=self.object.id)
-
-        materias_expediente = []
-        for m in materias:
-            ementa = m.materia.ementa
-            titulo = m.materia
-            numero = m.numero_ordem
-
-            ultima_tramitacao = m.materia.tramitacao_set.last()
-
-            situacao = ultima_tramitacao.status if ultima_tramitacao else None
-
-            if situacao is None:
-                situacao = _("Não informada")
-            rv = m.registrovotacao_set.all()
-            if rv:
-                resultado = rv[0].tipo_resultado_votacao.nome
-                resultado_observacao = rv[0].observacao
-            else:
-                resultado = _('Matéria não votada')
-                resultado_observacao = _(' ')
-
-            autoria = Autoria.objects.filter(materia_id=m.materia_id)
-            autor = [str(x.autor) for x in autoria]
-
-            mat = {'id': m.materia_id,
-                   'ementa': ementa,
-                   'observacao': m.observacao,
-                   'titulo': titulo,
-                   'numero': numero,
-                   'resultado': resultado,
-                   'resultado_observacao': resultado_observacao,
-                   'situacao': situacao,
-                   'autor': autor
-                   }
-            materias_expediente.append(mat)
-
-        context.update({'materia_expediente': materias_expediente})
-        # =====================================================================
-        # Expedientes
-        expediente = ExpedienteSessao.objects.filter(
-            sessao_plenaria_id=self.object.id)
-
-        expedientes = []
-        for e in expediente:
-            tipo = TipoExpediente.objects.get(
-                id=e.tipo_id)
-            conteudo = sub(
-                '&nbsp;', ' ', strip_tags(e.conteudo.replace('<br/>', '\n')))
-
-            ex = {'tipo': tipo, 'conteudo': conteudo}
-            expedientes.append(ex)
-
-        context.update({'expedientes': expedientes})
+        # Matérias Expediente, Expedientes e Matérias Ordem do Dia
+        context.update(get_snapshot_pauta(self.object.pk))
         # =====================================================================
         # Orador Expediente
         oradores = OradorExpediente.objects.filter(
             sessao_plenaria_id=self.object.id).order_by('numero_ordem')
         context.update({'oradores': oradores})
-        # =====================================================================
-        # Matérias Ordem do Dia
-        ordem = OrdemDia.objects.filter(
-            sessao_plenaria_id=self.object.id)
-
-        materias_ordem = []
-        for o in ordem:
-            ementa = o.materia.ementa
-            titulo = o.materia
-            numero = o.numero_ordem
-
-            ultima_tramitacao = o.materia.tramitacao_set.last()
 
-            situacao = ultima_tramitacao.status if ultima_tramitacao else None
-
-            if situacao is None:
-                situacao = _("Não informada")
-            # Verificar resultado
-            rv = o.registrovotacao_set.all()
-            if rv:
-                resultado = rv[0].tipo_resultado_votacao.nome
-                resultado_observacao = rv[0].observacao
-            else:
-                resultado = _('Matéria não votada')
-                resultado_observacao = _(' ')
-
-            autoria = Autoria.objects.filter(
-                materia_id=o.materia_id)
-            autor = [str(x.autor) for x in autoria]
-
-            mat = {'id': o.materia_id,
-                   'ementa': ementa,
-                   'observacao': o.observacao,
-                   'titulo': titulo,
-                   'numero': numero,
-                   'resultado': resultado,
-                   'resultado_observacao': resultado_observacao,
-                   'situacao': situacao,
-                   'autor': autor
-                   }
-            materias_ordem.append(mat)
-
-        context.update({'materias_ordem': materias_ordem})
         context.update({'subnav_template_name': 'sessao/pauta_subnav.yaml'})
 
         return self.render_to_response(context)
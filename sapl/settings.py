@@ -114,7 +114,9 @@ SOLR_URL = config('SOLR_URL', cast=str, default='http://localhost:8983')
 SOLR_COLLECTION = config('SOLR_COLLECTION', cast=str, default='sapl')
 
 if USE_SOLR:
-    HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'  # enable auto-index
+    # enable auto-index: os objetos alterados são enfileirados e indexados
+    # em lote pelo comando processa_fila_indexacao
+    HAYSTACK_SIGNAL_PROCESSOR = 'sapl.base.search_indexes.FilaIndexacaoSignalProcessor'
     SEARCH_BACKEND = 'haystack.backends.solr_backend.SolrEngine'
     SEARCH_URL = ('URL', '{}/solr/{}'.format(SOLR_URL, SOLR_COLLECTION))
 
@@ -156,6 +158,12 @@ CACHES = {
     }
 }
 
+# Tempo máximo, em segundos, que o long-poll do painel aguarda por mudanças.
+# Com workers síncronos do gunicorn cada tela em espera ocupa um worker,
+# portanto só aumente este valor com workers assíncronos (ex.: gevent).
+PAINEL_LONG_POLL_TIMEOUT = config(
+    'PAINEL_LONG_POLL_TIMEOUT', cast=int, default=0)
+
 REST_FRAMEWORK = {
     "UNICODE_JSON": False,
     "DEFAULT_PARSER_CLASSES": (
@@ -8,3 +8,16 @@ def test_listify():
         yield 1
         yield 2
     assert [1, 2] == gen()
+
+
+def test_hash_conteudo_arquivo(tmpdir):
+    import hashlib
+    from .utils import gerar_hash_arquivo, hash_conteudo_arquivo
+
+    conteudo = b'%PDF-1.4 ' * 100000
+    arquivo = tmpdir.join('texto.pdf')
+    arquivo.write_binary(conteudo)
+
+    md5 = hashlib.md5(conteudo).hexdigest()
+    assert hash_conteudo_arquivo(str(arquivo), block_size=1024) == md5
+    assert gerar_hash_arquivo(str(arquivo), '7') == 'P' + md5 + 'K7'
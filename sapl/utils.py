@@ -547,6 +547,15 @@ def intervalos_tem_intersecao(a_inicio, a_fim, b_inicio, b_fim):
     return maior_inicio <= menor_fim
 
 
+def campos_exceto(model, *excluidos):
+    """
+    Nomes dos campos gravados no UPDATE de uma instância de model, exceto
+    os excluídos, para uso em save(update_fields=...).
+    """
+    return [f.name for f in model._meta.concrete_fields
+            if not f.primary_key and f.name not in excluidos]
+
+
 class MateriaPesquisaOrderingFilter(django_filters.OrderingFilter):
 
     choices = (
@@ -649,15 +658,20 @@ class AnoNumeroOrderingFilter(django_filters.OrderingFilter):
         return super().filter(qs, _value)
 
 
-def gerar_hash_arquivo(arquivo, pk, block_size=2 ** 20):
+def hash_conteudo_arquivo(arquivo, block_size=2 ** 20):
     md5 = hashlib.md5()
-    arq = open(arquivo, 'rb')
-    while True:
-        data = arq.read(block_size)
-        if not data:
-            break
-        md5.update(data)
-    return 'P' + md5.hexdigest() + SEPARADOR_HASH_PROPOSICAO + pk
+    with open(arquivo, 'rb') as arq:
+        while True:
+            data = arq.read(block_size)
+            if not data:
+                break
+            md5.update(data)
+    return md5.hexdigest()
+
+
+def gerar_hash_arquivo(arquivo, pk, block_size=2 ** 20):
+    return 'P' + hash_conteudo_arquivo(arquivo, block_size) + \
+        SEPARADOR_HASH_PROPOSICAO + pk
 
 
 class ChoiceWithoutValidationField(forms.ChoiceField):
@@ -802,23 +816,57 @@ def qs_override_django_filter(self):
 
 
 def filiacao_data(parlamentar, data_inicio, data_fim=None):
+    filiacoes = getattr(parlamentar, '_filiacoes_data', {})
+    if not data_fim and data_inicio in filiacoes:
+        return filiacoes[data_inicio]
+
+    return filiacoes_data(
+        [parlamentar], data_inicio, data_fim).get(parlamentar.pk, '')
+
+
+def filiacoes_data(parlamentares, data_inicio, data_fim=None):
+    """
+    Versão em lote de filiacao_data, resolvida em uma única consulta.
+    :param parlamentares: Parlamentares (ou seus ids) a serem consultados.
+    :return: dict com as siglas de partido, separadas por ' | ',
+    indexado pelo id do parlamentar.
+    """
     from sapl.parlamentares.models import Filiacao
 
-    filiacoes_parlamentar = Filiacao.objects.filter(
-        parlamentar=parlamentar)
+    parlamentares_id = [getattr(p, 'pk', p) for p in parlamentares]
 
-    filiacoes = filiacoes_parlamentar.filter(Q(
-        data__lte=data_inicio,
-        data_desfiliacao__isnull=True) | Q(
+    periodo = Q(data__lte=data_inicio,
+                data_desfiliacao__isnull=True) | Q(
         data__lte=data_inicio,
-        data_desfiliacao__gte=data_inicio))
+        data_desfiliacao__gte=data_inicio)
 
     if data_fim:
-        filiacoes = filiacoes | filiacoes_parlamentar.filter(
-            data__gte=data_inicio,
-            data__lte=data_fim)
+        periodo |= Q(data__gte=data_inicio, data__lte=data_fim)
 
-    return ' | '.join([f.partido.sigla for f in filiacoes])
+    filiacoes = Filiacao.objects.filter(
+        periodo,
+        parlamentar_id__in=parlamentares_id).values_list(
+        'parlamentar_id', 'partido__sigla')
+
+    siglas = {}
+    for parlamentar_id, sigla in filiacoes:
+        siglas.setdefault(parlamentar_id, []).append(sigla)
+
+    return {k: ' | '.join(v) for k, v in siglas.items()}
+
+
+def anota_filiacoes_data(parlamentares, data_inicio):
+    """
+    Resolve em uma única consulta as filiações dos parlamentares na data e
+    guarda o resultado em cada instância, de onde filiacao_data (e o filtro
+    filiacao_data_filter) passam a lê-lo sem novas consultas.
+    """
+    siglas = filiacoes_data(parlamentares, data_inicio)
+    for p in parlamentares:
+        if not hasattr(p, '_filiacoes_data'):
+            p._filiacoes_data = {}
+        p._filiacoes_data[data_inicio] = siglas.get(p.pk, '')
+    return parlamentares
 
 
 def parlamentares_ativos(data_inicio, data_fim=None):
@@ -957,29 +1005,95 @@ def mail_service_configured(request=None):
     return settings.EMAIL_RUNNING
 
 
+def _grafo_anexacao(isMateriaLegislativa=True):
+    # modelo e colunas das arestas do grafo de anexação
+    if isMateriaLegislativa:
+        from sapl.materia.models import Anexada
+        return Anexada, 'materia_principal_id', 'materia_anexada_id'
+    from sapl.protocoloadm.models import Anexado
+    return Anexado, 'documento_principal_id', 'documento_anexado_id'
+
+
+# Fecho transitivo do grafo de anexação. UNION (e não UNION ALL) descarta
+# pares já visitados, o que encerra a recursão mesmo em grafos com ciclos.
+SQL_FECHO_ANEXACAO = """
+    WITH RECURSIVE grafo(principal, anexado) AS (
+        SELECT {principal}, {anexado} FROM {tabela} {filtro}
+      UNION
+        SELECT g.principal, a.{anexado}
+        FROM grafo g JOIN {tabela} a ON a.{principal} = g.anexado
+    )
+"""
+
+
+def anexados_em_lote(principais, isMateriaLegislativa=True):
+    """
+    Anexados transitivos de várias matérias (ou documentos administrativos)
+    com uma única consulta recursiva ao grafo de anexação. Retorna
+    {id do principal: set(ids dos anexados)}, sem o próprio principal
+    mesmo quando há ciclos.
+    """
+    from django.db import connection
+
+    modelo, principal, anexado = _grafo_anexacao(isMateriaLegislativa)
+
+    principais = [int(pk) for pk in principais]
+    resultado = {pk: set() for pk in principais}
+    if not principais:
+        return resultado
+
+    sql = SQL_FECHO_ANEXACAO.format(
+        tabela=modelo._meta.db_table,
+        principal=principal,
+        anexado=anexado,
+        filtro='WHERE {} = ANY(%s)'.format(principal)) + """
+        SELECT principal, anexado FROM grafo WHERE principal <> anexado
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [principais])
+        for pk_principal, pk_anexado in cursor.fetchall():
+            resultado[pk_principal].add(pk_anexado)
+    return resultado
+
+
+def anexacoes_ciclicas(isMateriaLegislativa=True):
+    """
+    Anexações (Anexada ou Anexado) que fecham um ciclo no grafo de
+    anexação, isto é, cujo principal é alcançável a partir do anexado.
+    Todas são encontradas com uma consulta recursiva sobre o grafo
+    inteiro; o queryset retornado já traz principal e anexado.
+    """
+    from django.db import connection
+
+    modelo, principal, anexado = _grafo_anexacao(isMateriaLegislativa)
+    tabela = modelo._meta.db_table
+
+    sql = SQL_FECHO_ANEXACAO.format(
+        tabela=tabela,
+        principal=principal,
+        anexado=anexado,
+        filtro='') + """
+        SELECT a.id FROM {tabela} a
+        WHERE a.{principal} = a.{anexado} OR EXISTS (
+            SELECT 1 FROM grafo g
+            WHERE g.principal = a.{anexado} AND g.anexado = a.{principal})
+    """.format(tabela=tabela, principal=principal, anexado=anexado)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        ids = [row[0] for row in cursor.fetchall()]
+
+    return modelo.objects.filter(id__in=ids).select_related(
+        principal[:-3], anexado[:-3]).order_by('data_anexacao', 'id')
+
+
 def lista_anexados(principal, isMateriaLegislativa=True):
-    anexados_total = []
     if isMateriaLegislativa: #MateriaLegislativa
-        from sapl.materia.models import Anexada
-        anexados_iterator = Anexada.objects.filter(materia_principal=principal)
+        from sapl.materia.models import MateriaLegislativa as modelo
     else: #DocAdm
-        from sapl.protocoloadm.models import Anexado
-        anexados_iterator = Anexado.objects.filter(documento_principal=principal)
-
-    anexadas_temp = list(anexados_iterator)
-
-    while anexadas_temp:
-        anx = anexadas_temp.pop()
-        if isMateriaLegislativa:
-            if anx.materia_anexada not in anexados_total:
-                anexados_total.append(anx.materia_anexada)
-                anexados_anexado = Anexada.objects.filter(materia_principal=anx.materia_anexada)
-                anexadas_temp.extend(anexados_anexado)
-        else:
-            if anx.documento_anexado not in anexados_total:
-                anexados_total.append(anx.documento_anexado)
-                anexados_anexado = Anexado.objects.filter(documento_principal=anx.documento_anexado)
-                anexadas_temp.extend(anexados_anexado)
-    if principal in anexados_total:
-        anexados_total.remove(principal)
-    return anexados_total
+        from sapl.protocoloadm.models import DocumentoAdministrativo as modelo
+
+    pk = getattr(principal, 'pk', principal)
+    anexados = anexados_em_lote([pk], isMateriaLegislativa)[pk]
+    return list(modelo.objects.filter(id__in=anexados))
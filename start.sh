@@ -79,6 +79,9 @@ if [ "${USE_SOLR-False}" == "True" ] || [ "${USE_SOLR-False}" == "true" ]; then
         echo "Connecting to solr..."
         python3 solr_api.py -u $SOLR_URL -c $SOLR_COLLECTION -s $NUM_SHARDS -rf $RF -ms $MAX_SHARDS_PER_NODE &
         # python3 manage.py rebuild_index --noinput &
+
+        echo "Iniciando processamento da fila de indexação..."
+        python3 manage.py processa_fila_indexacao --loop &
     else
         echo "Solr is offline, not possible to connect."
     fi
@@ -87,6 +90,9 @@ else
     echo "Suporte a SOLR não inicializado."
 fi
 
+echo "Iniciando processamento da fila de e-mails..."
+python3 manage.py processa_fila_email --loop &
+
 echo "Criando usuário admin..."
 
 user_created=$(python3 create_admin.py 2>&1)